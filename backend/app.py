@@ -1,16 +1,42 @@
 from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from flask_mail import Mail
 from config import Config
 from models import db, seed_default_categories
 from routes.auth import auth_bp
 from routes.expense import expense_bp
+from routes.dashboard import dashboard_bp
+from routes.analytics import analytics_bp
+from routes.jobs import jobs_bp
 import logging
-import threading
-import time
-from utils.cleanup import CleanupService
-from flask_migrate import Migrate
+import multiprocessing
+import os
+import sys
+from utils.mail_queue import MailDispatcher
+from utils.email_templates import get_email_renderer
+from utils.user_cache import get_user_cache
+from utils.token_revocation import get_revocation_list
+from utils.scheduler import Scheduler
+from utils.expiry import get_expiry_scheduler
+from utils.bootstrap import prepare_database
+from utils.sqlite_engine import configure_sqlite_engine
+from utils.group_commit import GroupCommitter
+from utils.event_bus import get_event_bus
+from utils.response_cache import get_response_cache, invalidate_responses
+from utils.jobs import JobQueue, JobWorker
+
+
+def _running_flask_cli():
+    """True under the flask command (flask db ...), the only place Flask-Migrate is needed"""
+    program = sys.argv[0] if sys.argv else ''
+    return os.path.basename(program) in ('flask', 'flask.exe') or program.endswith(os.path.join('flask', '__main__.py'))
+
+
+def _in_child_process():
+    """True in multiprocessing children (job and anomaly pools), which re-import the
+    main module, and with it this one, but must not run background services.
+    Spawn names the child before that import, parent_process() is only set after it."""
+    return multiprocessing.current_process().name != 'MainProcess' or multiprocessing.parent_process() is not None
 
 
 def create_app():
@@ -26,25 +52,43 @@ def create_app():
     # Initialize extensions
     db.init_app(app)
     CORS(app, origins=["http://localhost:5173"])
-    JWTManager(app)
-    Migrate(app, db)
-
-    # Initialize Flask-Mail
-    mail = Mail(app)
-    app.mail = mail
+    jwt = JWTManager(app)
+    
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return get_revocation_list().is_revoked(jwt_payload['jti'])
+    
+    # Flask-Migrate imports all of Alembic, so it is only set up for the flask CLI
+    if _running_flask_cli():
+        from flask_migrate import Migrate
+        Migrate(app, db)
     
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(expense_bp, url_prefix='/api')
+    app.register_blueprint(dashboard_bp, url_prefix='/api')
+    app.register_blueprint(analytics_bp, url_prefix='/api')
+    app.register_blueprint(jobs_bp, url_prefix='/api')
     
-    # Create database tables + seed defaults
+    # Create tables and seed defaults, skipped (one query) when the schema stamp is current
     with app.app_context():
-        db.create_all()
-        seed_default_categories()  # Use the function from models.py
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                configure_sqlite_engine(engine, app.config)
+        prepare_database(app)
     
     @app.route('/api/health')
     def health_check():
-        return jsonify({'status': 'Backend is running!'}), 200
+        return jsonify({
+            'status': 'Backend is running!',
+            'user_cache': get_user_cache().stats(),
+            'scheduler': app.scheduler.status(),
+            'expiry': get_expiry_scheduler().stats(),
+            'group_commit': app.group_committer.stats(),
+            'event_streams': get_event_bus().stats(),
+            'response_cache': get_response_cache().stats(),
+            'jobs': app.job_worker.stats()
+        }), 200
     
     # Manual seed endpoint for debugging (remove in production)
     @app.route('/api/seed-categories', methods=['POST'])
@@ -55,20 +99,69 @@ def create_app():
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
-    # Start cleanup background task
-    def cleanup_task():
-        while True:
-            try:
-                with app.app_context():
-                    CleanupService.run_all_cleanup_tasks()
-                time.sleep(1800)  # Run every 30 minutes
-            except Exception as e:
-                app.logger.error(f"Background cleanup error: {str(e)}")
-                time.sleep(300)  # Wait 5 minutes on error
+    # Periodic jobs, run by whichever process holds the scheduler leader lock.
+    # The heavy ones are queued for the background job workers, with retries and leases
+    app.scheduler = Scheduler(app)
+    app.scheduler.add_job(
+        'cleanup',
+        lambda: JobQueue.submit('cleanup'),
+        interval_seconds=app.config['CLEANUP_INTERVAL_MINUTES'] * 60,
+        jitter_seconds=app.config['SCHEDULER_JITTER_SECONDS']
+    )
+    app.scheduler.add_job(
+        'reconcile_user_stats',
+        lambda: JobQueue.submit('reconcile_user_stats', {'batch_size': app.config['USER_STATS_RECONCILE_BATCH_SIZE']}),
+        interval_seconds=app.config['USER_STATS_RECONCILE_HOURS'] * 3600,
+        jitter_seconds=app.config['SCHEDULER_JITTER_SECONDS']
+    )
+    app.scheduler.add_job(
+        'verify_orphans',
+        lambda: JobQueue.submit('verify_orphans'),
+        interval_seconds=app.config['ORPHAN_VERIFY_HOURS'] * 3600,
+        jitter_seconds=app.config['SCHEDULER_JITTER_SECONDS']
+    )
+    app.scheduler.add_job(
+        'detect_anomalies',
+        lambda: JobQueue.submit('detect_anomalies'),
+        interval_seconds=app.config['ANOMALY_DETECTION_HOURS'] * 3600,
+        jitter_seconds=app.config['SCHEDULER_JITTER_SECONDS']
+    )
+    app.scheduler.add_job(
+        'expire_rows',
+        get_expiry_scheduler().run_due,
+        interval_seconds=app.config['EXPIRY_TICK_SECONDS'],
+        record_history=False
+    )
+    # Background services run in server and script processes, never in their pool children
+    background = not _in_child_process()
+    if background and app.config['SCHEDULER_ENABLED']:
+        app.scheduler.start()
+    
+    # Compile email templates up front so no request pays for it
+    get_email_renderer()
+    
+    # Expense insert batching, the writer thread starts with the first insert
+    app.group_committer = GroupCommitter(
+        app,
+        max_batch=app.config['GROUP_COMMIT_MAX_BATCH'],
+        max_wait_ms=app.config['GROUP_COMMIT_MAX_WAIT_MS'],
+        timeout=app.config['GROUP_COMMIT_TIMEOUT_SECONDS']
+    )
+    
+    # Pub/sub for live expense events, the database broadcaster starts with the first stream or event
+    event_bus = get_event_bus(app)
+    # Expense changes relayed from other workers make this worker's cached responses stale
+    event_bus.add_remote_listener(lambda user_id, event: invalidate_responses(user_id, 'expenses', 'stats'))
+    
+    # Background job workers, the process pool starts with the first CPU-bound job
+    app.job_worker = JobWorker(app)
+    if background and app.config['JOBS_WORKER_ENABLED']:
+        app.job_worker.start()
     
-    # Start cleanup thread
-    cleanup_thread = threading.Thread(target=cleanup_task, daemon=True)
-    cleanup_thread.start()
+    # Start outbound mail workers
+    app.mail_dispatcher = MailDispatcher(app)
+    if background and app.config['MAIL_QUEUE_ENABLED']:
+        app.mail_dispatcher.start()
     
     return app
 
@@ -7,22 +7,20 @@ Use only in development/testing environment.
 
 import sys
 import os
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.exc import SQLAlchemyError
-import urllib.parse
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+from config import Config
 
 def get_database_config():
-    """Get database configuration from environment variables"""
-    mysql_host = os.environ.get('MYSQL_HOST', 'localhost')
-    mysql_user = os.environ.get('MYSQL_USER', 'root')
-    mysql_password = urllib.parse.quote_plus(os.environ.get('MYSQL_PASSWORD', 'Sahilkumar1272@#'))
-    mysql_db = os.environ.get('MYSQL_DB', 'expense_tracker')
-    
-    return f"mysql+pymysql://{mysql_user}:{mysql_password}@{mysql_host}/{mysql_db}"
+    """Database URI the app uses (MySQL, or SQLite with DB_ENGINE=sqlite / DATABASE_URL)"""
+    return Config.SQLALCHEMY_DATABASE_URI
+
+def set_foreign_key_checks(connection, enabled):
+    """Toggle foreign key enforcement with the engine's own statement"""
+    if connection.dialect.name == 'mysql':
+        connection.execute(text(f"SET FOREIGN_KEY_CHECKS = {1 if enabled else 0}"))
+    elif connection.dialect.name == 'sqlite':
+        connection.execute(text(f"PRAGMA foreign_keys = {'ON' if enabled else 'OFF'}"))
 
 def confirm_deletion():
     """Ask for user confirmation before proceeding"""
@@ -52,8 +50,8 @@ def clear_all_tables():
         
         with engine.connect() as connection:
             # Get all table names
-            result = connection.execute(text("SHOW TABLES"))
-            tables = [row[0] for row in result.fetchall()]
+            tables = inspect(connection).get_table_names()
+            quote = connection.dialect.identifier_preparer.quote
             
             if not tables:
                 print("✅ No tables found in database.")
@@ -63,20 +61,20 @@ def clear_all_tables():
             
             # Disable foreign key checks to avoid constraint issues
             print("\n🔓 Disabling foreign key checks...")
-            connection.execute(text("SET FOREIGN_KEY_CHECKS = 0"))
+            set_foreign_key_checks(connection, False)
             
             # Drop each table
             print("\n🗑️  Dropping tables...")
             for table in tables:
                 try:
-                    connection.execute(text(f"DROP TABLE IF EXISTS `{table}`"))
+                    connection.execute(text(f"DROP TABLE IF EXISTS {quote(table)}"))
                     print(f"   ✅ Dropped table: {table}")
                 except SQLAlchemyError as e:
                     print(f"   ❌ Error dropping table {table}: {str(e)}")
             
             # Re-enable foreign key checks
             print("\n🔒 Re-enabling foreign key checks...")
-            connection.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
+            set_foreign_key_checks(connection, True)
             
             # Commit the transaction
             connection.commit()
@@ -105,19 +103,21 @@ def clear_specific_tables(table_list):
         print(f"\n🔄 Clearing specific tables: {', '.join(table_list)}")
         
         with engine.connect() as connection:
+            quote = connection.dialect.identifier_preparer.quote
+            
             # Disable foreign key checks
-            connection.execute(text("SET FOREIGN_KEY_CHECKS = 0"))
+            set_foreign_key_checks(connection, False)
             
             for table in table_list:
                 try:
                     # Just clear data, don't drop table
-                    connection.execute(text(f"DELETE FROM `{table}`"))
+                    connection.execute(text(f"DELETE FROM {quote(table)}"))
                     print(f"   ✅ Cleared data from: {table}")
                 except SQLAlchemyError as e:
                     print(f"   ❌ Error clearing table {table}: {str(e)}")
             
             # Re-enable foreign key checks
-            connection.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
+            set_foreign_key_checks(connection, True)
             connection.commit()
             
             print("\n✅ Selected tables have been cleared!")
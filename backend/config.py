@@ -1,4 +1,5 @@
 import os
+import tempfile
 import urllib.parse
 from datetime import timedelta
 from dotenv import load_dotenv
@@ -7,46 +8,202 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class Config:
-    # Database
+    # Database: MySQL by default, DB_ENGINE=sqlite for single-node/edge deployments and
+    # quick test runs, DATABASE_URL (any SQLAlchemy URI) overrides both
+    DB_ENGINE = os.environ.get('DB_ENGINE', 'mysql').lower()
+    DATABASE_URL = os.environ.get('DATABASE_URL')
     MYSQL_HOST = os.environ.get('MYSQL_HOST', 'localhost')
     MYSQL_USER = os.environ.get('MYSQL_USER', 'root')
     MYSQL_PASSWORD = urllib.parse.quote_plus(os.environ.get('MYSQL_PASSWORD', 'fallback-password'))
     MYSQL_DB = os.environ.get('MYSQL_DB', 'expense_tracker')
     
-    SQLALCHEMY_DATABASE_URI = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
+    SQLITE_PATH = os.environ.get(
+        'SQLITE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'expense_tracker.db')
+    )
+    
+    if DATABASE_URL:
+        SQLALCHEMY_DATABASE_URI = DATABASE_URL
+    elif DB_ENGINE == 'sqlite':
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{SQLITE_PATH}"
+    else:
+        SQLALCHEMY_DATABASE_URI = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ENGINE_OPTIONS = {
         'pool_pre_ping': True,
         'pool_recycle': 300,
     }
     
+    # Sharding: expenses, categories and user_stats of a user can live on one of the extra databases
+    # in SHARD_DATABASE_URLS (comma separated, binds shard_1, shard_2, ...). The main database is the
+    # 'home' shard with users, the shard directory and all global tables, see utils/sharding.py
+    SHARD_DATABASE_URLS = [url.strip() for url in os.environ.get('SHARD_DATABASE_URLS', '').split(',') if url.strip()]
+    SQLALCHEMY_BINDS = {f"shard_{index}": url for index, url in enumerate(SHARD_DATABASE_URLS, start=1)}
+    SHARD_PLACEMENT = os.environ.get('SHARD_PLACEMENT', 'hash')  # new users: 'hash' (user id modulo shards) or 'home'
+    SHARD_MAP_CACHE_SECONDS = 30  # how long workers may route by a stale directory entry
+    SHARD_MOVE_BATCH_SIZE = 1000  # expenses copied per INSERT when moving a user
+    
+    # SQLite engine mode, applied on every new connection
+    SQLITE_JOURNAL_MODE = 'WAL'  # readers never block the writer
+    SQLITE_SYNCHRONOUS = 'NORMAL'  # with WAL, a power loss can drop the last commits but never corrupts
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))  # how long a writer waits for the lock
+    SQLITE_BEGIN_MODE = 'IMMEDIATE'  # write transactions take the lock when they start, reads are DEFERRED, see utils/sqlite_engine.py
+    
     # JWT
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'fallback-secret-key')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)  # Access token lasts 24 hours
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)  # Refresh token lasts 30 days
     
+    # Token revocation (logout)
+    TOKEN_REVOCATION_CAPACITY = 100000  # initial Bloom filter size, grows on rebuild
+    TOKEN_REVOCATION_ERROR_RATE = 0.001
+    TOKEN_REVOCATION_REFRESH_SECONDS = 5  # how quickly other workers see a revocation
+    TOKEN_REVOCATION_REBUILD_SECONDS = 3600
+    TOKEN_REVOCATION_SETTLE_SECONDS = 60  # revocations this recent are read again on every refresh, ids can commit out of order
+    
     # Email
-    MAIL_SERVER = 'smtp.gmail.com'
-    MAIL_PORT = 587
-    MAIL_USE_TLS = True
+    MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+    MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() == 'true'
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_USERNAME')
     
+    # Outbound mail queue
+    MAIL_QUEUE_ENABLED = os.environ.get('MAIL_QUEUE_ENABLED', 'true').lower() == 'true'
+    MAIL_QUEUE_WORKERS = int(os.environ.get('MAIL_QUEUE_WORKERS', 2))  # one SMTP connection per worker
+    MAIL_QUEUE_BATCH_SIZE = 20
+    MAIL_QUEUE_MAX_ATTEMPTS = 6
+    MAIL_QUEUE_RETRY_BASE_SECONDS = 30  # doubled on each failed attempt
+    MAIL_QUEUE_RETRY_MAX_SECONDS = 3600
+    MAIL_QUEUE_POLL_SECONDS = 5
+    MAIL_QUEUE_LEASE_SECONDS = 300  # claimed messages are retried if a worker dies mid-send
+    MAIL_SMTP_TIMEOUT = 30
+    MAIL_SMTP_IDLE_SECONDS = 60  # close pooled connections unused for this long
+    MAIL_OUTBOX_RETENTION_DAYS = 7
+    
     # Frontend
     FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:5173')
     
     # Security
     SECRET_KEY = os.environ.get('SECRET_KEY', 'fallback-secret-key')
     
+    # Password hashing
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))  # bcrypt work factor, existing hashes are upgraded on login
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32))  # running + queued before rejecting
+    PASSWORD_HASH_TIMEOUT = 10  # seconds
+    
+    # Per-process cache of JWT identity -> user snapshot
+    USER_CACHE_MAX_SIZE = 10000
+    USER_CACHE_TTL_SECONDS = 300
+    
+    # Disposable email blocklist, the compiled index defaults to <file>.idx
+    DISPOSABLE_DOMAINS_FILE = os.environ.get(
+        'DISPOSABLE_DOMAINS_FILE',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'disposable_domains.txt')
+    )
+    DISPOSABLE_DOMAINS_INDEX_FILE = os.environ.get('DISPOSABLE_DOMAINS_INDEX_FILE')
+    DISPOSABLE_DOMAINS_RELOAD_SECONDS = 60  # how often workers check the file for changes
+    
     # Rate limiting
     RATE_LIMIT_REGISTRATION = 5  # attempts per hour per IP
     RATE_LIMIT_LOGIN = 10  # attempts per hour per IP
     RATE_LIMIT_OTP = 3  # attempts per hour per IP
     
+    # Expiry of OTPs, pending users and reset tokens close to their deadline
+    EXPIRY_TICK_SECONDS = 5
+    EXPIRY_LOAD_WINDOW_SECONDS = 300  # must stay below the shortest lifetime (10 minute OTPs)
+    EXPIRY_BATCH_SIZE = 100
+    EXPIRY_MAX_PER_TICK = 1000
+    
+    # Delta sync (GET /api/expenses/changes)
+    SYNC_PAGE_SIZE = 500  # most changed rows (and deletions) per response
+    SYNC_OVERLAP_SECONDS = 5  # changes this recent are sent again next time, covers late-committing transactions
+    EXPENSE_TOMBSTONE_RETENTION_DAYS = 30  # older sync tokens must reload everything
+    
+    # Serialized GET responses per user and query string, dropped by the write handlers
+    RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+    RESPONSE_CACHE_SECONDS = int(os.environ.get('RESPONSE_CACHE_SECONDS', 30))  # bounds staleness of other workers' writes
+    RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    RESPONSE_CACHE_MAX_ENTRY_BYTES = 1024 * 1024  # larger responses are not cached
+    DASHBOARD_CACHE_SECONDS = int(os.environ.get('DASHBOARD_CACHE_SECONDS', 10))
+    
+    # Live expense events (GET /api/expenses/stream). Every open stream holds a
+    # worker thread, serve with threaded workers (e.g. gunicorn -k gthread)
+    SSE_BROADCASTER = os.environ.get('SSE_BROADCASTER', 'local')  # 'local' (one process) or 'database' (several workers)
+    SSE_MAX_CONNECTIONS = int(os.environ.get('SSE_MAX_CONNECTIONS', 500))  # per process
+    SSE_MAX_CONNECTIONS_PER_USER = 5
+    SSE_HEARTBEAT_SECONDS = 15  # comment line sent on idle streams so proxies keep them open and dead clients are noticed
+    SSE_RETRY_MS = 3000  # client reconnect delay
+    SSE_QUEUE_SIZE = 100  # unsent events per stream before it is told to reload
+    SSE_BROADCAST_POLL_SECONDS = 1.0
+    SSE_EVENT_SETTLE_SECONDS = 5  # events this recent are read again on every poll, ids can commit out of order
+    SSE_EVENT_RETENTION_MINUTES = 10
+    
+    # Spending quantiles (GET /api/analytics/spending-quantiles)
+    SKETCH_COMPRESSION = 200  # t-digest compression, about 110-130 centroids (about 1 KB) per category and month
+    ANALYTICS_DEFAULT_MONTHS = 12
+    ANALYTICS_MAX_MONTHS = 60
+
+    # Duplicate and outlier detection job (GET /api/analytics/flags)
+    ANOMALY_DETECTION_HOURS = 24
+    ANOMALY_DETECTION_WORKERS = int(os.environ.get('ANOMALY_DETECTION_WORKERS', os.cpu_count() or 1))  # 1 runs in the calling thread
+    ANOMALY_DETECTION_BATCH_USERS = 500  # users loaded and analyzed per pool task
+    DUPLICATE_WINDOW_HOURS = 72  # same amount this close together may be a double entry
+    DUPLICATE_MIN_SIMILARITY = 0.5  # share of description words in common
+    DUPLICATE_MAX_LAG = 4  # same-amount rows looked back at per row
+    OUTLIER_Z_THRESHOLD = 3.5  # modified z-score of the log amount within the user's category
+    OUTLIER_MIN_SAMPLES = 10  # smaller categories are not judged
+    ANALYTICS_MAX_FLAGS = 200
+
+    # Idempotency-Key on expense writes
+    IDEMPOTENCY_KEY_TTL_HOURS = 24  # how long a key keeps replaying its first response
+    IDEMPOTENCY_LOCK_SECONDS = 60  # an unfinished first request older than this is assumed dead
+    IDEMPOTENCY_CACHE_SIZE = 10000
+    IDEMPOTENCY_CACHE_TTL_SECONDS = 300
+    
+    # Group commit: concurrent add_expense calls share one INSERT and one commit
+    GROUP_COMMIT_ENABLED = os.environ.get('GROUP_COMMIT_ENABLED', 'false').lower() == 'true'
+    GROUP_COMMIT_MAX_BATCH = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 100))
+    GROUP_COMMIT_MAX_WAIT_MS = float(os.environ.get('GROUP_COMMIT_MAX_WAIT_MS', 2))  # how long a batch waits for more rows
+    GROUP_COMMIT_TIMEOUT_SECONDS = 10
+    
     # Cleanup settings
     PENDING_USER_EXPIRY_HOURS = 24
     CLEANUP_INTERVAL_MINUTES = 30
+    CLEANUP_BATCH_SIZE = int(os.environ.get('CLEANUP_BATCH_SIZE', 1000))  # rows deleted per transaction
+    CLEANUP_BATCH_PAUSE_SECONDS = float(os.environ.get('CLEANUP_BATCH_PAUSE_SECONDS', 0.05))  # yield to foreground writes between batches
+    DELETED_USER_RETENTION_DAYS = 30  # processed tombstones are kept this long for auditing
+    ORPHAN_VERIFY_HOURS = 168  # full anti-join pass for orphaned rows, weekly
+    USER_STATS_RECONCILE_HOURS = 24  # full recount of the per-user stats table
+    USER_STATS_RECONCILE_BATCH_SIZE = 500
+    
+    # Background scheduler, only the process holding the leader lock runs jobs
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true'
+    SCHEDULER_LOCK = os.environ.get('SCHEDULER_LOCK', 'auto')  # 'mysql' (GET_LOCK), 'file' (single host) or 'auto'
+    SCHEDULER_LOCK_NAME = 'expense_tracker_scheduler'
+    SCHEDULER_LOCK_FILE = os.environ.get(
+        'SCHEDULER_LOCK_FILE', os.path.join(tempfile.gettempdir(), 'expense-tracker-scheduler.lock')
+    )
+    SCHEDULER_LEADER_RETRY_SECONDS = 15  # how quickly a standby takes over from a dead leader
+    SCHEDULER_JITTER_SECONDS = 60
+    SCHEDULER_HISTORY_DAYS = 14
+
+    # Background jobs (GET /api/jobs/<id>), the scheduler queues its heavy jobs here too
+    JOBS_WORKER_ENABLED = os.environ.get('JOBS_WORKER_ENABLED', 'true').lower() == 'true'
+    JOBS_THREAD_WORKERS = int(os.environ.get('JOBS_THREAD_WORKERS', 2))  # I/O-bound job types
+    JOBS_PROCESS_WORKERS = int(os.environ.get('JOBS_PROCESS_WORKERS', 1))  # CPU-bound job types, pool started on first use
+    JOBS_POLL_SECONDS = 2
+    JOBS_LEASE_SECONDS = 60  # renewed while the worker lives, jobs of a dead worker run again once it lapses
+    JOBS_MAX_ATTEMPTS = 3
+    JOBS_RETRY_BASE_SECONDS = 30  # doubled on each failed attempt
+    JOBS_RETRY_MAX_SECONDS = 3600
+    JOBS_PROGRESS_INTERVAL_SECONDS = 1.0  # progress is written at most this often
+    JOBS_RETENTION_DAYS = 7  # finished jobs and their export files
+    JOBS_EXPORT_DIR = os.environ.get('JOBS_EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'expense-tracker-exports'))
+    JOBS_EXPORT_BATCH_SIZE = 5000
     
     # Google OAuth
-    GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID')
\ No newline at end of file
+    GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID')
+    GOOGLE_CERTS_URL = os.environ.get('GOOGLE_CERTS_URL', 'https://www.googleapis.com/oauth2/v1/certs')
\ No newline at end of file
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Synthetic Data Generator for Large-Scale Testing
+Creates users and millions of expenses with realistic distributions,
+loading them in batches with multi-row INSERTs (MySQL), LOAD DATA LOCAL
+INFILE (MySQL) or executemany (SQLite).
+Use only in development/testing environment.
+
+Example:
+    python generate_data.py --users 5000 --expenses 2000000 --seed 42
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import bcrypt
+import numpy as np
+from sqlalchemy import create_engine, text
+
+from config import Config
+from models import db, default_expense_categories, default_income_categories
+
+# Plain-text password shared by every generated user, so they can log in
+DEFAULT_PASSWORD = 'Password123!'
+
+PAYMENT_MODES = ['cash', 'debit_card', 'credit_card', 'upi', 'net_banking']
+PAYMENT_MODE_WEIGHTS = [25, 20, 20, 30, 5]
+
+# (relative frequency, median amount, spread) of each default category.
+# Amounts are drawn from a log-normal distribution around the median.
+EXPENSE_PROFILE = {
+    'Food': (30, 250, 0.6),
+    'Groceries': (18, 900, 0.5),
+    'Transportation': (14, 150, 0.7),
+    'Utilities': (4, 1500, 0.4),
+    'Housing': (2, 12000, 0.3),
+    'Healthcare': (3, 800, 0.9),
+    'Insurance': (1, 2500, 0.4),
+    'Debt Repayment': (1, 5000, 0.5),
+    'Savings': (2, 3000, 0.6),
+    'Entertainment': (8, 500, 0.8),
+    'Personal Care': (5, 400, 0.6),
+    'Education': (2, 2000, 0.9),
+    'Gifts & Donations': (2, 700, 0.9),
+    'Subscriptions': (5, 300, 0.4),
+    'Miscellaneous': (3, 350, 1.0),
+}
+
+INCOME_PROFILE = {
+    'Salary': (50, 60000, 0.3),
+    'Freelance': (20, 15000, 0.7),
+    'Investments': (12, 5000, 1.0),
+    'Rental Income': (8, 18000, 0.3),
+    'Business': (5, 25000, 0.8),
+    'Gifts': (3, 3000, 0.9),
+    'Other': (2, 2000, 1.0),
+}
+
+# Share of generated rows that are income rather than expense
+INCOME_RATIO = 0.12
+
+DESCRIPTIONS = {
+    'Food': ['Lunch', 'Dinner out', 'Coffee', 'Snacks', 'Pizza night'],
+    'Groceries': ['Weekly groceries', 'Supermarket', 'Vegetables', 'Milk and bread'],
+    'Transportation': ['Metro card', 'Cab ride', 'Fuel', 'Bus ticket', 'Parking'],
+    'Utilities': ['Electricity bill', 'Water bill', 'Internet', 'Mobile recharge'],
+    'Housing': ['Rent', 'Maintenance', 'Home repairs'],
+    'Salary': ['Monthly salary', 'Salary credit'],
+    'Freelance': ['Client payment', 'Project milestone'],
+}
+
+EXPENSE_COLUMNS = (
+    'user_id', 'type', 'description', 'amount', 'category_id',
+    'payment_mode', 'date', 'created_at', 'updated_at'
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate synthetic users and expenses for load testing')
+    parser.add_argument('--users', type=int, default=1000, help='number of users to create')
+    parser.add_argument('--expenses', type=int, default=1000000, help='number of expense rows to create')
+    parser.add_argument('--days', type=int, default=730, help='spread transactions over this many past days')
+    parser.add_argument('--batch-size', type=int, default=20000, help='rows generated and inserted per batch')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='random seed (same seed and --end-date into a fresh database -> same data)')
+    parser.add_argument('--end-date', help='latest transaction date as YYYY-MM-DD (defaults to now)')
+    parser.add_argument('--tag', help='distinguishes generated emails when loading the same seed twice into one database')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='processes generating batches in parallel with the loader')
+    parser.add_argument('--database-uri', default=os.environ.get('DATABASE_URL', Config.SQLALCHEMY_DATABASE_URI),
+                        help='SQLAlchemy database URI (defaults to the app configuration)')
+    parser.add_argument('--method', choices=['insert', 'infile'], default='insert',
+                        help="'insert' uses multi-row INSERT/executemany, 'infile' uses LOAD DATA LOCAL INFILE (MySQL only)")
+    parser.add_argument('--email-domain', default='loadtest.example.com', help='domain for generated email addresses')
+    return parser.parse_args(argv)
+
+
+def ensure_schema(engine):
+    """Create missing tables and default categories, return {(type, name): id}"""
+    db.metadata.create_all(engine)
+
+    with engine.begin() as connection:
+        rows = connection.execute(text(
+            "SELECT id, type, name FROM categories WHERE is_default = :is_default AND user_id IS NULL"
+        ), {'is_default': True}).fetchall()
+        existing = {(row.type, row.name): row.id for row in rows}
+
+        missing = [
+            {'name': name, 'type': category_type, 'is_default': True}
+            for category_type, names in (('expense', default_expense_categories),
+                                         ('income', default_income_categories))
+            for name in names
+            if (category_type, name) not in existing
+        ]
+        if missing:
+            connection.execute(text(
+                "INSERT INTO categories (name, type, is_default, user_id) VALUES (:name, :type, :is_default, NULL)"
+            ), missing)
+            rows = connection.execute(text(
+                "SELECT id, type, name FROM categories WHERE is_default = :is_default AND user_id IS NULL"
+            ), {'is_default': True}).fetchall()
+            existing = {(row.type, row.name): row.id for row in rows}
+
+    return existing
+
+
+def insert_users(engine, count, rng, email_domain, run_tag):
+    """Insert users in one executemany and return their ids"""
+    password_hash = bcrypt.hashpw(DEFAULT_PASSWORD.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    now = datetime.utcnow().replace(microsecond=0)
+    first_names = ['Aarav', 'Diya', 'Kabir', 'Meera', 'Rohan', 'Anaya', 'Vikram', 'Isha', 'Arjun', 'Sara']
+    last_names = ['Sharma', 'Patel', 'Singh', 'Khan', 'Iyer', 'Das', 'Reddy', 'Gupta', 'Nair', 'Joshi']
+
+    users = [
+        {
+            'name': f"{rng.choice(first_names)} {rng.choice(last_names)}",
+            'email': f"user-{run_tag}-{index}@{email_domain}",
+            'password_hash': password_hash,
+            'is_verified': True,
+            'created_at': now,
+            'updated_at': now,
+        }
+        for index in range(count)
+    ]
+
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO users (name, email, password_hash, is_verified, created_at, updated_at) "
+            "VALUES (:name, :email, :password_hash, :is_verified, :created_at, :updated_at)"
+        ), users)
+        rows = connection.execute(text(
+            "SELECT id FROM users WHERE email LIKE :pattern ORDER BY id"
+        ), {'pattern': f"user-{run_tag}-%@{email_domain}"}).fetchall()
+
+    return [row.id for row in rows]
+
+
+class ExpenseBatchGenerator:
+    """Builds expense rows a whole batch at a time.
+
+    Every column is drawn for the full batch as a numpy array (weighted
+    choices, log-normal amounts, uniform timestamps), so there is no
+    per-row Python work left besides zipping the columns into tuples for
+    the driver. Rows come out ordered by (user_id, date), which keeps the
+    B-tree pages of the expenses indexes in cache while they load. Each
+    batch gets its own RNG derived from (seed, batch index), so batches can
+    be generated in parallel and the output still only depends on the seed.
+    """
+
+    def __init__(self, seed, user_ids, category_ids, days, end):
+        self.seed = seed
+        self.span_seconds = days * 86400
+        start = end - timedelta(seconds=self.span_seconds)
+
+        # Timestamps are assembled from precomputed day and time-of-day
+        # strings instead of building a datetime per row
+        self.day_strings = np.array([
+            (start + timedelta(days=day)).strftime('%Y-%m-%d ') for day in range(days + 1)
+        ], dtype=object)
+        self.time_strings = np.array([
+            f"{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}" for second in range(86400)
+        ], dtype=object)
+        self.start_offset = start.hour * 3600 + start.minute * 60 + start.second
+
+        # Heavy-tailed activity: a few users own most of the transactions
+        rng = np.random.default_rng(seed)
+        self.user_ids = np.array(user_ids, dtype=np.int64)
+        self.user_weights = _probabilities(rng.pareto(1.2, len(user_ids)) + 1)
+        self.mode_weights = _probabilities(PAYMENT_MODE_WEIGHTS)
+        self.modes = np.array(PAYMENT_MODES, dtype=object)
+
+        self.profiles = {}
+        for expense_type, profile in (('expense', EXPENSE_PROFILE), ('income', INCOME_PROFILE)):
+            names = [name for name in profile if (expense_type, name) in category_ids]
+            self.profiles[expense_type] = {
+                'ids': np.array([category_ids[(expense_type, name)] for name in names], dtype=np.int64),
+                'weights': _probabilities([profile[name][0] for name in names]) if names else None,
+                'medians': np.array([profile[name][1] for name in names], dtype=float),
+                'sigmas': np.array([profile[name][2] for name in names], dtype=float),
+                'descriptions': [np.array(DESCRIPTIONS.get(name, [name]), dtype=object) for name in names],
+            }
+
+    def batch(self, index, size):
+        rng = np.random.default_rng([self.seed, index])
+        income_count = round(size * INCOME_RATIO)
+        expense_count = size - income_count
+
+        users, types, categories, amounts, descriptions = [], [], [], [], []
+        for expense_type, count in (('expense', expense_count), ('income', income_count)):
+            profile = self.profiles[expense_type]
+            if not len(profile['ids']) or not count:
+                continue
+            slots = rng.choice(len(profile['ids']), size=count, p=profile['weights'])
+            amount = profile['medians'][slots] * np.exp(rng.standard_normal(count) * profile['sigmas'][slots])
+            # Descriptions cycle through the category's options by position in the batch
+            description = np.empty(count, dtype=object)
+            positions = np.arange(count)
+            for slot, options in enumerate(profile['descriptions']):
+                chosen = slots == slot
+                description[chosen] = options[positions[chosen] % len(options)]
+            users.append(rng.choice(self.user_ids, size=count, p=self.user_weights))
+            types.append(np.full(count, expense_type, dtype=object))
+            categories.append(profile['ids'][slots])
+            amounts.append(np.round(amount, 2))
+            descriptions.append(description)
+        if not users:
+            return []
+
+        users = np.concatenate(users)
+        count = len(users)
+        offsets = rng.integers(0, self.span_seconds, size=count) + self.start_offset
+        order = np.lexsort((offsets, users))
+        offsets = offsets[order]
+        stamps = (self.day_strings[offsets // 86400] + self.time_strings[offsets % 86400]).tolist()
+        modes = rng.choice(self.modes, size=count, p=self.mode_weights)[order]
+
+        return list(zip(
+            users[order].tolist(), np.concatenate(types)[order].tolist(), np.concatenate(descriptions)[order].tolist(),
+            np.concatenate(amounts)[order].tolist(), np.concatenate(categories)[order].tolist(),
+            modes.tolist(), stamps, stamps, stamps
+        ))
+
+
+# Per-process generator used by the worker pool
+_worker_generator = None
+
+
+def _init_worker(seed, user_ids, category_ids, days, end):
+    global _worker_generator
+    _worker_generator = ExpenseBatchGenerator(seed, user_ids, category_ids, days, end)
+
+
+def _generate_batch(task):
+    index, size = task
+    started = time.perf_counter()
+    rows = _worker_generator.batch(index, size)
+    return rows, time.perf_counter() - started
+
+
+def _probabilities(weights):
+    weights = np.asarray(weights, dtype=float)
+    return weights / weights.sum()
+
+
+def load_with_executemany(raw_connection, rows, dialect):
+    """Multi-row INSERT: PyMySQL rewrites executemany into batched VALUES lists,
+    sqlite3 runs the prepared statement in a tight C loop."""
+    placeholder = '?' if dialect == 'sqlite' else '%s'
+    statement = (
+        f"INSERT INTO expenses ({', '.join(EXPENSE_COLUMNS)}) "
+        f"VALUES ({', '.join([placeholder] * len(EXPENSE_COLUMNS))})"
+    )
+    cursor = raw_connection.cursor()
+    try:
+        cursor.executemany(statement, rows)
+    finally:
+        cursor.close()
+    raw_connection.commit()
+
+
+def load_with_infile(raw_connection, rows):
+    """Stream the batch through a temporary CSV and LOAD DATA LOCAL INFILE"""
+    handle = tempfile.NamedTemporaryFile('w', newline='', suffix='.csv', delete=False)
+    try:
+        with handle:
+            csv.writer(handle).writerows(rows)
+        cursor = raw_connection.cursor()
+        try:
+            cursor.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE expenses "
+                f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\r\\n' "
+                f"({', '.join(EXPENSE_COLUMNS)})",
+                (handle.name,)
+            )
+        finally:
+            cursor.close()
+        raw_connection.commit()
+    finally:
+        os.unlink(handle.name)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+
+    connect_args = {}
+    if args.method == 'infile':
+        connect_args['local_infile'] = True
+    engine = create_engine(args.database_uri, connect_args=connect_args)
+    dialect = engine.dialect.name
+
+    if args.method == 'infile' and dialect != 'mysql':
+        print("❌ LOAD DATA LOCAL INFILE is only available on MySQL, use --method insert")
+        return 1
+
+    print(f"🔄 Preparing schema on {dialect}...")
+    category_ids = ensure_schema(engine)
+
+    started = time.perf_counter()
+    # Emails depend on the seed only, so the same seed gives the same users
+    run_tag = f"s{args.seed}t{args.tag}" if args.tag else f"s{args.seed}"
+    with engine.connect() as connection:
+        taken = connection.execute(text("SELECT COUNT(*) FROM users WHERE email LIKE :pattern"), {
+            'pattern': f"user-{run_tag}-%@{args.email_domain}"
+        }).scalar()
+    if taken:
+        print(f"❌ Users of seed {args.seed} already exist in this database, pass --tag to load another copy")
+        return 1
+    user_ids = insert_users(engine, args.users, rng, args.email_domain, run_tag)
+    user_seconds = time.perf_counter() - started
+    print(f"👤 Created {len(user_ids)} users in {user_seconds:.2f}s (password: {DEFAULT_PASSWORD})")
+
+    if not user_ids:
+        print("❌ No users created, nothing to do.")
+        return 1
+
+    end = datetime.strptime(args.end_date, '%Y-%m-%d') if args.end_date else datetime.utcnow().replace(microsecond=0)
+    tasks = [
+        (index, min(args.batch_size, args.expenses - offset))
+        for index, offset in enumerate(range(0, args.expenses, args.batch_size))
+    ]
+    workers = max(1, args.workers)
+    print(f"🔄 Generating {args.expenses:,} expenses with {workers} worker(s)...")
+
+    raw_connection = engine.raw_connection()
+    if dialect == 'sqlite':
+        cursor = raw_connection.cursor()
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        # Room for the index pages the batches keep touching
+        cursor.execute("PRAGMA cache_size = -262144")
+        cursor.close()
+
+    generate_seconds = 0.0
+    load_seconds = 0.0
+    inserted = 0
+    started = time.perf_counter()
+    pool = multiprocessing.Pool(
+        workers, initializer=_init_worker,
+        initargs=(args.seed, user_ids, category_ids, args.days, end)
+    )
+    try:
+        # Workers generate upcoming batches while this process loads the current one
+        for rows, seconds in pool.imap(_generate_batch, tasks):
+            generate_seconds += seconds
+
+            tick = time.perf_counter()
+            if args.method == 'infile':
+                load_with_infile(raw_connection, rows)
+            else:
+                load_with_executemany(raw_connection, rows, dialect)
+            load_seconds += time.perf_counter() - tick
+
+            inserted += len(rows)
+            elapsed = time.perf_counter() - started
+            print(f"   ✅ {inserted:,}/{args.expenses:,} rows ({inserted / elapsed:,.0f} rows/s)", end='\r')
+    finally:
+        pool.terminate()
+        raw_connection.close()
+
+    total = time.perf_counter() - started
+    print()
+    print("=" * 40)
+    print(f"Rows inserted : {inserted:,}")
+    if inserted:
+        print(f"Generate time : {generate_seconds:.2f}s CPU across workers ({inserted / generate_seconds:,.0f} rows/s per worker)")
+        print(f"Load time     : {load_seconds:.2f}s ({inserted / load_seconds:,.0f} rows/s)")
+    print(f"Wall time     : {total:.2f}s")
+    if inserted:
+        print(f"Throughput    : {inserted / total:,.0f} rows/s overall")
+    print("ℹ️  Run scripts/reconcile_user_stats.py to refresh the per-user stats table")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,10 @@ Migration script to update database schema for the new security implementation
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Periodic jobs belong to the server processes, not to one-off scripts
+os.environ.setdefault('SCHEDULER_ENABLED', 'false')
+os.environ.setdefault('JOBS_WORKER_ENABLED', 'false')
+os.environ.setdefault('MAIL_QUEUE_ENABLED', 'false')
 
 from app import create_app
 from models import db, User, PendingUser, EmailVerification, RateLimitLog
@@ -1,13 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timedelta
-import bcrypt
+import json
 import secrets
 import re
 import random
 import string
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import UniqueConstraint, event, insert
+import logging
+from utils.password_hasher import get_password_hasher
+from utils.disposable_domains import get_disposable_domain_index
+from utils.sharding import ShardedSession, HOME_SHARD, shard_for_new_user
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': ShardedSession})
+logger = logging.getLogger(__name__)
+
+
+def case_insensitive_string(length):
+    """VARCHAR that compares case-insensitively on every engine, like MySQL's default collation"""
+    return db.String(length).with_variant(db.String(length, collation='NOCASE'), 'sqlite')
 
 # ---------------------- USER ----------------------
 class User(db.Model):
@@ -15,7 +25,7 @@ class User(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
+    email = db.Column(case_insensitive_string(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=True)  # Nullable for OAuth users
     is_verified = db.Column(db.Boolean, default=True)
     oauth_provider = db.Column(db.String(50), nullable=True)
@@ -24,13 +34,15 @@ class User(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def set_password(self, password):
-        salt = bcrypt.gensalt()
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        self.password_hash = get_password_hasher().hash(password)
     
     def check_password(self, password):
         if self.password_hash is None:
             return False
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return get_password_hasher().verify(password, self.password_hash)
+    
+    def password_needs_rehash(self):
+        return get_password_hasher().needs_rehash(self.password_hash)
     
     def to_dict(self):
         return {
@@ -42,13 +54,48 @@ class User(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+# ---------------------- DELETED USER ----------------------
+class DeletedUser(db.Model):
+    """Tombstone written whenever a user is deleted, consumed by the orphan cleanup"""
+    __tablename__ = 'deleted_users'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+@event.listens_for(User, 'after_delete')
+def _record_deleted_user(mapper, connection, target):
+    # Same transaction as the delete, so a tombstone exists exactly when the user is gone
+    connection.execute(DeletedUser.__table__.insert().values(user_id=target.id, deleted_at=datetime.utcnow()))
+
+# ---------------------- USER SHARD ----------------------
+class UserShard(db.Model):
+    """Shard directory entry: which database holds a user's expenses, categories and stats.
+    Users without an entry live on the home shard."""
+    __tablename__ = 'user_shards'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    shard = db.Column(db.String(32), nullable=False, index=True)
+    status = db.Column(db.String(10), nullable=False, default='active')  # 'active' or 'moving'
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+@event.listens_for(User, 'after_insert')
+def _assign_user_shard(mapper, connection, target):
+    shard = shard_for_new_user(target.id)
+    if shard != HOME_SHARD:
+        connection.execute(UserShard.__table__.insert().values(
+            user_id=target.id, shard=shard, status='active', updated_at=datetime.utcnow()
+        ))
+
 # ---------------------- CATEGORY ----------------------
 class Category(db.Model):
     __tablename__ = "categories"
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
-    name = db.Column(db.String(100), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=True)
+    name = db.Column(case_insensitive_string(100), nullable=False)
     type = db.Column(db.String(10), default='expense')  # 'expense' or 'income'
     is_default = db.Column(db.Boolean, default=False)
 
@@ -69,19 +116,24 @@ class Expense(db.Model):
     __tablename__ = 'expenses'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     type = db.Column(db.String(10), default='expense')  # 'expense' or 'income'
     description = db.Column(db.String(255), nullable=True)
     amount = db.Column(db.Float, nullable=False)
-    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id', ondelete='SET NULL'), nullable=True)
     payment_mode = db.Column(db.String(20), default='cash')
     date = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    user = db.relationship('User', backref=db.backref('expenses', lazy=True))
+    user = db.relationship('User', backref=db.backref('expenses', lazy=True, passive_deletes=True))
     category = db.relationship('Category', backref=db.backref('expenses', lazy=True))
     
+    __table_args__ = (
+        db.Index('ix_expenses_user_date', 'user_id', 'date'),
+        db.Index('ix_expenses_user_updated', 'user_id', 'updated_at'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -95,24 +147,114 @@ class Expense(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+# ---------------------- EXPENSE TOMBSTONE ----------------------
+class ExpenseTombstone(db.Model):
+    """Id of a deleted expense, so delta sync can tell clients to drop it"""
+    __tablename__ = 'expense_tombstones'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    expense_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    __table_args__ = (
+        db.Index('ix_expense_tombstones_user_deleted', 'user_id', 'deleted_at'),
+    )
+
+# ---------------------- SPENDING SKETCH ----------------------
+class SpendingSketch(db.Model):
+    """t-digest of a user's expense amounts in one category and month (category_id 0 = uncategorized).
+    stale rows missed an update or delete and are rebuilt from the expenses before use."""
+    __tablename__ = 'spending_sketches'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    category_id = db.Column(db.Integer, nullable=False, default=0)
+    month = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    count = db.Column(db.Integer, nullable=False, default=0)
+    digest = db.Column(db.LargeBinary, nullable=False)
+    stale = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint('user_id', 'category_id', 'month', name='uix_spending_sketch_user_category_month'),
+    )
+
+# ---------------------- TRANSACTION FLAG ----------------------
+class TransactionFlag(db.Model):
+    """Expense the anomaly detection job found to be a likely duplicate of related_expense_id or an
+    unusually large amount for its category. A user's flags are replaced on every run."""
+    __tablename__ = 'transaction_flags'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    expense_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(10), nullable=False)  # 'duplicate' or 'outlier'
+    related_expense_id = db.Column(db.Integer, nullable=True)  # the earlier expense a duplicate repeats
+    score = db.Column(db.Float, nullable=False)  # description similarity or robust z-score
+    amount = db.Column(db.Float, nullable=False)  # amount when flagged, flags of since edited expenses are hidden
+    detail = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_transaction_flags_user_kind', 'user_id', 'kind'),
+    )
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'expense_id': self.expense_id,
+            'related_expense_id': self.related_expense_id,
+            'score': round(self.score, 3),
+            'detail': self.detail,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+# ---------------------- USER STATS ----------------------
+class UserStats(db.Model):
+    __tablename__ = 'user_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    expense_count = db.Column(db.Integer, default=0, nullable=False)
+    income_count = db.Column(db.Integer, default=0, nullable=False)
+    category_count = db.Column(db.Integer, default=0, nullable=False)  # user-specific categories only
+    total_expense = db.Column(db.Float, default=0.0, nullable=False)
+    total_income = db.Column(db.Float, default=0.0, nullable=False)
+    first_transaction_at = db.Column(db.DateTime, nullable=True)
+    last_transaction_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'transaction_count': self.expense_count + self.income_count,
+            'expense_count': self.expense_count,
+            'income_count': self.income_count,
+            'category_count': self.category_count,
+            'total_expense': round(self.total_expense, 2),
+            'total_income': round(self.total_income, 2),
+            'balance': round(self.total_income - self.total_expense, 2),
+            'first_transaction_at': self.first_transaction_at.isoformat() if self.first_transaction_at else None,
+            'last_transaction_at': self.last_transaction_at.isoformat() if self.last_transaction_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
 # ---------------------- PENDING USER ----------------------
 class PendingUser(db.Model):
     __tablename__ = 'pending_users'
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False, index=True)
+    email = db.Column(case_insensitive_string(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     last_otp_sent = db.Column(db.DateTime, default=datetime.utcnow)
     otp_attempts = db.Column(db.Integer, default=0)
     
     def set_password(self, password):
-        salt = bcrypt.gensalt()
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        self.password_hash = get_password_hasher().hash(password)
     
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return get_password_hasher().verify(password, self.password_hash)
     
     def is_expired(self):
         return datetime.utcnow() > self.created_at + timedelta(hours=24)
@@ -124,7 +266,7 @@ class EmailVerification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     pending_user_id = db.Column(db.Integer, db.ForeignKey('pending_users.id'), nullable=False)
     otp = db.Column(db.String(6), nullable=False)
-    expires_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
     attempts = db.Column(db.Integer, default=0)
     
     pending_user = db.relationship(
@@ -156,6 +298,170 @@ class RateLimitLog(db.Model):
         cutoff = datetime.utcnow() - timedelta(hours=1)
         cls.query.filter(cls.attempt_time < cutoff).delete()
 
+# ---------------------- MAIL OUTBOX ----------------------
+class OutboxEmail(db.Model):
+    __tablename__ = 'mail_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sender = db.Column(db.String(120), nullable=True)
+    recipients = db.Column(db.Text, nullable=False)  # comma-separated
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text, nullable=True)
+    body = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(10), default='pending', nullable=False)  # 'pending', 'sending', 'sent' or 'failed'
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_by = db.Column(db.String(64), nullable=True, index=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_mail_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    def recipient_list(self):
+        return [address for address in self.recipients.split(',') if address]
+
+# ---------------------- REVOKED TOKEN ----------------------
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=False)
+    token_type = db.Column(db.String(10), nullable=False)  # 'access' or 'refresh'
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# ---------------------- STREAM EVENT ----------------------
+class StreamEvent(db.Model):
+    """Expense change published by one worker, read by the others for their open event streams"""
+    __tablename__ = 'stream_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    origin = db.Column(db.String(32), nullable=False)  # publishing process, which delivered it locally already
+    event = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+# ---------------------- IDEMPOTENCY KEY ----------------------
+class IdempotencyRecord(db.Model):
+    """Outcome of a write sent with an Idempotency-Key, replayed when the client retries.
+    status_code is NULL while the first request is still running."""
+    __tablename__ = 'idempotency_keys'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    method = db.Column(db.String(10), nullable=False)
+    path = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        UniqueConstraint('user_id', 'key', name='uix_idempotency_user_key'),
+    )
+
+# ---------------------- CLEANUP CHECKPOINT ----------------------
+class CleanupCheckpoint(db.Model):
+    __tablename__ = 'cleanup_checkpoints'
+    
+    task = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, default=0, nullable=False)  # resume point of an interrupted run, 0 when idle
+    deleted = db.Column(db.Integer, default=0, nullable=False)  # rows deleted by the current or last run
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+# ---------------------- SCHEDULER JOB RUN ----------------------
+class JobRun(db.Model):
+    __tablename__ = 'scheduler_job_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(50), nullable=False)
+    owner = db.Column(db.String(64), nullable=False)  # host:pid of the scheduler leader
+    status = db.Column(db.String(10), default='running', nullable=False)  # 'running', 'success' or 'failed'
+    started_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    duration_ms = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_scheduler_job_runs_job_started', 'job', 'started_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job': self.job,
+            'owner': self.owner,
+            'status': self.status,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'duration_ms': self.duration_ms,
+            'result': self.result,
+            'error': self.error
+        }
+
+# ---------------------- BACKGROUND JOB ----------------------
+class BackgroundJob(db.Model):
+    """Queued unit of work for the job workers (utils/jobs.py), user_id is None for system jobs"""
+    __tablename__ = 'background_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=True, index=True)
+    payload = db.Column(db.Text, nullable=True)  # JSON
+    priority = db.Column(db.Integer, default=0, nullable=False)  # higher runs first
+    status = db.Column(db.String(10), default='queued', nullable=False)  # 'queued', 'running', 'succeeded' or 'failed'
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=3, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_by = db.Column(db.String(64), nullable=True, index=True)  # worker running it
+    lease_expires_at = db.Column(db.DateTime, nullable=True)  # renewed while the worker is alive
+    progress = db.Column(db.Float, default=0.0, nullable=False)  # 0 to 1
+    progress_message = db.Column(db.String(255), nullable=True)
+    result = db.Column(db.Text, nullable=True)  # JSON
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True, index=True)
+
+    __table_args__ = (
+        db.Index('ix_background_jobs_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'status': self.status,
+            'priority': self.priority,
+            'progress': round(self.progress, 3),
+            'progress_message': self.progress_message,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+# ---------------------- APP META ----------------------
+class AppMeta(db.Model):
+    __tablename__ = 'app_meta'
+    
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.String(255), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 # ---------------------- EMAIL VALIDATOR ----------------------
 class EmailValidator:
     @staticmethod
@@ -165,13 +471,8 @@ class EmailValidator:
     
     @staticmethod
     def is_disposable_email(email):
-        disposable_domains = {
-            '10minutemail.com', 'guerrillamail.com', 'mailinator.com',
-            'tempmail.org', 'throwaway.email', 'temp-mail.org',
-            'getnada.com', 'maildrop.cc', 'yopmail.com'
-        }
-        domain = email.split('@')[1].lower() if '@' in email else ''
-        return domain in disposable_domains
+        domain = email.rsplit('@', 1)[1].lower() if '@' in email else ''
+        return get_disposable_domain_index().contains(domain)
     
     @staticmethod
     def validate_email(email):
@@ -186,9 +487,9 @@ class PasswordResetToken(db.Model):
     __tablename__ = 'password_reset_tokens'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     token = db.Column(db.String(32), unique=True, nullable=False)
-    expires_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
     is_used = db.Column(db.Boolean, default=False)
 
     @staticmethod
@@ -228,36 +529,44 @@ default_income_categories = [
 ]
 
 def seed_default_categories():
-    """Seed default categories into the database"""
+    """Insert the default categories that are missing with one bulk INSERT, return how many were added"""
     try:
-        print("Starting to seed default categories...")
-        
-        # Seed expense categories
-        for name in default_expense_categories:
-            existing = Category.query.filter_by(name=name, type='expense', is_default=True, user_id=None).first()
-            if not existing:
-                category = Category(name=name, type='expense', is_default=True, user_id=None)
-                db.session.add(category)
-                print(f"Added default expense category: {name}")
-        
-        # Seed income categories
-        for name in default_income_categories:
-            existing = Category.query.filter_by(name=name, type='income', is_default=True, user_id=None).first()
-            if not existing:
-                category = Category(name=name, type='income', is_default=True, user_id=None)
-                db.session.add(category)
-                print(f"Added default income category: {name}")
-        
+        existing = set(db.session.query(Category.type, Category.name).filter(
+            Category.is_default == True,
+            Category.user_id.is_(None)
+        ).all())
+        missing = [
+            {'name': name, 'type': category_type, 'is_default': True, 'user_id': None}
+            for category_type, names in (('expense', default_expense_categories),
+                                         ('income', default_income_categories))
+            for name in names
+            if (category_type, name) not in existing
+        ]
+        if missing:
+            db.session.execute(insert(Category), missing)
         db.session.commit()
-        print("Default categories seeded successfully!")
-        
-        # Verify seeding worked
-        expense_count = Category.query.filter_by(type='expense', is_default=True).count()
-        income_count = Category.query.filter_by(type='income', is_default=True).count()
-        print(f"Total default expense categories in DB: {expense_count}")
-        print(f"Total default income categories in DB: {income_count}")
+        if missing:
+            logger.info(f"Seeded {len(missing)} default categories")
+        return len(missing)
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error seeding default categories: {str(e)}")
-        raise e
\ No newline at end of file
+        logger.error(f"Error seeding default categories: {str(e)}")
+        raise e
+
+def visible_categories(user_id):
+    """The user's categories plus the defaults, one per name and type (case insensitive, the user's own wins), sorted by name"""
+    user_id = int(user_id)
+    categories = Category.query.filter(
+        (Category.user_id == user_id) | (Category.is_default == True)
+    ).order_by(Category.name).all()
+
+    seen = {}
+    for cat in categories:
+        key = (cat.name.lower(), cat.type)
+        if key not in seen or (cat.user_id == user_id and seen[key].user_id != user_id):
+            seen[key] = cat
+
+    unique_categories = list(seen.values())
+    unique_categories.sort(key=lambda c: c.name)
+    return unique_categories
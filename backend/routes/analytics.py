@@ -0,0 +1,72 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db
+from utils.rate_limiter import rate_limit
+from utils.shard_router import route_to_user_shard
+from utils.response_cache import cached_response
+from utils.dashboard import month_start
+from utils.spending_sketches import SpendingSketchService, month_key
+from sqlalchemy.exc import SQLAlchemyError
+from datetime import datetime
+import logging
+
+analytics_bp = Blueprint('analytics', __name__)
+logger = logging.getLogger(__name__)
+
+# ---------------------- SPENDING QUANTILES ----------------------
+
+@analytics_bp.route('/analytics/spending-quantiles', methods=['GET'])
+@jwt_required()
+@route_to_user_shard
+@cached_response('expenses')
+@rate_limit(limit=150, period=3600)
+def get_spending_quantiles():
+    """Typical (p50) and unusually large (p90, p99) expense amounts per category over the last `months` months"""
+    try:
+        user_id = int(get_jwt_identity())
+        months = request.args.get('months', current_app.config['ANALYTICS_DEFAULT_MONTHS'], type=int)
+        max_months = current_app.config['ANALYTICS_MAX_MONTHS']
+        if months < 1 or months > max_months:
+            return jsonify({'error': f'months must be between 1 and {max_months}'}), 400
+
+        since = month_key(month_start(datetime.utcnow(), months - 1))
+        categories = SpendingSketchService.quantiles(user_id, since)
+        return jsonify({'since_month': since, 'months': months, 'categories': categories}), 200
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Database error computing spending quantiles: {str(e)}")
+        return jsonify({'error': 'Database error occurred'}), 500
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected error computing spending quantiles: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred'}), 500
+
+# ---------------------- TRANSACTION FLAGS ----------------------
+
+@analytics_bp.route('/analytics/flags', methods=['GET'])
+@jwt_required()
+@route_to_user_shard
+@cached_response('expenses')
+@rate_limit(limit=150, period=3600)
+def get_transaction_flags():
+    """Likely duplicate entries and unusually large amounts found by the last anomaly detection run"""
+    try:
+        user_id = int(get_jwt_identity())
+        kind = request.args.get('kind')
+        if kind not in (None, 'duplicate', 'outlier'):
+            return jsonify({'error': "kind must be 'duplicate' or 'outlier'"}), 400
+
+        # Imported here, like the detect_anomalies job, to keep detection code out of worker startup
+        from utils.transaction_flags import TransactionFlagService
+        flags = TransactionFlagService.for_user(user_id, kind)
+        return jsonify({'flags': flags, 'count': len(flags)}), 200
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Database error fetching transaction flags: {str(e)}")
+        return jsonify({'error': 'Database error occurred'}), 500
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected error fetching transaction flags: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred'}), 500
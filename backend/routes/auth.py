@@ -1,17 +1,20 @@
 from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
-from flask_mail import Message
-from models import db, User, PendingUser, EmailVerification, EmailValidator, PasswordResetToken, Expense, Category
+from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity, get_jwt, decode_token
+from models import db, User, PendingUser, EmailVerification, EmailValidator, PasswordResetToken
 from utils.rate_limiter import rate_limit
+from utils.shard_router import route_to_user_shard
 from utils.cleanup import CleanupService
+from utils.password_hasher import PasswordHasherBusyError
+from utils.mail_queue import MailQueue
+from utils.email_templates import get_email_renderer
+from utils.user_cache import get_user_cache
+from utils.response_cache import cached_response, invalidate_responses
+from utils.token_revocation import get_revocation_list
+from utils.user_stats import UserStatsService
 from datetime import datetime, timedelta
-from sqlalchemy.exc import SQLAlchemyError
-import smtplib
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 import re
 import logging
-from google.oauth2 import id_token as google_id_token
-from google.auth.transport.requests import Request
-from google.auth.exceptions import GoogleAuthError
 import secrets
 
 auth_bp = Blueprint('auth', __name__)
@@ -36,48 +39,16 @@ def validate_password(password):
     
     return True, "Password is strong"
 
-def send_verification_email(mail, pending_user, otp):
-    """Send verification email"""
-    try:
-        msg = Message(
-            'Verify Your Email - ExpenseTracker',
-            sender=current_app.config['MAIL_DEFAULT_SENDER'],
-            recipients=[pending_user.email]
-        )
-        
-        msg.html = f"""
-        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-            <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;">
-                <h1 style="color: white; margin: 0;">Welcome to ExpenseTracker!</h1>
-            </div>
-            <div style="padding: 30px; background-color: #f9f9f9;">
-                <h2>Hi {pending_user.name},</h2>
-                <p>Thank you for signing up! Please verify your email address with the code below:</p>
-                
-                <div style="background-color: white; padding: 20px; border-radius: 8px; text-align: center; margin: 20px 0;">
-                    <h1 style="color: #667eea; font-size: 32px; letter-spacing: 5px; margin: 0;">{otp}</h1>
-                </div>
-                
-                <p><strong>This code will expire in 10 minutes.</strong></p>
-                <p>If you didn't create an account, please ignore this email.</p>
-                
-                <div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd;">
-                    <p style="color: #666; font-size: 12px; text-align: center;">
-                        © 2025 ExpenseTracker. All rights reserved.
-                    </p>
-                </div>
-            </div>
-        </div>
-        """
-        
-        mail.send(msg)
-        return True
-    except smtplib.SMTPException as e:
-        logger.error(f"SMTP error sending verification email: {str(e)}")
-        return False
-    except Exception as e:
-        logger.error(f"Unexpected error sending verification email: {str(e)}")
-        return False
+def hasher_busy_response():
+    """503 returned when the password hashing pool is saturated"""
+    response = jsonify({'error': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+def queue_verification_email(pending_user, otp):
+    """Queue the verification email, sent once the current transaction commits"""
+    email = get_email_renderer().render('verification', name=pending_user.name, otp=otp, expires_minutes=10)
+    MailQueue.enqueue(email.subject, recipients=[pending_user.email], html=email.html, body=email.body)
 
 @auth_bp.route('/register', methods=['POST'])
 @rate_limit(limit=15, period=3600)
@@ -128,18 +99,18 @@ def register():
         )
         
         db.session.add(verification)
+        queue_verification_email(pending_user, otp)
         db.session.commit()
         
-        if not send_verification_email(current_app.mail, pending_user, otp):
-            db.session.rollback()
-            return jsonify({'error': 'Failed to send verification email'}), 500
-        
         logger.info(f"Registration pending for {email}")
         return jsonify({
             'message': 'Verification email sent',
             'user_id': pending_user.id
         }), 201
     
+    except PasswordHasherBusyError:
+        db.session.rollback()
+        return hasher_busy_response()
     except SQLAlchemyError as e:
         db.session.rollback()
         logger.error(f"Database error during registration: {str(e)}")
@@ -250,11 +221,9 @@ def resend_otp():
         
         db.session.add(verification)
         pending_user.last_otp_sent = datetime.utcnow()
+        queue_verification_email(pending_user, otp)
         db.session.commit()
         
-        if not send_verification_email(current_app.mail, pending_user, otp):
-            return jsonify({'error': 'Failed to send verification email'}), 500
-        
         logger.info(f"OTP resent for {pending_user.email}")
         return jsonify({'message': 'Verification code resent'}), 200
     
@@ -283,6 +252,16 @@ def login():
         if not user or not user.check_password(password):
             return jsonify({'error': 'Invalid email or password'}), 401
         
+        # Upgrade the stored hash if the configured work factor changed
+        if user.password_needs_rehash():
+            try:
+                user.set_password(password)
+                db.session.commit()
+                logger.info(f"Rehashed password for user {user.id}")
+            except (PasswordHasherBusyError, SQLAlchemyError) as e:
+                db.session.rollback()
+                logger.warning(f"Skipped password rehash for user {user.id}: {str(e)}")
+        
         access_token = create_access_token(identity=str(user.id))
         refresh_token = create_refresh_token(identity=str(user.id))
         
@@ -293,6 +272,8 @@ def login():
             'user': user.to_dict()
         }), 200
     
+    except PasswordHasherBusyError:
+        return hasher_busy_response()
     except SQLAlchemyError as e:
         logger.error(f"Database error during login: {str(e)}")
         return jsonify({'error': 'Database error occurred'}), 500
@@ -315,6 +296,47 @@ def refresh_token():
         return jsonify({'error': 'Invalid refresh token'}), 401
 
 
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required(verify_type=False)
+def logout():
+    try:
+        revocations = get_revocation_list()
+        token = get_jwt()
+        revocations.revoke(
+            token['jti'], token['type'], datetime.utcfromtimestamp(token['exp']), user_id=int(token['sub'])
+        )
+        
+        # Optionally revoke the refresh token too, so the session cannot be renewed
+        data = request.get_json(silent=True) or {}
+        if data.get('refresh_token'):
+            try:
+                refresh = decode_token(data['refresh_token'])
+            except Exception:
+                refresh = None
+            if (refresh and refresh['type'] == 'refresh' and refresh['sub'] == token['sub']
+                    and not revocations.is_revoked(refresh['jti'])):
+                revocations.revoke(
+                    refresh['jti'], 'refresh', datetime.utcfromtimestamp(refresh['exp']), user_id=int(refresh['sub'])
+                )
+        
+        db.session.commit()
+        logger.info(f"User {token['sub']} logged out")
+        return jsonify({'message': 'Logged out successfully'}), 200
+    
+    except IntegrityError:
+        # Already revoked by a concurrent request
+        db.session.rollback()
+        return jsonify({'message': 'Logged out successfully'}), 200
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Database error during logout: {str(e)}")
+        return jsonify({'error': 'Database error occurred'}), 500
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected error during logout: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred'}), 500
+
+
 @auth_bp.route('/forgot-password', methods=['POST'])
 @rate_limit(limit=15, period=3600)
 def forgot_password():
@@ -339,51 +361,11 @@ def forgot_password():
         )
         
         db.session.add(reset_token)
-        db.session.commit()
         
-        try:
-            msg = Message(
-                'Reset Your Password - ExpenseTracker',
-                sender=current_app.config['MAIL_DEFAULT_SENDER'],
-                recipients=[email]
-            )
-            
-            reset_url = f"{current_app.config['FRONTEND_URL']}/reset-password?token={token}"
-            
-            msg.html = f"""
-            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;">
-                    <h1 style="color: white; margin: 0;">ExpenseTracker Password Reset</h1>
-                </div>
-                <div style="padding: 30px; background-color: #f9f9f9;">
-                    <h2>Hi {user.name},</h2>
-                    <p>We received a request to reset your password. Click the button below to reset it:</p>
-                    
-                    <div style="text-align: center; margin: 30px 0;">
-                        <a href="{reset_url}" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 14px 28px; text-decoration: none; border-radius: 6px; font-weight: bold;">
-                            Reset Password
-                        </a>
-                    </div>
-                    
-                    <p>If the button doesn't work, copy and paste this link into your browser:</p>
-                    <p style="word-break: break-all; color: #667eea;">{reset_url}</p>
-                    
-                    <p>This link will expire in 1 hour.</p>
-                    <p>If you didn't request a password reset, please ignore this email.</p>
-                    
-                    <div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd;">
-                        <p style="color: #666; font-size: 12px; text-align: center;">
-                            © 2025 ExpenseTracker. All rights reserved.
-                        </p>
-                    </div>
-                </div>
-            </div>
-            """
-            
-            current_app.mail.send(msg)
-        except smtplib.SMTPException as e:
-            logger.error(f"SMTP error sending reset email: {str(e)}")
-            return jsonify({'error': 'Failed to send reset email'}), 500
+        reset_url = f"{current_app.config['FRONTEND_URL']}/reset-password?token={token}"
+        reset_email = get_email_renderer().render('password_reset', name=user.name, reset_url=reset_url, expires_hours=1)
+        MailQueue.enqueue(reset_email.subject, recipients=[email], html=reset_email.html, body=reset_email.body)
+        db.session.commit()
         
         logger.info(f"Password reset requested for {email}")
         return jsonify({'message': 'If an account exists, a reset link has been sent'}), 200
@@ -452,10 +434,15 @@ def reset_password():
         reset_token.is_used = True
         
         db.session.commit()
+        get_user_cache().invalidate(user.id)
+        invalidate_responses(user.id, 'profile')
         
         logger.info(f"Password reset successful for user {user.id}")
         return jsonify({'message': 'Password reset successful'}), 200
     
+    except PasswordHasherBusyError:
+        db.session.rollback()
+        return hasher_busy_response()
     except SQLAlchemyError as e:
         db.session.rollback()
         logger.error(f"Database error resetting password: {str(e)}")
@@ -467,10 +454,11 @@ def reset_password():
 
 @auth_bp.route('/profile', methods=['GET'])
 @jwt_required()
+@cached_response('profile')
 def get_profile():
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = get_user_cache().get(user_id)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -486,16 +474,18 @@ def get_profile():
 
 @auth_bp.route('/stats', methods=['GET'])
 @jwt_required()
+@route_to_user_shard
+@cached_response('stats')
 def get_stats():
     try:
         user_id = get_jwt_identity()
-        stats = {
-            'total_expenses': Expense.query.filter_by(user_id=user_id).count(),
-            'total_categories': Category.query.filter_by(user_id=user_id).count()
-        }
-        return jsonify(stats), 200
+        stats = UserStatsService.get(user_id)
+        if not stats:
+            return jsonify({'error': 'User not found'}), 404
+        return jsonify(stats.to_dict()), 200
     
     except SQLAlchemyError as e:
+        db.session.rollback()
         logger.error(f"Database error fetching stats: {str(e)}")
         return jsonify({'error': 'Database error occurred'}), 500
     except Exception as e:
@@ -505,17 +495,16 @@ def get_stats():
 @auth_bp.route('/google', methods=['POST'])
 @rate_limit(limit=20, period=3600)
 def google_auth():
+    # Imported on first use, google.auth and requests are slow to load and most workers never need them
+    from google.auth.exceptions import GoogleAuthError
+    from utils.google_verifier import get_google_verifier
     try:
         data = request.get_json()
         id_token_str = data.get('id_token')
         if not id_token_str:
             return jsonify({'error': 'ID token is required'}), 400
 
-        idinfo = google_id_token.verify_oauth2_token(
-            id_token_str, Request(), current_app.config['GOOGLE_CLIENT_ID']
-        )
-        if idinfo['iss'] not in ['accounts.google.com', 'https://accounts.google.com']:
-            raise ValueError('Wrong issuer.')
+        idinfo = get_google_verifier(current_app.config['GOOGLE_CLIENT_ID']).verify(id_token_str)
 
         google_id = idinfo['sub']
         email = idinfo['email']
@@ -536,6 +525,8 @@ def google_auth():
                 user.oauth_provider = 'google'
                 user.oauth_id = google_id
                 db.session.commit()
+                get_user_cache().invalidate(user.id)
+                invalidate_responses(user.id, 'profile')
         else:
             user = User(
                 name=name,
@@ -0,0 +1,45 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db
+from utils.rate_limiter import rate_limit
+from utils.shard_router import route_to_user_shard
+from utils.dashboard import build_dashboard
+from utils.response_cache import cached_response
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+from config import Config
+
+dashboard_bp = Blueprint('dashboard', __name__)
+logger = logging.getLogger(__name__)
+
+MAX_RECENT = 50
+
+# ---------------------- DASHBOARD ----------------------
+
+@dashboard_bp.route('/dashboard', methods=['GET'])
+@jwt_required()
+@route_to_user_shard
+@cached_response('expenses', 'categories', 'stats', ttl=Config.DASHBOARD_CACHE_SECONDS)
+@rate_limit(limit=150, period=3600)
+def get_dashboard():
+    """Recent transactions, categories, this and last month's totals and stats in one response"""
+    try:
+        user_id = int(get_jwt_identity())
+        recent = request.args.get('recent', 5, type=int)
+        if recent < 0 or recent > MAX_RECENT:
+            return jsonify({'error': f'recent must be between 0 and {MAX_RECENT}'}), 400
+
+        payload = build_dashboard(user_id, recent)
+        if payload is None:
+            return jsonify({'error': 'User not found'}), 404
+
+        return jsonify(payload), 200
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Database error building dashboard: {str(e)}")
+        return jsonify({'error': 'Database error occurred'}), 500
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected error building dashboard: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred'}), 500
@@ -1,10 +1,19 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Expense, Category
-from utils.rate_limiter import rate_limit
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from models import db, Expense, ExpenseTombstone, Category, visible_categories
+from utils.rate_limiter import rate_limit, claim_attempt
+from utils.sharding import current_shard
+from utils.shard_router import route_to_user_shard
+from utils.idempotency import idempotent, claim_fence
+from utils.user_stats import UserStatsService
+from utils.spending_sketches import SpendingSketchService
+from utils.delta_sync import fetch_changes, SyncTokenError, SyncTokenExpired
+from utils.event_bus import get_event_bus, publish_expense_event, format_event, StreamLimitExceeded
+from utils.response_cache import cached_response, invalidate_responses
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import or_, and_
 import logging
+import time
 from datetime import datetime, timedelta
 
 expense_bp = Blueprint('expense', __name__)
@@ -14,6 +23,8 @@ logger = logging.getLogger(__name__)
 
 @expense_bp.route('/expenses', methods=['POST'])
 @jwt_required()
+@route_to_user_shard
+@idempotent
 @rate_limit(limit=120, period=3600)
 def add_expense():
     try:
@@ -75,7 +86,7 @@ def add_expense():
             except ValueError:
                 return jsonify({'error': 'Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)'}), 400
 
-        new_expense = Expense(
+        values = dict(
             user_id=user_id,
             type=expense_type,  # Add type field
             description=data.get('description', ''),  # Optional field
@@ -85,13 +96,26 @@ def add_expense():
             date=expense_date
         )
 
-        db.session.add(new_expense)
-        db.session.commit()
-
+        if current_app.config['GROUP_COMMIT_ENABLED']:
+            attempt = claim_attempt()
+            fence = claim_fence()
+            # End this request's transaction (on SQLite it holds the write lock) before waiting for the writer
+            db.session.rollback()
+            expense = current_app.group_committer.insert_expense(current_shard(), values, attempt, fence)
+        else:
+            new_expense = Expense(**values)
+            db.session.add(new_expense)
+            UserStatsService.expense_added(new_expense)
+            SpendingSketchService.expense_added(new_expense)
+            db.session.commit()
+            expense = new_expense.to_dict()
+
+        invalidate_responses(user_id, 'expenses', 'stats')
+        publish_expense_event(user_id, 'expense.created', expense)
         logger.info(f"Transaction added for user {user_id}")
         return jsonify({
             'message': 'Transaction added successfully',
-            'expense': new_expense.to_dict()
+            'expense': expense
         }), 201
 
     except SQLAlchemyError as e:
@@ -105,6 +129,8 @@ def add_expense():
 
 @expense_bp.route('/expenses', methods=['GET'])
 @jwt_required()
+@route_to_user_shard
+@cached_response('expenses')
 @rate_limit(limit=150, period=3600)
 def get_expenses():
     try:
@@ -185,8 +211,82 @@ def get_expenses():
         return jsonify({'error': 'An unexpected error occurred'}), 500
     
 
+@expense_bp.route('/expenses/changes', methods=['GET'])
+@jwt_required()
+@route_to_user_shard
+@rate_limit(limit=300, period=3600)
+def get_expense_changes():
+    """Expenses changed and ids deleted since the `since` token, for clients keeping a local copy"""
+    try:
+        user_id = int(get_jwt_identity())
+        result = fetch_changes(user_id, request.args.get('since'))
+        logger.info(f"Sent {len(result['changes'])} changed and {len(result['deleted'])} deleted expenses to user {user_id}")
+        return jsonify(result), 200
+
+    except SyncTokenError as e:
+        return jsonify({'error': str(e)}), 400
+    except SyncTokenExpired:
+        return jsonify({'error': 'Sync token expired, reload without since', 'reset': True}), 410
+    except SQLAlchemyError as e:
+        logger.error(f"Database error fetching expense changes: {str(e)}")
+        return jsonify({'error': 'Database error occurred'}), 500
+    except Exception as e:
+        logger.error(f"Unexpected error fetching expense changes: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred'}), 500
+
+
+@expense_bp.route('/expenses/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_expenses():
+    """Server-Sent Events: expense.created, expense.updated and expense.deleted for the current user.
+
+    EventSource cannot send headers, so the access token may come as
+    ?jwt=<token>. The stream ends when the token expires (event: expired),
+    or with event: reset when the client fell too far behind. After either,
+    or after a dropped connection, catch up through /expenses/changes.
+    """
+    user_id = int(get_jwt_identity())
+    expires_at = get_jwt().get('exp')
+    bus = get_event_bus()
+    try:
+        subscription = bus.subscribe(user_id)
+    except StreamLimitExceeded as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '30'
+        return response, 429
+    # The generator runs after the request context (and its session) is gone, nothing in it touches the database
+    db.session.remove()
+    heartbeat = current_app.config['SSE_HEARTBEAT_SECONDS']
+    retry_ms = current_app.config['SSE_RETRY_MS']
+
+    def generate():
+        try:
+            yield f"retry: {retry_ms}\n" + format_event('ready', {'user_id': user_id})
+            while True:
+                if expires_at and time.time() >= expires_at:
+                    yield format_event('expired', {})
+                    return
+                event = subscription.get(heartbeat)
+                if subscription.overflowed:
+                    yield format_event('reset', {})
+                    return
+                if event is None:
+                    yield ': heartbeat\n\n'
+                else:
+                    yield format_event(event['event'], event['data'])
+        finally:
+            bus.unsubscribe(subscription)
+
+    response = current_app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx would otherwise buffer the stream
+    return response
+
+
 @expense_bp.route('/expenses/<int:id>', methods=['PUT'])
 @jwt_required()
+@route_to_user_shard
+@idempotent
 @rate_limit(limit=20, period=3600)
 def update_expense(id):
     try:
@@ -196,6 +296,7 @@ def update_expense(id):
         if not expense:
             return jsonify({'error': 'Transaction not found'}), 404
 
+        before = UserStatsService.snapshot(expense)
         data = request.get_json()
 
         # Update type if provided
@@ -237,12 +338,17 @@ def update_expense(id):
             except ValueError:
                 return jsonify({'error': 'Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)'}), 400
 
+        UserStatsService.expense_changed(before, expense)
+        SpendingSketchService.expense_changed(before, expense)
         db.session.commit()
 
+        expense_dict = expense.to_dict()
+        invalidate_responses(user_id, 'expenses', 'stats')
+        publish_expense_event(user_id, 'expense.updated', expense_dict)
         logger.info(f"Transaction {id} updated for user {user_id}")
         return jsonify({
             'message': 'Transaction updated successfully',
-            'expense': expense.to_dict()
+            'expense': expense_dict
         }), 200
 
     except SQLAlchemyError as e:
@@ -257,6 +363,8 @@ def update_expense(id):
 
 @expense_bp.route('/expenses/<int:id>', methods=['DELETE'])
 @jwt_required()
+@route_to_user_shard
+@idempotent
 @rate_limit(limit=20, period=3600)
 def delete_expense(id):
     try:
@@ -267,8 +375,13 @@ def delete_expense(id):
             return jsonify({'error': 'Transaction not found'}), 404
 
         db.session.delete(expense)
+        db.session.add(ExpenseTombstone(user_id=expense.user_id, expense_id=expense.id))
+        UserStatsService.expense_removed(expense)
+        SpendingSketchService.expense_removed(expense)
         db.session.commit()
 
+        invalidate_responses(user_id, 'expenses', 'stats')
+        publish_expense_event(user_id, 'expense.deleted', {'id': id})
         logger.info(f"Transaction {id} deleted for user {user_id}")
         return jsonify({'message': 'Transaction deleted successfully'}), 200
 
@@ -285,6 +398,7 @@ def delete_expense(id):
 
 @expense_bp.route('/expenses/categories', methods=['POST'])
 @jwt_required()
+@route_to_user_shard
 @rate_limit(limit=10, period=3600)
 def add_category():
     try:
@@ -316,7 +430,9 @@ def add_category():
         )
 
         db.session.add(new_category)
+        UserStatsService.category_added(user_id)
         db.session.commit()
+        invalidate_responses(user_id, 'categories', 'stats')
 
         logger.info(f"Category added for user {user_id}")
         return jsonify({
@@ -336,23 +452,13 @@ def add_category():
 
 @expense_bp.route('/expenses/categories', methods=['GET'])
 @jwt_required()
+@route_to_user_shard
+@cached_response('categories')
 @rate_limit(limit=150, period=3600)
 def get_categories():
     try:
         user_id = get_jwt_identity()
-        categories = Category.query.filter(
-            (Category.user_id == user_id) | (Category.is_default == True)
-        ).order_by(Category.name).all()
-
-        # Deduplicate by name and type (case insensitive), preferring user-specific
-        seen = {}
-        for cat in categories:
-            key = (cat.name.lower(), cat.type)
-            if key not in seen or (cat.user_id == user_id and seen[key].user_id != user_id):
-                seen[key] = cat
-
-        unique_categories = list(seen.values())
-        unique_categories.sort(key=lambda c: c.name)
+        unique_categories = visible_categories(user_id)
 
         return jsonify({'categories': [cat.to_dict() for cat in unique_categories]}), 200
 
@@ -367,6 +473,7 @@ def get_categories():
 
 @expense_bp.route('/debug/category/<int:category_id>', methods=['GET'])
 @jwt_required()
+@route_to_user_shard
 def debug_category(category_id):
     try:
         user_id = get_jwt_identity()
@@ -0,0 +1,99 @@
+from flask import Blueprint, request, jsonify, send_file
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db, BackgroundJob
+from utils.rate_limiter import rate_limit
+from utils.jobs import JobQueue
+from utils.job_types import export_path
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+import os
+
+jobs_bp = Blueprint('jobs', __name__)
+logger = logging.getLogger(__name__)
+
+# Job types users may start for themselves, the rest are queued by the scheduler
+USER_JOB_TYPES = ('export_expenses', 'rebuild_aggregates')
+
+
+def _user_job(job_id):
+    """The JWT user's job, None for other users' and system jobs"""
+    return BackgroundJob.query.filter_by(id=job_id, user_id=int(get_jwt_identity())).first()
+
+# ---------------------- START JOB ----------------------
+
+@jobs_bp.route('/jobs', methods=['POST'])
+@jwt_required()
+@rate_limit(limit=30, period=3600)
+def start_job():
+    """Queue a job for the user, or return the identical one still queued or running"""
+    try:
+        user_id = int(get_jwt_identity())
+        data = request.get_json(silent=True) or {}
+        job_type = data.get('type')
+        if job_type not in USER_JOB_TYPES:
+            return jsonify({'error': f"type must be one of: {', '.join(USER_JOB_TYPES)}"}), 400
+
+        job = JobQueue.enqueue(job_type, user_id=user_id, unique=True)
+        db.session.commit()
+
+        response = jsonify({'message': 'Job queued', 'job': job.to_dict()})
+        response.headers['Location'] = f"/api/jobs/{job.id}"
+        return response, 202
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Database error queueing job: {str(e)}")
+        return jsonify({'error': 'Database error occurred'}), 500
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected error queueing job: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred'}), 500
+
+# ---------------------- JOB STATUS ----------------------
+
+@jobs_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+@rate_limit(limit=1200, period=3600)
+def get_job(job_id):
+    """Status, progress, result or error of one of the user's jobs, for clients to poll"""
+    try:
+        job = _user_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify({'job': job.to_dict()}), 200
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Database error fetching job: {str(e)}")
+        return jsonify({'error': 'Database error occurred'}), 500
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected error fetching job: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred'}), 500
+
+
+@jobs_bp.route('/jobs/<int:job_id>/download', methods=['GET'])
+@jwt_required()
+@rate_limit(limit=60, period=3600)
+def download_job_file(job_id):
+    """CSV written by a finished export job"""
+    try:
+        job = _user_job(job_id)
+        if job is None or job.type != 'export_expenses':
+            return jsonify({'error': 'Job not found'}), 404
+        if job.status != 'succeeded':
+            return jsonify({'error': 'Export is not ready', 'status': job.status}), 409
+
+        path = export_path(job.id)
+        if not os.path.exists(path):
+            return jsonify({'error': 'Export has expired, start a new one'}), 410
+        return send_file(path, mimetype='text/csv', as_attachment=True, download_name=f"expenses-{job.id}.csv")
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Database error downloading job file: {str(e)}")
+        return jsonify({'error': 'Database error occurred'}), 500
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Unexpected error downloading job file: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred'}), 500
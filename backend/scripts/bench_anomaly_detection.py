@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Time duplicate and outlier detection over a synthetic million-row dataset
+Generates expenses for --users users (log-normal amounts per category, dates
+over two years, merchant descriptions), plants copies of some rows a few
+hours later and multiplies a few amounts, then runs the detectors in
+batches of --batch-size users, in this process and in process pools of
+each --workers size. Prints rows/s, how many planted rows were found and
+how many other rows were flagged. Also times turning query rows into the
+column arrays, the part of a real run that is not analysis or I/O:
+python scripts/bench_anomaly_detection.py --rows 1000000 --workers 1 2 4
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+from config import Config
+from utils.anomaly_detection import analyze_batch, build_batch
+from utils.transaction_flags import TransactionFlagService
+
+MERCHANTS = ['Swiggy', 'Zomato', 'Uber', 'Ola', 'Amazon', 'Flipkart', 'BigBasket', 'Starbucks', 'Netflix',
+             'Airtel', 'Jio', 'Apollo Pharmacy', 'Shell', 'IndianOil', 'DMart', 'Myntra', 'BookMyShow', 'Zepto']
+
+
+def generate(rows, users, duplicate_share, outlier_share, seed):
+    rng = np.random.default_rng(seed)
+    user_ids = rng.integers(1, users + 1, rows)
+    categories = rng.integers(1, 13, rows)
+    kinds = (categories > 10).astype(np.int8)  # the last two categories are income
+    category_medians = np.exp(rng.uniform(3, 8, 13))
+    amounts = np.round(category_medians[categories] * np.exp(rng.normal(0, 0.5, rows)), 2)
+    seconds = 1_700_000_000 + rng.integers(0, 730 * 86400, rows)
+    merchants = rng.integers(0, len(MERCHANTS), rows)
+    descriptions = [f"{MERCHANTS[merchant]} {number}" for merchant, number in zip(merchants, rng.integers(0, 10000, rows))]
+
+    # Re-entered rows: same user, type, category and amount, up to two days later, same merchant
+    copies = rng.choice(rows, int(rows * duplicate_share), replace=False)
+    outliers = rng.choice(np.setdiff1d(np.arange(rows), copies), int(rows * outlier_share), replace=False)
+    amounts[outliers] = np.round(amounts[outliers] * 50, 2)
+    copy_ids = np.arange(rows, rows + len(copies)) + 1
+    batch = {
+        'ids': np.concatenate([np.arange(1, rows + 1), copy_ids]),
+        'user_ids': np.concatenate([user_ids, user_ids[copies]]),
+        'kinds': np.concatenate([kinds, kinds[copies]]),
+        'categories': np.concatenate([categories, categories[copies]]),
+        'amounts': np.concatenate([amounts, amounts[copies]]),
+        'seconds': np.concatenate([seconds, seconds[copies] + rng.integers(0, 48 * 3600, len(copies))]),
+        'descriptions': descriptions + [MERCHANTS[merchants[index]] for index in copies]
+    }
+    return batch, set(copy_ids.tolist()), set((outliers + 1).tolist())
+
+
+def split_by_user(batch, batch_size):
+    order = np.argsort(batch['user_ids'], kind='stable')
+    users = batch['user_ids'][order]
+    boundaries = np.searchsorted(users, np.arange(users[0], users[-1] + batch_size, batch_size))
+    batches = []
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        positions = order[start:end]
+        if len(positions):
+            part = {key: values[positions] for key, values in batch.items() if key != 'descriptions'}
+            part['descriptions'] = [batch['descriptions'][position] for position in positions]
+            batches.append(part)
+    return batches
+
+
+def run(batches, params, workers):
+    started = time.perf_counter()
+    if workers == 0:
+        results = [analyze_batch(batch, params) for batch in batches]
+    else:
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = list(pool.map(analyze_batch, batches, [params] * len(batches)))
+    elapsed = time.perf_counter() - started
+    duplicates = {row[0] for result in results for row in result['duplicates']}
+    outliers = {row[0] for result in results for row in result['outliers']}
+    return elapsed, duplicates, outliers
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time duplicate and outlier detection on synthetic expenses')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=Config.ANOMALY_DETECTION_BATCH_USERS,
+                        help='users per analysis task')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help='process pool sizes to time, besides running in this process')
+    parser.add_argument('--duplicate-share', type=float, default=0.005)
+    parser.add_argument('--outlier-share', type=float, default=0.0005)
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    batch, planted_duplicates, planted_outliers = generate(
+        args.rows, args.users, args.duplicate_share, args.outlier_share, args.seed
+    )
+    total = len(batch['ids'])
+    print(f"Generated {total} expenses of {args.users} users in {time.perf_counter() - started:.2f}s "
+          f"({len(planted_duplicates)} planted duplicates, {len(planted_outliers)} planted outliers)")
+
+    # What a real run does with query results before analysis
+    dates = batch['seconds'].astype('datetime64[s]').astype(datetime)
+    rows = list(zip(batch['ids'].tolist(), batch['user_ids'].tolist(), np.where(batch['kinds'], 'income', 'expense').tolist(),
+                    batch['categories'].tolist(), batch['amounts'].tolist(), dates.tolist(), batch['descriptions']))
+    started = time.perf_counter()
+    build_batch(rows)
+    print(f"Rows to column arrays: {time.perf_counter() - started:.2f}s")
+    del rows, dates
+
+    batches = split_by_user(batch, args.batch_size)
+    params = TransactionFlagService.detection_params()
+    print(f"{len(batches)} tasks of {args.batch_size} users, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'seconds':>8} {'rows/s':>10} {'dups found':>11} {'other dups':>11} "
+          f"{'outliers found':>15} {'other outliers':>15}")
+    for workers in [0] + args.workers:
+        elapsed, duplicates, outliers = run(batches, params, workers)
+        print(f"{workers or 'inline':>8} {elapsed:>8.2f} {total / elapsed:>10.0f} "
+              f"{len(duplicates & planted_duplicates):>11} {len(duplicates - planted_duplicates):>11} "
+              f"{len(outliers & planted_outliers):>15} {len(outliers - planted_outliers):>15}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark the disposable email domain index at full blocklist size
+Generates a synthetic blocklist, builds and maps the index, and reports
+build time, memory use and per-call lookup cost:
+python scripts/bench_disposable_domains.py --domains 200000
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import random
+import resource
+import shutil
+import string
+import tempfile
+import time
+from utils.disposable_domains import DisposableDomainIndex
+
+
+def random_domain(rng):
+    name = ''.join(rng.choices(string.ascii_lowercase + string.digits, k=rng.randint(5, 14)))
+    return f"{name}.{rng.choice(['com', 'net', 'org', 'io', 'email', 'xyz', 'co.uk'])}"
+
+
+def per_call_us(index, domains, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for domain in domains:
+            index.contains(domain)
+    return (time.perf_counter() - started) / (repeat * len(domains)) * 1e6
+
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark disposable domain lookups')
+    parser.add_argument('--domains', type=int, default=200000, help='size of the synthetic blocklist')
+    parser.add_argument('--lookups', type=int, default=10000, help='distinct domains looked up per scenario')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    listed = sorted({random_domain(rng) for _ in range(args.domains)})
+    workdir = tempfile.mkdtemp(prefix='disposable-bench-')
+    source = os.path.join(workdir, 'domains.txt')
+    with open(source, 'w') as handle:
+        handle.write('\n'.join(listed))
+
+    try:
+        rss_before = max_rss_kb()
+        started = time.perf_counter()
+        index = DisposableDomainIndex(source, reload_seconds=3600)
+        build_seconds = time.perf_counter() - started
+        stats = index.stats()
+
+        started = time.perf_counter()
+        DisposableDomainIndex(source, reload_seconds=3600)
+        map_seconds = time.perf_counter() - started
+
+        print(f"Domains          : {stats['domains']:,}")
+        print(f"Build index      : {build_seconds:.2f}s")
+        print(f"Map prebuilt     : {map_seconds * 1000:.2f} ms (what each worker pays at startup)")
+        print(f"Index file       : {stats['mapped_bytes'] / 1024 / 1024:.2f} MiB mapped, shared between processes")
+        print(f"Peak RSS growth  : {(max_rss_kb() - rss_before) / 1024:.2f} MiB (includes the build)")
+
+        hits = rng.sample(listed, min(args.lookups, len(listed)))
+        subdomains = [f"mx{i}.mail.{domain}" for i, domain in enumerate(hits)]
+        misses = [f"user{i}-{random_domain(rng)}" for i in range(args.lookups)]
+        print(f"Exact hit        : {per_call_us(index, hits, 5):.2f} µs/call")
+        print(f"Subdomain hit    : {per_call_us(index, subdomains, 5):.2f} µs/call")
+        print(f"Miss             : {per_call_us(index, misses, 5):.2f} µs/call")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark the outbound mail queue against a local SMTP stand-in
+Measures how long request handlers spend enqueueing a message and the
+sustained rate at which MailDispatcher delivers the outbox. Requires
+aiosmtpd (pip install aiosmtpd), which is only needed for this script:
+python scripts/bench_mail_queue.py --messages 2000 --workers 4
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import statistics
+import tempfile
+import time
+from flask import Flask
+from config import Config
+from models import db, OutboxEmail
+from utils.mail_queue import MailQueue, MailDispatcher
+
+
+class CountingHandler:
+    """aiosmtpd handler that accepts and counts every message"""
+
+    def __init__(self):
+        self.received = 0
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        self.sessions.add(id(session))
+        return '250 Message accepted'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark mail enqueue latency and send rate')
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=Config.MAIL_QUEUE_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=Config.MAIL_QUEUE_BATCH_SIZE)
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite database')
+    args = parser.parse_args()
+
+    try:
+        from aiosmtpd.controller import Controller
+    except ImportError:
+        print("❌ aiosmtpd is required for this benchmark: pip install aiosmtpd")
+        return 1
+
+    handler = CountingHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=args.port)
+    controller.start()
+
+    database_file = None
+    if not args.database_uri:
+        database_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=args.database_uri or f"sqlite:///{database_file}",
+        MAIL_SERVER='127.0.0.1',
+        MAIL_PORT=args.port,
+        MAIL_USE_TLS=False,
+        MAIL_USERNAME=None,
+        MAIL_PASSWORD=None,
+        MAIL_QUEUE_WORKERS=args.workers,
+        MAIL_QUEUE_BATCH_SIZE=args.batch_size,
+    )
+    db.init_app(app)
+
+    try:
+        with app.app_context():
+            db.create_all()
+
+            # Enqueue latency, each message committed like a request handler would
+            latencies = []
+            for index in range(args.messages):
+                started = time.perf_counter()
+                MailQueue.enqueue(
+                    'Benchmark message',
+                    recipients=[f"user{index}@example.com"],
+                    html=f"<p>Message {index}</p>",
+                    body=f"Message {index}",
+                    sender='bench@example.com'
+                )
+                db.session.commit()
+                latencies.append(time.perf_counter() - started)
+
+        latencies.sort()
+        print(f"Enqueue latency: p50 {statistics.median(latencies) * 1000:.2f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} ms")
+
+        # Sustained send rate, workers drain the backlog over pooled connections
+        dispatcher = MailDispatcher(app)
+        started = time.perf_counter()
+        dispatcher.start()
+        while handler.received < args.messages and time.perf_counter() - started < 300:
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        dispatcher.stop()
+
+        with app.app_context():
+            sent = OutboxEmail.query.filter_by(status='sent').count()
+        print(f"Delivered {handler.received} messages ({sent} marked sent) in {elapsed:.2f}s "
+              f"with {args.workers} workers: {handler.received / elapsed:.0f} msg/s")
+        print(f"SMTP sessions opened: {len(handler.sessions)}")
+    finally:
+        controller.stop()
+        if database_file:
+            os.unlink(database_file)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark login throughput against the bcrypt work factor
+Runs concurrent password verifications through PasswordHasher for each
+cost factor and reports logins/second and latency percentiles:
+python scripts/bench_password_hashing.py --rounds 10 11 12 13 --clients 16
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import logging
+import statistics
+import threading
+import time
+from utils.password_hasher import PasswordHasher, PasswordHasherBusyError
+
+
+def run_round(rounds, clients, requests_per_client, workers, max_pending):
+    hasher = PasswordHasher(rounds=rounds, max_workers=workers, max_pending=max_pending, timeout=60)
+    password_hash = hasher.hash('Benchmark123!')
+    latencies = []
+    rejected = [0]
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(requests_per_client):
+            started = time.perf_counter()
+            try:
+                hasher.verify('Benchmark123!', password_hash)
+            except PasswordHasherBusyError:
+                with lock:
+                    rejected[0] += 1
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    hasher.shutdown()
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0
+    return len(latencies) / wall, p50, p99, rejected[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark login throughput versus bcrypt cost factor')
+    parser.add_argument('--rounds', type=int, nargs='+', default=[10, 11, 12, 13])
+    parser.add_argument('--clients', type=int, default=16, help='concurrent login attempts')
+    parser.add_argument('--requests', type=int, default=8, help='logins per client')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--max-pending', type=int, default=32)
+    args = parser.parse_args()
+
+    # Rejections are counted in the report, no need to log each one
+    logging.getLogger('utils.password_hasher').setLevel(logging.ERROR)
+
+    print(f"Clients: {args.clients}, workers: {args.workers}, max pending: {args.max_pending}")
+    print(f"{'cost':>4}  {'logins/s':>9}  {'p50 ms':>8}  {'p99 ms':>8}  {'rejected':>8}")
+    for rounds in args.rounds:
+        throughput, p50, p99, rejected = run_round(
+            rounds, args.clients, args.requests, args.workers, args.max_pending
+        )
+        print(f"{rounds:>4}  {throughput:>9.1f}  {p50:>8.1f}  {p99:>8.1f}  {rejected:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Check t-digest spending sketches against exact percentiles
+For each distribution and size, adds the values to one digest per month
+(12 months), round-trips every digest through its serialized form, merges
+them like the analytics endpoint does, and compares p50/p90/p99 with the
+exact (linearly interpolated) percentiles. Reports the worst rank error
+(|share of values below the estimate - q|), the worst relative value
+error, serialized bytes per sketch and add/merge/query times. Exits
+non-zero when a rank error exceeds --max-rank-error. Value errors are
+large where the distribution jumps (the 'repeated' amounts), rank error
+is what a t-digest bounds.
+python scripts/bench_quantile_sketch.py --sizes 10 100 1000 100000
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import bisect
+import random
+import time
+from config import Config
+from utils.tdigest import TDigest
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+DISTRIBUTIONS = {
+    'lognormal': lambda rng: round(rng.lognormvariate(5, 1), 2),
+    'exponential': lambda rng: round(rng.expovariate(1 / 300), 2),
+    'uniform': lambda rng: round(rng.uniform(1, 2000), 2),
+    # Many identical subscription-like amounts plus occasional large ones
+    'repeated': lambda rng: rng.choice([99.0, 199.0, 499.0]) if rng.random() < 0.9 else round(rng.uniform(500, 50000), 2),
+}
+
+
+def exact_quantile(values, q):
+    position = q * (len(values) - 1)
+    index = int(position)
+    if index + 1 >= len(values):
+        return values[index]
+    return values[index] + (values[index + 1] - values[index]) * (position - index)
+
+
+def rank_error(values, estimate, q):
+    """Distance between q and the share of values below the estimate, less the 1/n an exact
+    interpolated percentile can be off by, ties counted as a range"""
+    low = bisect.bisect_left(values, estimate) / len(values)
+    high = bisect.bisect_right(values, estimate) / len(values)
+    if low <= q <= high:
+        return 0.0
+    return max(min(abs(low - q), abs(high - q)) - 1 / len(values), 0.0)
+
+
+def run(distribution, size, compression, months, rng):
+    values = [DISTRIBUTIONS[distribution](rng) for _ in range(size)]
+
+    monthly = [TDigest(compression) for _ in range(months)]
+    started = time.perf_counter()
+    for index, value in enumerate(values):
+        monthly[index % months].add(value)
+    add_us = (time.perf_counter() - started) / size * 1e6
+    stored = [digest.to_bytes() for digest in monthly]
+
+    started = time.perf_counter()
+    merged = TDigest(compression)
+    for data in stored:
+        merged.merge(TDigest.from_bytes(data))
+    estimates = [merged.quantile(q) for q in QUANTILES]
+    query_ms = (time.perf_counter() - started) * 1000
+
+    values.sort()
+    worst_rank = max(rank_error(values, estimate, q) for estimate, q in zip(estimates, QUANTILES))
+    worst_value = max(
+        abs(estimate - exact_quantile(values, q)) / exact_quantile(values, q)
+        for estimate, q in zip(estimates, QUANTILES)
+    )
+    return worst_rank, worst_value, max(len(data) for data in stored), len(merged.to_bytes()), add_us, query_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare t-digest quantiles with exact percentiles')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument('--compression', type=int, default=Config.SKETCH_COMPRESSION)
+    parser.add_argument('--months', type=int, default=12, help='digests merged per estimate')
+    parser.add_argument('--max-rank-error', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    failed = False
+    print(f"compression {args.compression}, {args.months} monthly digests merged per estimate")
+    print(f"{'distribution':<12} {'values':>8} {'rank err':>9} {'value err':>10} {'bytes/month':>12} "
+          f"{'bytes merged':>13} {'add us':>7} {'query ms':>9}")
+    for distribution in DISTRIBUTIONS:
+        for size in args.sizes:
+            worst_rank, worst_value, month_bytes, merged_bytes, add_us, query_ms = run(
+                distribution, size, args.compression, args.months, rng
+            )
+            failed = failed or worst_rank > args.max_rank_error
+            print(f"{distribution:<12} {size:>8} {worst_rank:>9.4f} {worst_value:>9.2%} {month_bytes:>12} "
+                  f"{merged_bytes:>13} {add_us:>7.2f} {query_ms:>9.2f}")
+    if failed:
+        print(f"Rank error above {args.max_rank_error}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
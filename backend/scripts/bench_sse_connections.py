@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Measure the cost of idle /api/expenses/stream connections
+Serves the app with the threaded Werkzeug server in this process, opens N
+event streams from non-blocking sockets, and reports resident memory and
+threads per idle connection, fan-out latency of one event to all of them,
+heartbeats received, and whether connection N+1 is refused.
+python scripts/bench_sse_connections.py --connections 100 500 --heartbeat 2
+Uses a new temporary SQLite database.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Periodic jobs belong to the server processes, not to one-off scripts
+os.environ.setdefault('SCHEDULER_ENABLED', 'false')
+os.environ.setdefault('JOBS_WORKER_ENABLED', 'false')
+os.environ.setdefault('MAIL_QUEUE_ENABLED', 'false')
+
+import argparse
+import logging
+import selectors
+import socket
+import tempfile
+import threading
+import time
+
+
+def resident_kib():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def open_stream(port, token):
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall(f"GET /api/expenses/stream?jwt={token} HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n".encode())
+    sock.setblocking(False)
+    return sock
+
+
+def read_until(selector, buffers, predicate, timeout):
+    """Read from every stream until predicate(buffer) holds for all of them, return the seconds it took"""
+    started = time.perf_counter()
+    pending = {sock for sock in buffers if not predicate(buffers[sock])}
+    while pending and time.perf_counter() - started < timeout:
+        for key, _ in selector.select(timeout=0.5):
+            data = key.fileobj.recv(65536)
+            buffers[key.fileobj] += data
+            if predicate(buffers[key.fileobj]):
+                pending.discard(key.fileobj)
+    return time.perf_counter() - started, len(pending)
+
+
+def run(port, token, user_id, connections, heartbeat):
+    from utils.event_bus import get_event_bus
+    bus = get_event_bus()
+    time.sleep(0.5)
+    base_kib, base_threads = resident_kib(), threading.active_count()
+
+    selector = selectors.DefaultSelector()
+    buffers = {}
+    for _ in range(connections):
+        sock = open_stream(port, token)
+        selector.register(sock, selectors.EVENT_READ)
+        buffers[sock] = b''
+    connect_time, not_ready = read_until(selector, buffers, lambda buffer: b'event: ready' in buffer, 60)
+    time.sleep(0.5)
+    per_connection = (resident_kib() - base_kib) / connections
+    threads = threading.active_count() - base_threads
+
+    for sock in buffers:
+        buffers[sock] = b''
+    bus.publish(user_id, 'expense.created', {'id': 0, 'amount': 1.0})
+    fanout, missed = read_until(selector, buffers, lambda buffer: b'expense.created' in buffer, 30)
+
+    for sock in buffers:
+        buffers[sock] = b''
+    _, no_heartbeat = read_until(selector, buffers, lambda buffer: b': heartbeat' in buffer, heartbeat * 3)
+
+    extra = socket.create_connection(('127.0.0.1', port))
+    extra.sendall(f"GET /api/expenses/stream?jwt={token} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    refused = b' 429 ' in extra.recv(1024)
+    extra.close()
+
+    for sock in buffers:
+        selector.unregister(sock)
+        sock.close()
+    selector.close()
+    deadline = time.monotonic() + heartbeat * 3
+    while bus.stats()['connections'] and time.monotonic() < deadline:
+        time.sleep(0.2)
+
+    print(f"{connections:>11} {connect_time:>10.2f} {per_connection:>12.1f} {threads:>8} "
+          f"{fanout * 1000:>10.1f} {connections - no_heartbeat:>10} {'yes' if refused else 'no':>8} "
+          f"{bus.stats()['connections']:>9}" + (f"  not ready: {not_ready}, missed: {missed}" if not_ready or missed else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure idle event stream connections')
+    parser.add_argument('--connections', type=int, nargs='+', default=[100, 500])
+    parser.add_argument('--heartbeat', type=float, default=2.0, help='SSE_HEARTBEAT_SECONDS for the run')
+    args = parser.parse_args()
+
+    import config
+    config.Config.SQLALCHEMY_DATABASE_URI = \
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='sse-bench-'), 'bench.db')}"
+    config.Config.SSE_HEARTBEAT_SECONDS = args.heartbeat
+    config.Config.SSE_MAX_CONNECTIONS = max(args.connections)
+    config.Config.SSE_MAX_CONNECTIONS_PER_USER = max(args.connections)
+    from app import create_app
+    from flask_jwt_extended import create_access_token
+    from models import db, User
+    from werkzeug.serving import make_server
+
+    app = create_app()
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    with app.app_context():
+        user = User(name='SSE Bench', email='sse-bench@example.com')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        token = create_access_token(identity=str(user_id))
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print(f"{'connections':>11} {'connect s':>10} {'KiB/conn':>12} {'threads':>8} "
+          f"{'fanout ms':>10} {'heartbeat':>10} {'N+1 429':>8} {'leftover':>9}")
+    for connections in args.connections:
+        # Limits apply to the run's own size, so connection N+1 is the refused one
+        from utils.event_bus import get_event_bus
+        get_event_bus().max_connections = connections
+        run(server.server_port, token, user_id, connections, args.heartbeat)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark worker cold start: importing the app and running create_app
+Each run is a fresh interpreter, like a new gunicorn worker or cron job.
+Reports first boot on an empty database, warm boots, and an import-time
+breakdown by top-level module:
+python scripts/bench_startup.py --runs 5
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import tempfile
+import time
+
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {backend!r})
+import config
+config.Config.SQLALCHEMY_DATABASE_URI = {uri!r}
+import app
+booted = time.perf_counter()
+app.create_app()
+print(json.dumps({{'boot': booted - started, 'create_app': time.perf_counter() - booted}}))
+'''
+
+_IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+
+def run_child(backend, uri, importtime=False):
+    env = dict(os.environ, SCHEDULER_ENABLED='false', MAIL_QUEUE_ENABLED='false')
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', CHILD.format(backend=backend, uri=uri)]
+    started = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True, env=env, cwd=backend)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['process'] = wall
+    return timings, result.stderr
+
+
+def import_breakdown(stderr, top=15):
+    """Cumulative microseconds per module imported directly by the app (depth <= 1)"""
+    modules = []
+    for line in stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match and len(match.group(3)) <= 2:
+            modules.append((int(match.group(2)), match.group(4)))
+    return sorted(modules, reverse=True)[:top]
+
+
+def report(label, runs):
+    for key in ('process', 'boot', 'create_app'):
+        values = [run[key] * 1000 for run in runs]
+        print(f"{label:<11} {key:<11}: median {statistics.median(values):7.1f} ms  "
+              f"min {min(values):7.1f} ms  max {max(values):7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark app startup in fresh interpreters')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--database-uri', help='defaults to a new temporary SQLite database')
+    parser.add_argument('--backend', default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help='backend checkout to measure, e.g. an older revision for comparison')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='startup-bench-')
+    uri = args.database_uri or f"sqlite:///{os.path.join(workdir, 'startup.db')}"
+
+    first, _ = run_child(args.backend, uri)
+    report('first boot', [first])
+    warm = [run_child(args.backend, uri)[0] for _ in range(args.runs)]
+    report('warm boot', warm)
+
+    _, stderr = run_child(args.backend, uri, importtime=True)
+    print("\nSlowest imports (cumulative):")
+    for microseconds, module in import_breakdown(stderr):
+        print(f"  {microseconds / 1000:7.1f} ms  {module}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Check that background jobs survive a worker crash
+Queues probe jobs that sleep for a while, starts N worker processes on one
+database, kills one of them (SIGKILL) while it runs jobs, then verifies
+that every job succeeded, that the killed worker's jobs ran again on a
+surviving worker once their lease lapsed, and that no job succeeded twice:
+python scripts/check_job_leases.py --workers 2 --jobs 8 --lease 3
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import multiprocessing
+import signal
+import tempfile
+import time
+from flask import Flask
+from config import Config
+from models import db, BackgroundJob
+from utils.jobs import JobQueue, JobWorker, job_type
+
+
+@job_type('lease_probe')
+def lease_probe(job, payload):
+    for step in range(10):
+        time.sleep(payload['seconds'] / 10)
+        job.progress(step + 1, 10)
+    return {'pid': os.getpid(), 'attempt': job.attempt}
+
+
+def build_app(database_uri, lease_seconds):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=database_uri,
+        SQLALCHEMY_BINDS={},
+        SQLALCHEMY_ENGINE_OPTIONS={},
+        JOBS_LEASE_SECONDS=lease_seconds,
+        JOBS_POLL_SECONDS=0.2
+    )
+    db.init_app(app)
+    return app
+
+
+def run_worker(database_uri, lease_seconds, threads, seconds):
+    worker = JobWorker(build_app(database_uri, lease_seconds), threads=threads, processes=0)
+    worker.start()
+    time.sleep(seconds)
+    worker.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Kill a job worker mid-job and verify its jobs run again')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=2, help='jobs run at once per worker')
+    parser.add_argument('--jobs', type=int, default=8)
+    parser.add_argument('--job-seconds', type=float, default=1.0)
+    parser.add_argument('--lease', type=float, default=3, help='JOBS_LEASE_SECONDS for the check')
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite database')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='jobs-check-')
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(workdir, 'jobs.db')}"
+    app = build_app(database_uri, args.lease)
+    with app.app_context():
+        db.create_all()
+        BackgroundJob.query.filter_by(type='lease_probe').delete()
+        job_ids = [JobQueue.enqueue('lease_probe', {'seconds': args.job_seconds, 'index': index}) for index in range(args.jobs)]
+        db.session.commit()
+        job_ids = [job.id for job in job_ids]
+
+    # Long enough for the survivors to finish everything after the lease lapses
+    run_seconds = args.lease * 2 + args.job_seconds * (args.jobs / max(args.threads * (args.workers - 1), 1) + 2) + 5
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=run_worker, args=(database_uri, args.lease, args.threads, run_seconds))
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # Kill the first worker seen holding a job, halfway through it
+    victim = None
+    deadline = time.monotonic() + 30
+    while victim is None and time.monotonic() < deadline:
+        time.sleep(args.job_seconds / 2)
+        with app.app_context():
+            owners = [owner for (owner,) in db.session.query(BackgroundJob.locked_by).filter(
+                BackgroundJob.id.in_(job_ids), BackgroundJob.status == 'running'
+            )]
+        for process in processes:
+            if any(owner.split(':')[1] == str(process.pid) for owner in owners):
+                victim = process
+                break
+    if victim is None:
+        print('No worker picked up a job')
+        sys.exit(1)
+    os.kill(victim.pid, signal.SIGKILL)
+    killed_at = time.monotonic()
+    print(f"Killed worker {victim.pid}")
+
+    for process in processes:
+        process.join()
+
+    with app.app_context():
+        jobs = BackgroundJob.query.filter(BackgroundJob.id.in_(job_ids)).order_by(BackgroundJob.id).all()
+        failed = [job for job in jobs if job.status != 'succeeded']
+        rerun = [job for job in jobs if job.attempts > 1]
+        on_victim = [job for job in jobs if job.result and json.loads(job.result)['pid'] == victim.pid]
+    for job in jobs:
+        print(f"job {job.id}: {job.status}, attempts {job.attempts}, result {job.result}, error {job.error}")
+
+    problems = []
+    if failed:
+        problems.append(f"{len(failed)} jobs did not succeed")
+    if not rerun:
+        problems.append('no job was run again after the kill')
+    if on_victim:
+        problems.append(f"{len(on_victim)} jobs report the killed worker as their runner")
+    print(f"{len(jobs)} jobs, {len(rerun)} run again after the kill, "
+          f"all done {time.monotonic() - killed_at:.1f}s after it (lease {args.lease}s)")
+    if problems:
+        print('FAILED: ' + '; '.join(problems))
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
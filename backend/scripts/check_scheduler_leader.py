@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Check scheduler leader election with several processes running at once
+Starts N scheduler processes sharing one database and lock, kills the
+leader halfway through, then verifies from scheduler_job_runs that runs
+never overlapped and that a standby took over:
+python scripts/check_scheduler_leader.py --processes 4 --seconds 20
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import multiprocessing
+import tempfile
+import time
+from flask import Flask
+from config import Config
+from models import db, JobRun
+from utils.scheduler import Scheduler
+
+PROBE_SECONDS = 0.3
+
+
+def run_scheduler(database_uri, lock_file, interval, seconds):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=database_uri,
+        SQLALCHEMY_ENGINE_OPTIONS={},
+        SCHEDULER_LOCK_FILE=lock_file,
+        SCHEDULER_LEADER_RETRY_SECONDS=0.5
+    )
+    db.init_app(app)
+
+    scheduler = Scheduler(app)
+    scheduler.add_job('probe', lambda: time.sleep(PROBE_SECONDS), interval_seconds=interval, jitter_seconds=0.2)
+    scheduler.start()
+    time.sleep(seconds)
+    scheduler.stop()
+
+
+def leader_pid(app):
+    with app.app_context():
+        run = JobRun.query.order_by(JobRun.id.desc()).first()
+        return int(run.owner.rsplit(':', 1)[1]) if run else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run several schedulers at once and verify single leadership')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--interval', type=float, default=1, help='probe job interval in seconds')
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite database (file lock)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='scheduler-check-')
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(workdir, 'scheduler.db')}"
+    lock_file = os.path.join(workdir, 'scheduler.lock')
+
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=database_uri)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        JobRun.query.filter_by(job='probe').delete()
+        db.session.commit()
+
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=run_scheduler, args=(database_uri, lock_file, args.interval, args.seconds))
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    time.sleep(args.seconds / 2)
+    killed = leader_pid(app)
+    for process in processes:
+        if process.pid == killed:
+            process.kill()
+            print(f"Killed leader process {killed}")
+    for process in processes:
+        process.join()
+
+    with app.app_context():
+        runs = JobRun.query.filter_by(job='probe').order_by(JobRun.started_at).all()
+
+    finished = [run for run in runs if run.finished_at]
+    overlaps = sum(
+        1 for previous, current in zip(finished, finished[1:])
+        if current.started_at < previous.finished_at
+    )
+    owners = {}
+    for run in runs:
+        owners[run.owner] = owners.get(run.owner, 0) + 1
+
+    print(f"Processes        : {args.processes}")
+    print(f"Runs recorded    : {len(runs)} ({len(runs) - len(finished)} interrupted by the kill)")
+    print(f"Runs per leader  : {owners}")
+    print(f"Overlapping runs : {overlaps}")
+    ok = overlaps == 0 and len(owners) >= 2
+    print("PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
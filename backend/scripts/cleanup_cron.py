@@ -7,9 +7,14 @@ Add this to your crontab to run every 30 minutes:
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Periodic jobs belong to the server processes, not to one-off scripts
+os.environ.setdefault('SCHEDULER_ENABLED', 'false')
+os.environ.setdefault('JOBS_WORKER_ENABLED', 'false')
+os.environ.setdefault('MAIL_QUEUE_ENABLED', 'false')
 
 from app import create_app
 from utils.cleanup import CleanupService
+from utils.scheduler import build_leader_lock
 import logging
 
 # Setup logging for cron job
@@ -26,7 +31,16 @@ def main():
     try:
         app = create_app()
         with app.app_context():
-            results = CleanupService.run_all_cleanup_tasks()
+            # Share the scheduler's leader lock so cron and a running server never clean up at once
+            lock = build_leader_lock(app.config, f"cron:{os.getpid()}")
+            if not lock.acquire():
+                logging.info("Cleanup skipped, the scheduler leader is running it")
+                print("Cleanup skipped, the scheduler leader is running it")
+                return
+            try:
+                results = CleanupService.run_all_cleanup_tasks()
+            finally:
+                lock.release()
             logging.info(f"Cleanup completed: {results}")
             print(f"Cleanup completed: {results}")
     except Exception as e:
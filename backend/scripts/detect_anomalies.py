@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Flag likely duplicate expenses and unusually large amounts for every user
+Replaces the transaction_flags rows served by GET /api/analytics/flags, the
+app also runs this every ANOMALY_DETECTION_HOURS:
+python scripts/detect_anomalies.py --workers 4 --batch-size 500
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Periodic jobs belong to the server processes, not to one-off scripts
+os.environ.setdefault('SCHEDULER_ENABLED', 'false')
+os.environ.setdefault('JOBS_WORKER_ENABLED', 'false')
+os.environ.setdefault('MAIL_QUEUE_ENABLED', 'false')
+
+import argparse
+from config import Config
+from utils.transaction_flags import TransactionFlagService
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detect duplicate and outlier expenses of every user')
+    parser.add_argument('--workers', type=int, default=Config.ANOMALY_DETECTION_WORKERS,
+                        help='analysis processes, 1 analyzes in this process')
+    parser.add_argument('--batch-size', type=int, default=Config.ANOMALY_DETECTION_BATCH_USERS,
+                        help='users loaded and analyzed per task')
+    args = parser.parse_args()
+
+    # Imported here, pool workers re-import this module and must not build an app of their own
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        totals = TransactionFlagService.run_all(args.workers, args.batch_size)
+    print(f"Done, {totals['duplicates']} duplicates and {totals['outliers']} outliers among "
+          f"{totals['expenses']} expenses of {totals['users']} users in {totals['seconds']:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Move users between shards or rebalance expense rows across all shards
+Shards are the main database ('home') plus SHARD_DATABASE_URLS (shard_1, ...).
+Moving waits SHARD_MAP_CACHE_SECONDS so running workers stop writing first,
+the user gets 503s meanwhile. Expense and custom category ids change.
+python scripts/move_user_shard.py --status
+python scripts/move_user_shard.py --user-id 42 --to shard_2
+python scripts/move_user_shard.py --rebalance --max-moves 20 --dry-run
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Periodic jobs belong to the server processes, not to one-off scripts
+os.environ.setdefault('SCHEDULER_ENABLED', 'false')
+os.environ.setdefault('JOBS_WORKER_ENABLED', 'false')
+os.environ.setdefault('MAIL_QUEUE_ENABLED', 'false')
+
+import argparse
+from app import create_app
+from utils.shard_router import get_shard_router
+
+
+def plan_rebalance(loads, max_moves):
+    """Greedy moves from the heaviest to the lightest shard, [(user_id, source, target, rows)]"""
+    loads = {shard: dict(users) for shard, users in loads.items()}
+    totals = {shard: sum(users.values()) for shard, users in loads.items()}
+    moves = []
+    while len(moves) < max_moves:
+        heaviest = max(totals, key=totals.get)
+        lightest = min(totals, key=totals.get)
+        gap = totals[heaviest] - totals[lightest]
+        # The biggest user that still narrows the gap, moving more than half of it would overshoot
+        candidates = [(rows, user_id) for user_id, rows in loads[heaviest].items() if 0 < rows <= gap / 2]
+        if not candidates:
+            break
+        rows, user_id = max(candidates)
+        moves.append((user_id, heaviest, lightest, rows))
+        loads[lightest][user_id] = loads[heaviest].pop(user_id)
+        totals[heaviest] -= rows
+        totals[lightest] += rows
+    return moves
+
+
+def print_status(loads):
+    for shard, users in loads.items():
+        print(f"{shard:<10} {len(users):>8} users with expenses {sum(users.values()):>12} expenses")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move users between shards')
+    parser.add_argument('--status', action='store_true', help='show users and expenses per shard')
+    parser.add_argument('--user-id', type=int, help='user to move, with --to')
+    parser.add_argument('--to', help='target shard, e.g. home or shard_1')
+    parser.add_argument('--rebalance', action='store_true', help='even out expense rows across shards')
+    parser.add_argument('--max-moves', type=int, default=10)
+    parser.add_argument('--dry-run', action='store_true', help='print the rebalance plan without moving anyone')
+    parser.add_argument('--no-wait', action='store_true',
+                        help='skip waiting for worker caches, only safe while no server is running')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        router = get_shard_router()
+        print(f"Shards: {', '.join(router.shards)}")
+
+        if args.user_id is not None:
+            if not args.to:
+                parser.error('--user-id needs --to')
+            moved = router.move_user(args.user_id, args.to, wait=not args.no_wait)
+            print(f"Moved user {args.user_id} to {args.to} with {moved} expenses")
+        elif args.rebalance:
+            loads = router.loads()
+            print_status(loads)
+            moves = plan_rebalance(loads, args.max_moves)
+            if not moves:
+                print("Shards are balanced, nothing to move")
+            for user_id, source, target, rows in moves:
+                print(f"{'Would move' if args.dry_run else 'Moving'} user {user_id} ({rows} expenses) from {source} to {target}")
+                if not args.dry_run:
+                    router.move_user(user_id, target, wait=not args.no_wait)
+            if moves and not args.dry_run:
+                print_status(router.loads())
+        else:
+            print_status(router.loads())
+
+
+if __name__ == '__main__':
+    main()
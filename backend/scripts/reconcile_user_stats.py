@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Recompute the per-user stats table from the expenses and categories tables
+Run after bulk loads that bypass the API (e.g. generate_data.py), the app
+also reconciles every USER_STATS_RECONCILE_HOURS:
+python scripts/reconcile_user_stats.py --batch-size 500
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Periodic jobs belong to the server processes, not to one-off scripts
+os.environ.setdefault('SCHEDULER_ENABLED', 'false')
+os.environ.setdefault('JOBS_WORKER_ENABLED', 'false')
+os.environ.setdefault('MAIL_QUEUE_ENABLED', 'false')
+
+import argparse
+import time
+from app import create_app
+from config import Config
+from utils.user_stats import UserStatsService
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute per-user stats from the source tables')
+    parser.add_argument('--batch-size', type=int, default=Config.USER_STATS_RECONCILE_BATCH_SIZE,
+                        help='users recomputed and committed per batch')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        started = time.perf_counter()
+        corrected = UserStatsService.reconcile(args.batch_size)
+    print(f"Done, {corrected} user stats rows corrected in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Bulk resend of verification codes to every pending (unexpired) registration
+Emails are rendered in batches and queued in the outbox, the mail
+dispatchers of the server processes deliver them:
+python scripts/resend_pending_verifications.py --chunk-size 500
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Periodic jobs belong to the server processes, not to one-off scripts
+os.environ.setdefault('SCHEDULER_ENABLED', 'false')
+os.environ.setdefault('JOBS_WORKER_ENABLED', 'false')
+os.environ.setdefault('MAIL_QUEUE_ENABLED', 'false')
+
+import argparse
+import time
+from datetime import datetime, timedelta
+from app import create_app
+from config import Config
+from models import db, PendingUser, EmailVerification
+from utils.email_templates import get_email_renderer
+from utils.mail_queue import MailQueue
+
+OTP_EXPIRY_MINUTES = 10
+
+
+def resend_all(chunk_size):
+    renderer = get_email_renderer()
+    cutoff = datetime.utcnow() - timedelta(hours=Config.PENDING_USER_EXPIRY_HOURS)
+    last_id = 0
+    total = 0
+    render_seconds = 0.0
+
+    while True:
+        pending_users = PendingUser.query.filter(
+            PendingUser.id > last_id,
+            PendingUser.created_at >= cutoff
+        ).order_by(PendingUser.id).limit(chunk_size).all()
+        if not pending_users:
+            break
+
+        now = datetime.utcnow()
+        otps = [EmailVerification.generate_otp() for _ in pending_users]
+        started = time.perf_counter()
+        emails = renderer.render_batch('verification', [
+            {'name': pending_user.name, 'otp': otp, 'expires_minutes': OTP_EXPIRY_MINUTES}
+            for pending_user, otp in zip(pending_users, otps)
+        ])
+        render_seconds += time.perf_counter() - started
+
+        for pending_user, otp, email in zip(pending_users, otps, emails):
+            db.session.add(EmailVerification(
+                pending_user_id=pending_user.id,
+                otp=otp,
+                expires_at=now + timedelta(minutes=OTP_EXPIRY_MINUTES)
+            ))
+            pending_user.last_otp_sent = now
+            MailQueue.enqueue(email.subject, recipients=[pending_user.email], html=email.html, body=email.body)
+        db.session.commit()
+
+        total += len(pending_users)
+        last_id = pending_users[-1].id
+        print(f"Queued {total} verification emails")
+
+    if total:
+        print(f"Rendering took {render_seconds * 1e6 / total:.1f} µs per email")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resend verification codes to all pending registrations')
+    parser.add_argument('--chunk-size', type=int, default=500, help='pending users rendered and committed per batch')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        total = resend_all(args.chunk_size)
+    print(f"Done, {total} emails queued for delivery")
+
+
+if __name__ == '__main__':
+    main()
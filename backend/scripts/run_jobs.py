@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Run background job workers in a process of their own
+For deployments that keep jobs off the web servers (JOBS_WORKER_ENABLED=false
+there). Stops on SIGTERM or Ctrl+C, jobs it was running are picked up by
+another worker once their lease lapses:
+python scripts/run_jobs.py --threads 4 --processes 2
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Periodic jobs belong to the server processes, not to one-off scripts
+os.environ.setdefault('SCHEDULER_ENABLED', 'false')
+os.environ.setdefault('MAIL_QUEUE_ENABLED', 'false')
+# The worker below is this process's only one, the app must not start another
+os.environ['JOBS_WORKER_ENABLED'] = 'false'
+
+import argparse
+import signal
+import threading
+from config import Config
+from utils.jobs import JobWorker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run background job workers')
+    parser.add_argument('--threads', type=int, default=Config.JOBS_THREAD_WORKERS, help='threads for I/O-bound jobs')
+    parser.add_argument('--processes', type=int, default=Config.JOBS_PROCESS_WORKERS, help='processes for CPU-bound jobs')
+    args = parser.parse_args()
+
+    # Imported here, pool processes re-import this module and must not build an app of their own
+    from app import create_app
+    app = create_app()
+    worker = JobWorker(app, args.threads, args.processes)
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    worker.start()
+    while not stopping.wait(1):
+        pass
+    worker.stop()
+    print(f"Stopped, {worker.stats()}")
+
+
+if __name__ == '__main__':
+    main()
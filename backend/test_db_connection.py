@@ -1,20 +1,23 @@
-import os
-import urllib.parse
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.exc import OperationalError
+from config import Config
 
-MYSQL_HOST = 'localhost'
-MYSQL_USER = 'root'
-MYSQL_PASSWORD = urllib.parse.quote_plus("Sahilkumar1272@#")  # encode special chars
-MYSQL_DB = 'expense_tracker'
+# Same URI the app uses: MySQL by default, SQLite with DB_ENGINE=sqlite, or DATABASE_URL
+db_uri = Config.SQLALCHEMY_DATABASE_URI
 
-db_uri = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
+DETAILS_QUERY = {
+    'mysql': "SELECT DATABASE(), USER(), VERSION();",
+    'sqlite': "SELECT file, 'sqlite', sqlite_version() FROM pragma_database_list WHERE name = 'main';",
+}
 
 try:
     engine = create_engine(db_uri)
     with engine.connect() as connection:
         print("✅ Connection successful!")
-        print("Database details:", connection.execute("SELECT DATABASE(), USER();").fetchone())
+        print("Engine:", engine.dialect.name)
+        query = DETAILS_QUERY.get(engine.dialect.name)
+        if query:
+            print("Database details:", connection.execute(text(query)).fetchone())
         
 except OperationalError as e:
     print("❌ Connection failed!")
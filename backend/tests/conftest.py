@@ -0,0 +1,11 @@
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Periodic jobs, mail and job workers belong to the server processes, not to the tests
+os.environ.setdefault('SCHEDULER_ENABLED', 'false')
+os.environ.setdefault('MAIL_QUEUE_ENABLED', 'false')
+os.environ.setdefault('JOBS_WORKER_ENABLED', 'false')
+# Importing app builds an app, keep it (and the tests using it) off the configured databases
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='expense-tracker-tests-'), 'app.db')}"
+os.environ.pop('SHARD_DATABASE_URLS', None)
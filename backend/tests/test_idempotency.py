@@ -0,0 +1,143 @@
+"""
+Idempotency-Key on POST /api/expenses, through the app test client
+- a retry gets the stored response (same status and body) without a second insert
+- concurrent retries with one key insert exactly one expense, directly and through group commit
+- the key reused for a different body gets 409 and inserts nothing
+"""
+import threading
+import uuid
+import pytest
+from flask_jwt_extended import create_access_token
+from app import create_app
+from models import db, User, Expense
+import routes.expense as expense_routes
+
+RETRIES = 8
+
+
+@pytest.fixture(scope='module')
+def app():
+    return create_app()
+
+
+@pytest.fixture(params=[False, True], ids=['direct', 'group_commit'])
+def group_commit(request, app):
+    app.config['GROUP_COMMIT_ENABLED'] = request.param
+    yield request.param
+    app.config['GROUP_COMMIT_ENABLED'] = False
+
+
+@pytest.fixture
+def headers(app):
+    with app.app_context():
+        user = User(name='Retrying Client', email=f"{uuid.uuid4().hex}@example.com")
+        db.session.add(user)
+        db.session.commit()
+        token = create_access_token(identity=str(user.id))
+        user_id = user.id
+    return user_id, {'Authorization': f"Bearer {token}", 'Idempotency-Key': uuid.uuid4().hex}
+
+
+def post_expense(app, headers, amount=12.5):
+    return app.test_client().post('/api/expenses', headers=headers, json={
+        'amount': amount, 'description': 'Taxi', 'payment_mode': 'upi'
+    })
+
+
+def expense_count(app, user_id):
+    with app.app_context():
+        return Expense.query.filter_by(user_id=user_id).count()
+
+
+def test_replay_returns_stored_response(app, headers, group_commit):
+    user_id, headers = headers
+    first = post_expense(app, headers)
+    assert first.status_code == 201
+    assert 'Idempotent-Replayed' not in first.headers
+
+    retry = post_expense(app, headers)
+    assert retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    assert expense_count(app, user_id) == 1
+
+    # Without a key every request is a new one
+    del headers['Idempotency-Key']
+    assert post_expense(app, headers).status_code == 201
+    assert expense_count(app, user_id) == 2
+
+
+def test_concurrent_retries_insert_once(app, headers, group_commit):
+    user_id, headers = headers
+    barrier = threading.Barrier(RETRIES)
+    responses = [None] * RETRIES
+
+    def retry(index):
+        barrier.wait()
+        responses[index] = post_expense(app, headers)
+
+    threads = [threading.Thread(target=retry, args=(index,)) for index in range(RETRIES)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    created = [response for response in responses if response.status_code == 201]
+    # The rest either replayed the first response or found it still running
+    assert all(response.status_code in (201, 409) for response in responses)
+    assert len([response for response in created if 'Idempotent-Replayed' not in response.headers]) == 1
+    assert all(
+        'still in progress' in response.get_json()['error']
+        for response in responses if response.status_code == 409
+    )
+    assert expense_count(app, user_id) == 1
+
+    # Once the first one finished, every retry replays it
+    retry = post_expense(app, headers)
+    assert retry.status_code == 201
+    assert retry.get_json() == created[0].get_json()
+    assert expense_count(app, user_id) == 1
+
+
+def test_different_body_with_same_key(app, headers):
+    user_id, headers = headers
+    assert post_expense(app, headers, amount=12.5).status_code == 201
+
+    reused = post_expense(app, headers, amount=99.0)
+    assert reused.status_code == 409
+    assert 'different request' in reused.get_json()['error']
+    assert expense_count(app, user_id) == 1
+    # The stored response is still there for genuine retries
+    assert post_expense(app, headers, amount=12.5).headers['Idempotent-Replayed'] == 'true'
+
+
+def test_different_body_while_first_runs(app, headers, monkeypatch):
+    user_id, headers = headers
+    inside = threading.Event()
+    release = threading.Event()
+    invalidate = expense_routes.invalidate_responses
+
+    def held_invalidate(*args):
+        # The first request has inserted its expense but not stored its response yet.
+        # End its transaction first, on SQLite a request's transactions hold the write lock
+        db.session.rollback()
+        inside.set()
+        release.wait(10)
+        invalidate(*args)
+
+    monkeypatch.setattr(expense_routes, 'invalidate_responses', held_invalidate)
+    responses = {}
+    first = threading.Thread(target=lambda: responses.setdefault('first', post_expense(app, headers)))
+    first.start()
+    try:
+        assert inside.wait(10)
+        monkeypatch.setattr(expense_routes, 'invalidate_responses', invalidate)
+        reused = post_expense(app, headers, amount=99.0)
+    finally:
+        release.set()
+        first.join()
+
+    assert reused.status_code == 409
+    assert 'different request' in reused.get_json()['error']
+    assert responses['first'].status_code == 201
+    assert expense_count(app, user_id) == 1
@@ -0,0 +1,106 @@
+"""
+Scheduler leader election on FileLeaderLock
+Several locks (and several scheduler processes) share one lock file: only
+one may hold it at a time, and another takes over once the holder releases
+it or its process dies. scripts/check_scheduler_leader.py runs the same
+check for longer and against other databases.
+"""
+import multiprocessing
+import os
+import time
+import pytest
+from flask import Flask
+from models import db, JobRun
+from utils.scheduler import FileLeaderLock
+from scripts.check_scheduler_leader import run_scheduler, leader_pid
+
+PROCESSES = 3
+INTERVAL = 0.5
+RUN_SECONDS = 12
+
+
+def test_one_holder_at_a_time(tmp_path):
+    path = str(tmp_path / 'scheduler.lock')
+    locks = [FileLeaderLock(path, f"owner-{index}") for index in range(3)]
+
+    assert [lock.acquire() for lock in locks] == [True, False, False]
+    assert locks[0].acquire() and locks[0].is_held()
+    assert not locks[1].is_held()
+    with open(path) as handle:
+        assert handle.read() == 'owner-0'
+
+    locks[0].release()
+    assert not locks[0].is_held()
+    assert [lock.acquire() for lock in locks[1:]] == [True, False]
+    with open(path) as handle:
+        assert handle.read() == 'owner-1'
+    locks[1].release()
+
+
+def wait_for(condition, seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.2)
+    return None
+
+
+def probe_runs(app):
+    with app.app_context():
+        runs = JobRun.query.filter_by(job='probe').order_by(JobRun.started_at, JobRun.id).all()
+        db.session.expunge_all()
+        return runs
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='kills the leader with SIGKILL')
+def test_single_leader_and_failover_across_processes(tmp_path):
+    database_uri = f"sqlite:///{tmp_path / 'scheduler.db'}"
+    lock_file = str(tmp_path / 'scheduler.lock')
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=database_uri)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=run_scheduler, args=(database_uri, lock_file, INTERVAL, RUN_SECONDS))
+        for _ in range(PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        # Let the first leader run the probe a few times, then kill it
+        assert wait_for(lambda: len(probe_runs(app)) >= 3, RUN_SECONDS / 2), 'no leader ran the probe'
+        leader = leader_pid(app)
+        assert len({run.owner for run in probe_runs(app)}) == 1
+        victims = [process for process in processes if process.pid == leader]
+        assert len(victims) == 1
+        victims[0].kill()
+        victims[0].join()
+
+        assert wait_for(lambda: leader_pid(app) != leader, RUN_SECONDS / 2), 'no standby took over'
+        new_leader = leader_pid(app)
+        taken_over = len(probe_runs(app))
+        assert wait_for(lambda: len(probe_runs(app)) >= taken_over + 2, RUN_SECONDS / 2)
+        # Read before the survivors stop, the last one standing may lead for a moment after that
+        runs = probe_runs(app)
+    finally:
+        for process in processes:
+            process.join(RUN_SECONDS + 10)
+            if process.is_alive():
+                process.kill()
+
+    finished = [run for run in probe_runs(app) if run.finished_at]
+    assert all(
+        current.started_at >= previous.finished_at
+        for previous, current in zip(finished, finished[1:])
+    ), 'probe runs overlapped'
+    # Leadership moves once, from the killed leader to one standby, and never back
+    owners = [run.owner for run in runs]
+    handovers = [owner for previous, owner in zip(owners, owners[1:]) if owner != previous]
+    assert len(handovers) == 1
+    assert int(owners[0].rsplit(':', 1)[1]) == leader
+    assert int(owners[-1].rsplit(':', 1)[1]) == new_leader
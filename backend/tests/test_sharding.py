@@ -0,0 +1,159 @@
+"""
+Sharding on three SQLite databases: home plus shard_1 and shard_2
+- use_shard sends statements on user-owned tables to the selected shard,
+  global tables (users, user_shards) stay on home
+- hash placement puts a new user on shards[user_id % 3] and records it
+- ShardRouter.move_user copies expenses, custom categories and stats,
+  flips the directory entry and removes the rows from the source
+"""
+import pytest
+from flask import Flask
+from sqlalchemy import func, select
+from config import Config
+from models import db, User, UserShard, Category, Expense, UserStats, seed_default_categories
+from utils import shard_router
+from utils.sharding import HOME_SHARD, shard_for_new_user, shard_names, use_shard
+from utils.shard_router import ShardRouter, get_shard_router, prepare_shards, shard_engine
+from scripts.move_user_shard import plan_rebalance
+
+SHARDS = ['home', 'shard_1', 'shard_2']
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    binds = {shard: f"sqlite:///{tmp_path / f'{shard}.db'}" for shard in SHARDS[1:]}
+    monkeypatch.setattr(Config, 'SQLALCHEMY_BINDS', binds)
+    monkeypatch.setattr(Config, 'SHARD_PLACEMENT', 'hash')
+    monkeypatch.setattr(shard_router, '_shard_router', None)
+
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'home.db'}", SQLALCHEMY_BINDS=binds)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all(bind_key=None)
+        seed_default_categories()
+        prepare_shards()
+        yield app
+        db.session.remove()
+
+
+def create_user(name):
+    user = User(name=name, email=f"{name}@example.com")
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def expense_owners(shard):
+    with shard_engine(shard).connect() as connection:
+        return dict(connection.execute(
+            select(Expense.user_id, func.count(Expense.id)).group_by(Expense.user_id)
+        ).all())
+
+
+def add_expenses(user_id, amounts, category=None):
+    for amount in amounts:
+        db.session.add(Expense(user_id=user_id, amount=amount, category_id=category.id if category else None))
+    db.session.commit()
+
+
+def test_shard_names_and_placement(app):
+    assert shard_names() == SHARDS
+    for user_id in range(1, 10):
+        assert shard_for_new_user(user_id) == SHARDS[user_id % 3]
+
+    users = [create_user(f"user{index}") for index in range(6)]
+    for user in users:
+        entry = db.session.get(UserShard, user.id)
+        expected = SHARDS[user.id % 3]
+        # Home users have no directory entry
+        assert (entry.shard if entry else HOME_SHARD) == expected
+        assert get_shard_router().lookup(user.id) == (expected, 'active')
+
+
+def test_home_placement(app, monkeypatch):
+    monkeypatch.setattr(Config, 'SHARD_PLACEMENT', 'home')
+    user = create_user('homebody')
+    assert db.session.get(UserShard, user.id) is None
+    assert get_shard_router().lookup(user.id) == (HOME_SHARD, 'active')
+
+
+def test_use_shard_routes_user_owned_tables(app):
+    user = create_user('router')
+    with use_shard('shard_1'):
+        category = Category(name='Boats', type='expense', user_id=user.id)
+        db.session.add(category)
+        db.session.commit()
+        add_expenses(user.id, [10.0, 20.0], category)
+        assert Expense.query.filter_by(user_id=user.id).count() == 2
+        # Global tables stay on home inside the block
+        assert db.session.get(User, user.id).name == 'router'
+        # Every shard has its own copy of the default categories
+        assert Category.query.filter_by(is_default=True, user_id=None).count() > 0
+
+    assert expense_owners('shard_1') == {user.id: 2}
+    assert expense_owners('home') == {}
+    assert expense_owners('shard_2') == {}
+    assert Expense.query.filter_by(user_id=user.id).count() == 0
+    with use_shard('shard_2'):
+        assert Category.query.filter_by(user_id=user.id).count() == 0
+
+
+def test_move_user(app):
+    users = [create_user(f"mover{index}") for index in range(3)]
+    user = next(candidate for candidate in users if get_shard_router().lookup(candidate.id)[0] == 'shard_1')
+    other = next(candidate for candidate in users if get_shard_router().lookup(candidate.id)[0] == HOME_SHARD)
+
+    with use_shard('shard_1'):
+        custom = Category(name='Boats', type='expense', user_id=user.id)
+        default = Category.query.filter_by(is_default=True, user_id=None, type='expense').first()
+        db.session.add(custom)
+        db.session.add(UserStats(user_id=user.id, expense_count=5, total_expense=150.0))
+        db.session.commit()
+        add_expenses(user.id, [10.0, 20.0, 30.0], custom)
+        add_expenses(user.id, [40.0, 50.0], default)
+        default_name = default.name
+    add_expenses(other.id, [1.0])
+
+    router = get_shard_router()
+    router.move_batch_size = 2
+    assert router.move_user(user.id, 'shard_2', wait=False) == 5
+
+    assert db.session.get(UserShard, user.id).shard == 'shard_2'
+    assert db.session.get(UserShard, user.id).status == 'active'
+    assert router.lookup(user.id) == ('shard_2', 'active')
+    assert expense_owners('shard_1') == {}
+    assert expense_owners('shard_2') == {user.id: 5}
+    assert expense_owners('home') == {other.id: 1}
+
+    with use_shard('shard_1'):
+        assert Category.query.filter_by(user_id=user.id).count() == 0
+        assert db.session.get(UserStats, user.id) is None
+    with use_shard('shard_2'):
+        expenses = Expense.query.filter_by(user_id=user.id).order_by(Expense.amount).all()
+        assert [expense.amount for expense in expenses] == [10.0, 20.0, 30.0, 40.0, 50.0]
+        # Custom categories get new ids, defaults are matched by type and name
+        assert {expense.category.name for expense in expenses[:3]} == {'Boats'}
+        assert expenses[0].category.user_id == user.id
+        assert all(expense.category.name == default_name and expense.category.is_default for expense in expenses[3:])
+        assert db.session.get(UserStats, user.id).total_expense == 150.0
+
+    assert router.loads() == {'home': {other.id: 1}, 'shard_1': {}, 'shard_2': {user.id: 5}}
+    assert router.move_user(user.id, 'shard_2', wait=False) == 0
+    with pytest.raises(ValueError):
+        router.move_user(user.id, 'shard_9', wait=False)
+
+
+def test_single_shard_router_answers_home(app):
+    router = ShardRouter([HOME_SHARD])
+    assert router.lookup(1) == (HOME_SHARD, 'active')
+    assert router.group_by_shard([1, 2]) == {HOME_SHARD: [1, 2]}
+
+
+def test_plan_rebalance():
+    loads = {'home': {1: 50, 2: 30, 3: 20}, 'shard_1': {4: 10}, 'shard_2': {}}
+    # 100/10/0 rows become 30/30/50, moving user 2 as well would overshoot
+    assert plan_rebalance(loads, max_moves=10) == [(1, 'home', 'shard_2', 50), (3, 'home', 'shard_1', 20)]
+    assert plan_rebalance(loads, max_moves=1) == [(1, 'home', 'shard_2', 50)]
+    assert loads['home'] == {1: 50, 2: 30, 3: 20}
+    assert plan_rebalance({'home': {1: 10}, 'shard_1': {2: 10}}, max_moves=10) == []
@@ -0,0 +1,99 @@
+"""
+t-digest accuracy and size against exact percentiles (np.quantile)
+Bounds, at the default compression on 200k values:
+- rank error (|share of values below the estimate - q|) under 0.001 for p50 to p99.9
+- value error under 0.5% for p50/p90, 1.5% for p99 and 5% for p99.9
+- at most 0.7 * compression centroids, so about 1 KB serialized
+"""
+import numpy as np
+import pytest
+from config import Config
+from utils.tdigest import TDigest
+
+COMPRESSION = Config.SKETCH_COMPRESSION
+SIZE = 200_000
+MONTHS = 12
+VALUE_ERRORS = {0.5: 0.005, 0.9: 0.005, 0.99: 0.015, 0.999: 0.05}
+MAX_RANK_ERROR = 0.001
+MAX_CENTROIDS = int(COMPRESSION * 0.7)
+MAX_BYTES = 29 + 8 * MAX_CENTROIDS  # header + 8 bytes per centroid
+
+DISTRIBUTIONS = {
+    'lognormal': lambda rng: rng.lognormal(5, 1, SIZE),
+    'exponential': lambda rng: rng.exponential(300, SIZE),
+    'uniform': lambda rng: rng.uniform(1, 2000, SIZE),
+}
+
+
+@pytest.fixture(scope='module', params=list(DISTRIBUTIONS))
+def values(request):
+    return DISTRIBUTIONS[request.param](np.random.default_rng(7))
+
+
+def digest_of(values):
+    digest = TDigest(COMPRESSION)
+    for value in values:
+        digest.add(value)
+    return digest
+
+
+def assert_accurate(digest, values):
+    ordered = np.sort(values)
+    for q, max_value_error in VALUE_ERRORS.items():
+        estimate = digest.quantile(q)
+        exact = np.quantile(values, q)
+        rank = np.searchsorted(ordered, estimate) / len(ordered)
+        assert abs(rank - q) <= MAX_RANK_ERROR, f"p{q * 100:g} rank {rank:.5f}"
+        assert abs(estimate - exact) / exact <= max_value_error, f"p{q * 100:g} {estimate} vs exact {exact}"
+    assert digest.min == ordered[0]
+    assert digest.max == ordered[-1]
+
+
+def assert_compact(digest):
+    assert digest.centroid_count <= MAX_CENTROIDS
+    assert len(digest.to_bytes()) <= MAX_BYTES
+
+
+def test_add(values):
+    digest = digest_of(values)
+    assert digest.count == len(values)
+    assert_accurate(digest, values)
+    assert_compact(digest)
+
+
+def test_merge_of_serialized_months(values):
+    # Like the analytics endpoint: one stored digest per month, merged on read
+    merged = TDigest(COMPRESSION)
+    for part in np.array_split(values, MONTHS):
+        stored = digest_of(part).to_bytes()
+        assert len(stored) <= MAX_BYTES
+        merged.merge(TDigest.from_bytes(stored))
+    assert merged.count == len(values)
+    assert_accurate(merged, values)
+    assert_compact(merged)
+
+
+def test_bytes_round_trip(values):
+    digest = digest_of(values[:20_000])
+    restored = TDigest.from_bytes(digest.to_bytes())
+    assert (restored.compression, restored.count, restored.min, restored.max) == (
+        digest.compression, digest.count, digest.min, digest.max
+    )
+    # Means are stored as float32
+    for q in VALUE_ERRORS:
+        assert restored.quantile(q) == pytest.approx(digest.quantile(q), rel=1e-6)
+    assert restored.to_bytes() == digest.to_bytes()
+
+
+def test_few_values_are_exact():
+    values = np.random.default_rng(7).lognormal(5, 1, 40)
+    digest = digest_of(values)
+    for q in (0.0, 0.1, 0.5, 0.9, 0.99, 1.0):
+        assert digest.quantile(q) == pytest.approx(np.quantile(values, q), rel=1e-12)
+
+
+def test_empty():
+    digest = TDigest(COMPRESSION)
+    assert digest.quantile(0.5) is None
+    assert TDigest.from_bytes(digest.to_bytes()).count == 0
+    assert digest_of([5.0]).merge(digest).quantile(0.5) == 5.0
@@ -0,0 +1,164 @@
+"""Duplicate and outlier detection over column arrays of many users' expenses.
+
+Only numpy and the standard library, so process pool workers start without
+the app. numpy is imported by the functions that use it, web workers only
+load it when they run a detection. A batch is a dict of equal-length arrays:
+    ids, user_ids   int64
+    kinds           int8, 0 expense, 1 income
+    categories      int64, 0 = uncategorized
+    amounts         float64
+    seconds         int64 epoch seconds of the expense date, NO_DATE if unset
+    descriptions    list of str or None
+"""
+import re
+from datetime import datetime
+
+NO_DATE = -2 ** 63  # smallest int64
+_EPOCH = datetime(1970, 1, 1)
+
+# Scale factor that makes the MAD of normally distributed data estimate its standard
+# deviation (Iglewicz & Hoaglin), and the one for the mean absolute deviation
+# used when more than half of a group has the same amount (MAD 0)
+_MAD_SCALE = 0.6745
+_MEAN_AD_SCALE = 0.7979
+
+_WORD = re.compile(r'[a-z]+')
+
+
+def build_batch(rows):
+    """Batch arrays from (id, user_id, type, category_id, amount, date, description) rows"""
+    import numpy as np
+    count = len(rows)
+    ids, user_ids, types, categories, amounts, dates, descriptions = zip(*rows) if count else ([],) * 7
+    # Float seconds with NaN for undated rows, several times faster than numpy's datetime parsing
+    seconds = np.fromiter(
+        (np.nan if date is None else (date - _EPOCH).total_seconds() for date in dates), np.float64, count
+    )
+    return {
+        'ids': np.fromiter(ids, np.int64, count),
+        'user_ids': np.fromiter(user_ids, np.int64, count),
+        'kinds': np.fromiter((expense_type == 'income' for expense_type in types), np.int8, count),
+        'categories': np.fromiter((category_id or 0 for category_id in categories), np.int64, count),
+        'amounts': np.fromiter(amounts, np.float64, count),
+        'seconds': np.where(np.isnan(seconds), NO_DATE, np.nan_to_num(seconds)).astype(np.int64),
+        'descriptions': list(descriptions)
+    }
+
+
+def _words(description):
+    return frozenset(_WORD.findall(description.lower())) if description else frozenset()
+
+
+def _jaccard(first, second):
+    """Similarity of two descriptions' word sets, digits and punctuation ignored
+    ('UBER *TRIP 8812' and 'Uber trip' match), 1.0 when both have none"""
+    union = first | second
+    return len(first & second) / len(union) if union else 1.0
+
+
+def find_duplicates(batch, window_seconds, min_similarity, max_lag=4):
+    """[(expense_id, earlier_expense_id, similarity, seconds_apart)] for rows with the same user, type
+    and amount (to the cent) as an earlier row at most window_seconds before, and a similar description.
+
+    Sorting by (user, type, cents, date) puts each hash bucket of (amount, date window) next to its
+    neighbouring windows, so candidates are the rows up to max_lag places back that are within the
+    window, found with array shifts. Only those few pairs have their descriptions compared.
+    """
+    import numpy as np
+    dated = batch['seconds'] != NO_DATE
+    if dated.sum() < 2:
+        return []
+    positions = np.flatnonzero(dated)
+    ids = batch['ids'][positions]
+    users = batch['user_ids'][positions]
+    kinds = batch['kinds'][positions]
+    cents = np.rint(batch['amounts'][positions] * 100).astype(np.int64)
+    seconds = batch['seconds'][positions]
+
+    order = np.lexsort((ids, seconds, cents, kinds, users))
+    ids, users, kinds, cents, seconds = ids[order], users[order], kinds[order], cents[order], seconds[order]
+    positions = positions[order]
+
+    descriptions = batch['descriptions']
+    words = {}
+    found = {}
+    for lag in range(1, min(max_lag, len(ids) - 1) + 1):
+        apart = seconds[lag:] - seconds[:-lag]
+        candidates = np.flatnonzero(
+            (users[lag:] == users[:-lag]) & (kinds[lag:] == kinds[:-lag]) &
+            (cents[lag:] == cents[:-lag]) & (apart <= window_seconds)
+        )
+        for index in candidates.tolist():
+            later = index + lag
+            if later in found:
+                continue  # already matched a nearer earlier row
+            first, second = positions[index], positions[later]
+            if first not in words:
+                words[first] = _words(descriptions[first])
+            if second not in words:
+                words[second] = _words(descriptions[second])
+            similarity = _jaccard(words[first], words[second])
+            if similarity >= min_similarity:
+                found[later] = (int(ids[later]), int(ids[index]), similarity, int(apart[index]))
+    return list(found.values())
+
+
+def find_outliers(batch, threshold, min_samples):
+    """[(expense_id, robust_z, category_median)] for amounts far above the rest of their user's
+    category (and type), by modified z-score of log amounts against the group median and MAD.
+
+    Log amounts because spending is roughly log-normal, a 10x coffee is as odd as a 10x rent.
+    Groups smaller than min_samples are skipped. Only unusually large amounts are flagged.
+    """
+    import numpy as np
+    positive = batch['amounts'] > 0
+    if not positive.any():
+        return []
+    positions = np.flatnonzero(positive)
+    ids = batch['ids'][positions]
+    users = batch['user_ids'][positions]
+    kinds = batch['kinds'][positions]
+    categories = batch['categories'][positions]
+    values = np.log(batch['amounts'][positions])
+
+    order = np.lexsort((values, categories, kinds, users))
+    ids, users, kinds, categories, values = ids[order], users[order], kinds[order], categories[order], values[order]
+
+    # Groups are contiguous runs after the sort, the median is the middle of each run
+    boundary = np.empty(len(values), dtype=bool)
+    boundary[0] = True
+    boundary[1:] = (users[1:] != users[:-1]) | (kinds[1:] != kinds[:-1]) | (categories[1:] != categories[:-1])
+    starts = np.flatnonzero(boundary)
+    sizes = np.diff(np.append(starts, len(values)))
+    low, high = starts + (sizes - 1) // 2, starts + sizes // 2
+    medians = (values[low] + values[high]) / 2
+    median_per_row = np.repeat(medians, sizes)
+
+    deviations = np.abs(values - median_per_row)
+    group_per_row = np.repeat(np.arange(len(starts)), sizes)
+    sorted_deviations = deviations[np.lexsort((deviations, group_per_row))]
+    mad = (sorted_deviations[low] + sorted_deviations[high]) / 2
+    mean_ad = np.add.reduceat(deviations, starts) / sizes
+
+    # Modified z-score, falling back to the mean absolute deviation where MAD is 0
+    spread = np.where(mad > 0, mad / _MAD_SCALE, mean_ad / _MEAN_AD_SCALE)
+    usable = (sizes >= min_samples) & (spread > 0)
+    spread_per_row = np.repeat(np.where(usable, spread, np.inf), sizes)
+    scores = (values - median_per_row) / spread_per_row
+
+    flagged = np.flatnonzero(scores > threshold)
+    return list(zip(
+        ids[flagged].tolist(),
+        scores[flagged].tolist(),
+        np.exp(median_per_row[flagged]).tolist()
+    ))
+
+
+def analyze_batch(batch, params):
+    """Both detectors over one batch, params as in TransactionFlagService.detection_params"""
+    return {
+        'duplicates': find_duplicates(
+            batch, params['duplicate_window_seconds'], params['duplicate_min_similarity'], params['duplicate_max_lag']
+        ),
+        'outliers': find_outliers(batch, params['outlier_threshold'], params['outlier_min_samples'])
+    }
@@ -0,0 +1,80 @@
+from models import db, AppMeta, seed_default_categories, default_expense_categories, default_income_categories
+from sqlalchemy.exc import SQLAlchemyError
+from utils.scheduler import build_leader_lock
+from utils.shard_router import create_missing_indexes, prepare_shards
+from utils.sharding import shard_names
+import hashlib
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+STAMP_KEY = 'schema_stamp'
+BOOTSTRAP_LOCK_TIMEOUT = 60  # seconds to wait for another process preparing the database
+
+
+def schema_stamp():
+    """Fingerprint of the models, default categories and shards, changes whenever any of them does"""
+    digest = hashlib.sha1()
+    for table in db.metadata.sorted_tables:
+        digest.update(table.name.encode('utf-8'))
+        for column in table.columns:
+            digest.update(f"{column.name}:{column.type}:{column.nullable}".encode('utf-8'))
+        for index in sorted(table.indexes, key=lambda index: index.name or ''):
+            digest.update(f"{index.name}".encode('utf-8'))
+    for name in default_expense_categories + default_income_categories:
+        digest.update(name.encode('utf-8'))
+    for shard in shard_names():
+        digest.update(shard.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def _stored_stamp():
+    try:
+        stamp = db.session.query(AppMeta.value).filter_by(key=STAMP_KEY).scalar()
+        db.session.commit()
+        return stamp
+    except SQLAlchemyError:
+        # First boot, app_meta does not exist yet
+        db.session.rollback()
+        return None
+
+
+def prepare_database(app):
+    """Create tables and seed defaults unless the stored stamp matches, return True if it did.
+
+    A booting worker normally costs a single primary-key read. When the
+    models changed, one process takes the bootstrap lock and does the work
+    while the others wait and then see the new stamp.
+    """
+    stamp = schema_stamp()
+    if _stored_stamp() == stamp:
+        return False
+
+    lock = build_leader_lock(app.config, f"bootstrap:{os.getpid()}", suffix='bootstrap')
+    deadline = time.monotonic() + BOOTSTRAP_LOCK_TIMEOUT
+    while not lock.acquire():
+        if time.monotonic() > deadline:
+            raise RuntimeError('Timed out waiting for another process to prepare the database')
+        time.sleep(0.2)
+    try:
+        if _stored_stamp() == stamp:
+            return False
+        started = time.perf_counter()
+        db.create_all(bind_key=None)
+        added = create_missing_indexes(db.engine, {table.name for table in db.metadata.sorted_tables})
+        if added:
+            logger.info(f"Created indexes {', '.join(added)}")
+        seed_default_categories()
+        prepare_shards()
+        meta = db.session.get(AppMeta, STAMP_KEY)
+        if meta is None:
+            db.session.add(AppMeta(key=STAMP_KEY, value=stamp))
+        else:
+            meta.value = stamp
+        db.session.commit()
+        logger.info(f"Prepared database for schema {stamp} in {time.perf_counter() - started:.2f}s")
+        return True
+    finally:
+        lock.release()
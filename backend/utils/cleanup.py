@@ -1,19 +1,106 @@
-from models import db, PendingUser, EmailVerification, PasswordResetToken, RateLimitLog, Expense, Category, User
+from models import db, PendingUser, EmailVerification, PasswordResetToken, RateLimitLog, Expense, Category, User, OutboxEmail, RevokedToken, CleanupCheckpoint, JobRun, DeletedUser, UserStats, IdempotencyRecord, ExpenseTombstone, StreamEvent, SpendingSketch, TransactionFlag, BackgroundJob
 from datetime import datetime, timedelta
 import logging
+import os
+import time
 from config import Config
+from utils.sharding import HOME_SHARD, SHARDED_TABLES, shard_names, use_shard
 
 logger = logging.getLogger(__name__)
 
+# Tables holding rows owned by a user, children before parents
+USER_OWNED_TABLES = [
+    ('expenses', Expense, Expense.user_id),
+    ('expense_tombstones', ExpenseTombstone, ExpenseTombstone.user_id),
+    ('spending_sketches', SpendingSketch, SpendingSketch.user_id),
+    ('transaction_flags', TransactionFlag, TransactionFlag.user_id),
+    ('categories', Category, Category.user_id),
+    ('reset_tokens', PasswordResetToken, PasswordResetToken.user_id),
+    ('background_jobs', BackgroundJob, BackgroundJob.user_id)
+]
+
+# Tombstones younger than this are left for the next run, so a delete committed
+# after a later tombstone id cannot slip behind the watermark
+TOMBSTONE_SETTLE_SECONDS = 60
+
 class CleanupService:
+    @staticmethod
+    def _delete_in_batches(task, model, *criteria, dependents=(), outerjoin=None):
+        """Delete rows matching criteria in primary-key batches, return the number deleted.
+
+        Each batch selects at most CLEANUP_BATCH_SIZE ids with a plain read,
+        deletes exactly those rows and commits, so locks and undo are held
+        for one small batch at a time. The last deleted id is checkpointed
+        with each batch so an interrupted run resumes where it stopped.
+        dependents is a list of (model, foreign key column) whose rows
+        referencing the batch are deleted first. outerjoin is an optional
+        (target, onclause) for anti-join criteria such as target.id IS NULL.
+        """
+        batch_size = Config.CLEANUP_BATCH_SIZE
+        pause = Config.CLEANUP_BATCH_PAUSE_SECONDS
+
+        checkpoint = db.session.get(CleanupCheckpoint, task)
+        if checkpoint is None:
+            checkpoint = CleanupCheckpoint(task=task, last_id=0, deleted=0)
+            db.session.add(checkpoint)
+        if checkpoint.last_id:
+            logger.info(f"Resuming {task} cleanup after id {checkpoint.last_id}")
+        else:
+            checkpoint.deleted = 0
+            checkpoint.started_at = datetime.utcnow()
+        db.session.commit()
+
+        total = 0
+        batches = 0
+        slowest = 0.0
+        while True:
+            started = time.perf_counter()
+            query = db.session.query(model.id)
+            if outerjoin is not None:
+                query = query.outerjoin(*outerjoin)
+            ids = [row[0] for row in query.filter(
+                model.id > checkpoint.last_id, *criteria
+            ).order_by(model.id).limit(batch_size).all()]
+            if not ids:
+                break
+
+            for dependent, column in dependents:
+                dependent.query.filter(column.in_(ids)).delete(synchronize_session=False)
+            # Criteria are re-checked so rows that stopped matching since the read are kept,
+            # anti-join criteria refer to the joined table and are trusted as read
+            recheck = criteria if outerjoin is None else ()
+            count = model.query.filter(model.id.in_(ids), *recheck).delete(synchronize_session=False)
+            checkpoint.last_id = ids[-1]
+            checkpoint.deleted += count
+            db.session.commit()
+
+            elapsed = time.perf_counter() - started
+            slowest = max(slowest, elapsed)
+            batches += 1
+            total += count
+            logger.info(f"Cleanup {task}: batch {batches} deleted {count} rows up to id {ids[-1]} in {elapsed * 1000:.1f} ms")
+            if len(ids) < batch_size:
+                break
+            time.sleep(pause)
+
+        checkpoint.last_id = 0
+        checkpoint.completed_at = datetime.utcnow()
+        db.session.commit()
+        if batches:
+            logger.info(f"Cleanup {task}: {total} rows in {batches} batches, slowest batch {slowest * 1000:.1f} ms")
+        return total
+
     @staticmethod
     def cleanup_expired_pending_users():
         """Remove expired pending users and their verification codes"""
         try:
             expiration_time = datetime.utcnow() - timedelta(hours=Config.PENDING_USER_EXPIRY_HOURS)
-            count = PendingUser.query.filter(PendingUser.created_at < expiration_time).delete()
-            # Verification codes are automatically deleted via cascade in models.py
-            db.session.commit()
+            # Bulk deletes skip the ORM cascade, so verification codes go first
+            count = CleanupService._delete_in_batches(
+                'pending_users', PendingUser,
+                PendingUser.created_at < expiration_time,
+                dependents=[(EmailVerification, EmailVerification.pending_user_id)]
+            )
             logger.info(f"Cleaned up {count} expired pending users")
             return count
         except Exception as e:
@@ -25,10 +112,10 @@ class CleanupService:
     def cleanup_expired_verification_codes():
         """Remove expired email verification codes"""
         try:
-            count = EmailVerification.query.filter(
+            count = CleanupService._delete_in_batches(
+                'verification_codes', EmailVerification,
                 EmailVerification.expires_at < datetime.utcnow()
-            ).delete()
-            db.session.commit()
+            )
             logger.info(f"Cleaned up {count} expired verification codes")
             return count
         except Exception as e:
@@ -40,11 +127,11 @@ class CleanupService:
     def cleanup_expired_reset_tokens():
         """Remove expired or used password reset tokens"""
         try:
-            count = PasswordResetToken.query.filter(
+            count = CleanupService._delete_in_batches(
+                'reset_tokens', PasswordResetToken,
                 (PasswordResetToken.expires_at < datetime.utcnow()) | 
                 (PasswordResetToken.is_used == True)
-            ).delete()
-            db.session.commit()
+            )
             logger.info(f"Cleaned up {count} expired or used password reset tokens")
             return count
         except Exception as e:
@@ -57,8 +144,10 @@ class CleanupService:
         """Remove rate limit logs older than 1 day"""
         try:
             expiration_time = datetime.utcnow() - timedelta(days=1)
-            count = RateLimitLog.query.filter(RateLimitLog.attempt_time < expiration_time).delete()
-            db.session.commit()
+            count = CleanupService._delete_in_batches(
+                'rate_limit_logs', RateLimitLog,
+                RateLimitLog.attempt_time < expiration_time
+            )
             logger.info(f"Cleaned up {count} old rate limit logs")
             return count
         except Exception as e:
@@ -67,13 +156,194 @@ class CleanupService:
             return 0
 
     @staticmethod
-    def cleanup_orphaned_expenses():
-        """Remove expenses with non-existent users"""
+    def cleanup_expired_revoked_tokens():
+        """Remove revocations of tokens that have expired anyway"""
+        try:
+            count = CleanupService._delete_in_batches(
+                'revoked_tokens', RevokedToken,
+                RevokedToken.expires_at < datetime.utcnow()
+            )
+            logger.info(f"Cleaned up {count} expired revoked tokens")
+            return count
+        except Exception as e:
+            logger.error(f"Error cleaning up revoked tokens: {str(e)}")
+            db.session.rollback()
+            return 0
+
+    @staticmethod
+    def cleanup_expired_idempotency_keys():
+        """Remove idempotency keys past their replay window"""
+        try:
+            expiration_time = datetime.utcnow() - timedelta(hours=Config.IDEMPOTENCY_KEY_TTL_HOURS)
+            count = CleanupService._delete_in_batches(
+                'idempotency_keys', IdempotencyRecord,
+                IdempotencyRecord.created_at < expiration_time
+            )
+            logger.info(f"Cleaned up {count} expired idempotency keys")
+            return count
+        except Exception as e:
+            logger.error(f"Error cleaning up idempotency keys: {str(e)}")
+            db.session.rollback()
+            return 0
+
+    @staticmethod
+    def cleanup_old_stream_events():
+        """Remove broadcast stream events every worker has picked up long ago"""
+        try:
+            expiration_time = datetime.utcnow() - timedelta(minutes=Config.SSE_EVENT_RETENTION_MINUTES)
+            count = CleanupService._delete_in_batches(
+                'stream_events', StreamEvent,
+                StreamEvent.created_at < expiration_time
+            )
+            logger.info(f"Cleaned up {count} old stream events")
+            return count
+        except Exception as e:
+            logger.error(f"Error cleaning up stream events: {str(e)}")
+            db.session.rollback()
+            return 0
+
+    @staticmethod
+    def cleanup_old_expense_tombstones():
+        """Remove expense tombstones older than any sync token still accepted, on every shard"""
+        try:
+            expiration_time = datetime.utcnow() - timedelta(days=Config.EXPENSE_TOMBSTONE_RETENTION_DAYS)
+            count = 0
+            for shard in shard_names():
+                with use_shard(shard):
+                    count += CleanupService._delete_in_batches(
+                        'expense_tombstones' if shard == HOME_SHARD else f"expense_tombstones_{shard}",
+                        ExpenseTombstone,
+                        ExpenseTombstone.deleted_at < expiration_time
+                    )
+            logger.info(f"Cleaned up {count} old expense tombstones")
+            return count
+        except Exception as e:
+            logger.error(f"Error cleaning up expense tombstones: {str(e)}")
+            db.session.rollback()
+            return 0
+
+    @staticmethod
+    def cleanup_old_outbox_emails():
+        """Remove sent or permanently failed outbox emails older than the retention period"""
         try:
-            count = Expense.query.filter(~Expense.user_id.in_(
-                db.session.query(User.id)
-            )).delete(synchronize_session=False)
+            expiration_time = datetime.utcnow() - timedelta(days=Config.MAIL_OUTBOX_RETENTION_DAYS)
+            count = CleanupService._delete_in_batches(
+                'outbox_emails', OutboxEmail,
+                OutboxEmail.status.in_(['sent', 'failed']),
+                OutboxEmail.created_at < expiration_time
+            )
+            logger.info(f"Cleaned up {count} old outbox emails")
+            return count
+        except Exception as e:
+            logger.error(f"Error cleaning up outbox emails: {str(e)}")
+            db.session.rollback()
+            return 0
+
+    @staticmethod
+    def cleanup_old_job_runs():
+        """Remove scheduler run history older than the retention period"""
+        try:
+            expiration_time = datetime.utcnow() - timedelta(days=Config.SCHEDULER_HISTORY_DAYS)
+            count = CleanupService._delete_in_batches(
+                'job_runs', JobRun,
+                JobRun.started_at < expiration_time
+            )
+            logger.info(f"Cleaned up {count} old scheduler job runs")
+            return count
+        except Exception as e:
+            logger.error(f"Error cleaning up scheduler job runs: {str(e)}")
+            db.session.rollback()
+            return 0
+
+    @staticmethod
+    def cleanup_old_background_jobs():
+        """Remove finished background jobs and export files older than the retention period"""
+        try:
+            expiration_time = datetime.utcnow() - timedelta(days=Config.JOBS_RETENTION_DAYS)
+            count = CleanupService._delete_in_batches(
+                'background_jobs', BackgroundJob,
+                BackgroundJob.finished_at < expiration_time
+            )
+            files = 0
+            if os.path.isdir(Config.JOBS_EXPORT_DIR):
+                cutoff = time.time() - Config.JOBS_RETENTION_DAYS * 86400
+                for entry in os.scandir(Config.JOBS_EXPORT_DIR):
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        files += 1
+            logger.info(f"Cleaned up {count} old background jobs and {files} export files")
+            return count
+        except Exception as e:
+            logger.error(f"Error cleaning up background jobs: {str(e)}")
+            db.session.rollback()
+            return 0
+
+    @staticmethod
+    def cleanup_deleted_users():
+        """Remove rows owned by users deleted since the last run, driven by deleted_users tombstones"""
+        try:
+            checkpoint = db.session.get(CleanupCheckpoint, 'deleted_users')
+            if checkpoint is None:
+                checkpoint = CleanupCheckpoint(task='deleted_users', last_id=0, deleted=0)
+                db.session.add(checkpoint)
+                db.session.commit()
+
+            count = 0
+            users = 0
+            settled = datetime.utcnow() - timedelta(seconds=TOMBSTONE_SETTLE_SECONDS)
+            while True:
+                tombstones = DeletedUser.query.filter(
+                    DeletedUser.id > checkpoint.last_id,
+                    DeletedUser.deleted_at < settled
+                ).order_by(DeletedUser.id).limit(Config.CLEANUP_BATCH_SIZE).all()
+                if not tombstones:
+                    break
+
+                user_ids = {tombstone.user_id for tombstone in tombstones}
+                # SQLite may hand a deleted user's id to a new account, never touch a live user
+                user_ids -= {row[0] for row in db.session.query(User.id).filter(User.id.in_(user_ids))}
+                if user_ids:
+                    # A user's rows may sit on any shard, e.g. left behind by an interrupted move
+                    for shard in shard_names():
+                        with use_shard(shard):
+                            for table, model, column in USER_OWNED_TABLES:
+                                if shard == HOME_SHARD:
+                                    task = f"deleted_user_{table}"
+                                elif model.__tablename__ in SHARDED_TABLES:
+                                    task = f"deleted_user_{table}_{shard}"
+                                else:
+                                    continue
+                                count += CleanupService._delete_in_batches(task, model, column.in_(user_ids))
+                            count += UserStats.query.filter(UserStats.user_id.in_(user_ids)).delete(synchronize_session=False)
+
+                checkpoint.last_id = tombstones[-1].id
+                checkpoint.deleted = count
+                checkpoint.completed_at = datetime.utcnow()
+                db.session.commit()
+                users += len(tombstones)
+
+            expiration_time = datetime.utcnow() - timedelta(days=Config.DELETED_USER_RETENTION_DAYS)
+            DeletedUser.query.filter(
+                DeletedUser.id <= checkpoint.last_id,
+                DeletedUser.deleted_at < expiration_time
+            ).delete(synchronize_session=False)
             db.session.commit()
+            logger.info(f"Cleaned up {count} rows of {users} deleted users")
+            return count
+        except Exception as e:
+            logger.error(f"Error cleaning up deleted users: {str(e)}")
+            db.session.rollback()
+            return 0
+
+    @staticmethod
+    def cleanup_orphaned_expenses():
+        """Remove expenses with non-existent users (full LEFT JOIN ... IS NULL pass)"""
+        try:
+            count = CleanupService._delete_in_batches(
+                'orphaned_expenses', Expense,
+                User.id.is_(None),
+                outerjoin=(User, User.id == Expense.user_id)
+            )
             logger.info(f"Cleaned up {count} orphaned expenses")
             return count
         except Exception as e:
@@ -85,13 +355,12 @@ class CleanupService:
     def cleanup_orphaned_categories():
         """Remove user-specific categories with non-existent users (preserve default categories)"""
         try:
-            # Only delete categories that have a user_id (not default categories) 
-            # AND where that user no longer exists
-            count = Category.query.filter(
+            count = CleanupService._delete_in_batches(
+                'orphaned_categories', Category,
                 Category.user_id.isnot(None),  # Only check user-specific categories
-                ~Category.user_id.in_(db.session.query(User.id))  # User doesn't exist
-            ).delete(synchronize_session=False)
-            db.session.commit()
+                User.id.is_(None),  # User doesn't exist
+                outerjoin=(User, User.id == Category.user_id)
+            )
             logger.info(f"Cleaned up {count} orphaned categories")
             return count
         except Exception as e:
@@ -99,6 +368,18 @@ class CleanupService:
             db.session.rollback()
             return 0
 
+    @staticmethod
+    def verify_orphans():
+        """Occasional full pass for orphans the tombstones missed (bulk deletes, old schemas).
+        Home shard only, other shards have no users table to join and rely on the tombstones."""
+        results = {
+            'orphaned_expenses': CleanupService.cleanup_orphaned_expenses(),
+            'orphaned_categories': CleanupService.cleanup_orphaned_categories()
+        }
+        if any(results.values()):
+            logger.warning(f"Orphan verification found rows missed by deleted user cleanup: {results}")
+        return results
+
     @staticmethod
     def run_all_cleanup_tasks():
         """Run all cleanup tasks and return results"""
@@ -108,8 +389,14 @@ class CleanupService:
                 'verification_codes': CleanupService.cleanup_expired_verification_codes(),
                 'reset_tokens': CleanupService.cleanup_expired_reset_tokens(),
                 'rate_limit_logs': CleanupService.cleanup_old_rate_limit_logs(),
-                'orphaned_expenses': CleanupService.cleanup_orphaned_expenses(),
-                'orphaned_categories': CleanupService.cleanup_orphaned_categories()
+                'outbox_emails': CleanupService.cleanup_old_outbox_emails(),
+                'revoked_tokens': CleanupService.cleanup_expired_revoked_tokens(),
+                'job_runs': CleanupService.cleanup_old_job_runs(),
+                'background_jobs': CleanupService.cleanup_old_background_jobs(),
+                'idempotency_keys': CleanupService.cleanup_expired_idempotency_keys(),
+                'expense_tombstones': CleanupService.cleanup_old_expense_tombstones(),
+                'stream_events': CleanupService.cleanup_old_stream_events(),
+                'deleted_users': CleanupService.cleanup_deleted_users()
             }
             logger.info(f"Cleanup results: {results}")
             return results
@@ -0,0 +1,73 @@
+from models import db, Expense, visible_categories
+from datetime import datetime
+from sqlalchemy import case, func
+from utils.user_stats import UserStatsService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(moment, months_back=0):
+    month = moment.year * 12 + moment.month - 1 - months_back
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+def _empty_totals():
+    return {'expense': 0.0, 'income': 0.0, 'count': 0}
+
+
+def build_dashboard(user_id, recent=5, now=None):
+    """Everything the dashboards show, in four queries on one session (and connection).
+
+    Recent transactions (ix_expenses_user_date), the category list, one
+    grouped aggregate over this and last month for period and category
+    totals, and the maintained user_stats row. None if the user is gone.
+    """
+    user_id = int(user_id)
+    now = now or datetime.utcnow()
+    this_month = month_start(now)
+    last_month = month_start(now, 1)
+
+    stats = UserStatsService.get(user_id)
+    if stats is None:
+        return None
+
+    recent_expenses = Expense.query.filter(Expense.user_id == user_id).order_by(
+        Expense.date.desc(), Expense.id.desc()
+    ).limit(recent).all()
+
+    categories = visible_categories(user_id)
+
+    period = case((Expense.date >= this_month, 'this_month'), else_='last_month')
+    rows = db.session.query(
+        period, Expense.type, Expense.category_id, func.sum(Expense.amount), func.count(Expense.id)
+    ).filter(
+        Expense.user_id == user_id,
+        Expense.date >= last_month
+    ).group_by(period, Expense.type, Expense.category_id).all()
+
+    totals = {'this_month': _empty_totals(), 'last_month': _empty_totals()}
+    by_category = []
+    for period_name, expense_type, category_id, amount, count in rows:
+        expense_type = expense_type or 'expense'
+        totals[period_name][expense_type] += amount or 0.0
+        totals[period_name]['count'] += count
+        if period_name == 'this_month':
+            by_category.append({
+                'category_id': category_id, 'type': expense_type, 'total': round(amount or 0.0, 2), 'count': count
+            })
+    for period_totals in totals.values():
+        period_totals['expense'] = round(period_totals['expense'], 2)
+        period_totals['income'] = round(period_totals['income'], 2)
+        period_totals['balance'] = round(period_totals['income'] - period_totals['expense'], 2)
+    by_category.sort(key=lambda entry: -entry['total'])
+
+    return {
+        'recent_transactions': [expense.to_dict() for expense in recent_expenses],
+        'categories': [category.to_dict() for category in categories],
+        'totals': totals,
+        'category_totals': by_category,
+        'stats': stats.to_dict(),
+        'period_starts': {'this_month': this_month.isoformat(), 'last_month': last_month.isoformat()},
+        'generated_at': now.isoformat()
+    }
@@ -0,0 +1,130 @@
+from models import Expense, ExpenseTombstone
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_
+from utils.sharding import current_shard
+import base64
+import binascii
+import json
+from config import Config
+
+TOKEN_VERSION = 1
+EPOCH = datetime(1970, 1, 1)
+
+
+class SyncTokenError(ValueError):
+    """The since token is not one this server issued"""
+
+
+class SyncTokenExpired(Exception):
+    """The since token can no longer be answered with a delta, the client must reload everything"""
+
+
+def encode_token(cursor):
+    payload = {
+        'v': TOKEN_VERSION,
+        's': cursor['shard'],
+        'e': [cursor['changes'][0].isoformat(), cursor['changes'][1]],
+        'd': [cursor['deleted'][0].isoformat(), cursor['deleted'][1]]
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_token(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        if payload['v'] != TOKEN_VERSION:
+            raise SyncTokenExpired()
+        return {
+            'shard': str(payload['s']),
+            'changes': (datetime.fromisoformat(payload['e'][0]), int(payload['e'][1])),
+            'deleted': (datetime.fromisoformat(payload['d'][0]), int(payload['d'][1]))
+        }
+    except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, IndexError, TypeError):
+        raise SyncTokenError('Invalid sync token')
+
+
+def _page(query, time_column, id_column, position, limit):
+    """Rows strictly after (time, id) in (time, id) order, and whether more remain"""
+    watermark, last_id = position
+    rows = query.filter(or_(
+        time_column > watermark,
+        and_(time_column == watermark, id_column > last_id)
+    )).order_by(time_column, id_column).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
+def _next_position(position, last_seen, has_more, safe):
+    """Where the next request resumes.
+
+    Transactions commit a little after they stamp their rows, so a row
+    stamped just before the newest one sent may not be visible yet. Once
+    caught up the watermark is held back to `safe`, and the rows after it
+    are sent again next time (clients upsert by id). Mid-backlog pages
+    resume exactly, otherwise a burst inside the overlap would never end.
+    """
+    if last_seen is not None:
+        position = last_seen
+    if has_more or position[0] <= safe:
+        return position
+    return (safe, 0)
+
+
+def fetch_changes(user_id, token=None, limit=None):
+    """Expenses created or updated, and ids deleted, since token.
+
+    Without a token every expense is a change (initial load) and deletions
+    are tracked from now on. Raises SyncTokenError for a malformed token and
+    SyncTokenExpired when the tombstones it needs may have been cleaned up,
+    or it was issued by another shard (the user moved and ids changed).
+    """
+    limit = limit or Config.SYNC_PAGE_SIZE
+    now = datetime.utcnow()
+    safe = now - timedelta(seconds=Config.SYNC_OVERLAP_SECONDS)
+    shard = current_shard()
+
+    if token:
+        cursor = decode_token(token)
+        retained = now - timedelta(days=Config.EXPENSE_TOMBSTONE_RETENTION_DAYS)
+        if cursor['shard'] != shard or cursor['deleted'][0] < retained:
+            raise SyncTokenExpired()
+    else:
+        cursor = {'shard': shard, 'changes': (EPOCH, 0), 'deleted': (safe, 0)}
+
+    expenses, more_changes = _page(
+        Expense.query.filter(Expense.user_id == user_id),
+        Expense.updated_at, Expense.id, cursor['changes'], limit
+    )
+    tombstones, more_deleted = _page(
+        ExpenseTombstone.query.filter(ExpenseTombstone.user_id == user_id),
+        ExpenseTombstone.deleted_at, ExpenseTombstone.id, cursor['deleted'], limit
+    )
+
+    deleted_ids = [tombstone.expense_id for tombstone in tombstones]
+    if deleted_ids:
+        # SQLite hands the id of a deleted last row out again, the live row wins
+        reused = {row.id for row in Expense.query.with_entities(Expense.id).filter(
+            Expense.user_id == user_id, Expense.id.in_(deleted_ids)
+        )}
+        deleted_ids = [expense_id for expense_id in deleted_ids if expense_id not in reused]
+
+    next_cursor = {
+        'shard': shard,
+        'changes': _next_position(
+            cursor['changes'],
+            (expenses[-1].updated_at, expenses[-1].id) if expenses else None,
+            more_changes, safe
+        ),
+        'deleted': _next_position(
+            cursor['deleted'],
+            (tombstones[-1].deleted_at, tombstones[-1].id) if tombstones else None,
+            more_deleted, safe
+        )
+    }
+    return {
+        'changes': [expense.to_dict() for expense in expenses],
+        'deleted': deleted_ids,
+        'next_token': encode_token(next_cursor),
+        'has_more': more_changes or more_deleted
+    }
@@ -0,0 +1,191 @@
+from array import array
+from hashlib import blake2b
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Index file layout: header, then an open-addressing table of native-endian
+# uint64 domain hashes (0 marks an empty slot)
+_MAGIC = b'DDIX'
+_VERSION = 1
+_HEADER = struct.Struct('<4sIB7xQQd')  # magic, version, little-endian flag, count, slots, source mtime
+_LITTLE = 1 if sys.byteorder == 'little' else 0
+
+
+def domain_hash(domain):
+    value = int.from_bytes(blake2b(domain.encode('utf-8'), digest_size=8).digest(), 'little')
+    return value or 1
+
+
+def read_domains(path):
+    """Normalized domains from a blocklist file, ignoring blanks and # comments"""
+    domains = set()
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            domain = line.split('#', 1)[0].strip().lower().rstrip('.')
+            if domain:
+                domains.add(domain)
+    return domains
+
+
+def build_index(source_path, index_path):
+    """Compile the blocklist into a hash table file, replaced atomically"""
+    source_mtime = os.stat(source_path).st_mtime
+    hashes = {domain_hash(domain) for domain in read_domains(source_path)}
+
+    slots = 8
+    while slots < len(hashes) * 2:  # load factor <= 0.5 keeps probe chains short
+        slots *= 2
+    mask = slots - 1
+    table = array('Q', bytes(8 * slots))
+    for value in hashes:
+        position = value & mask
+        while table[position]:
+            position = (position + 1) & mask
+        table[position] = value
+
+    directory = os.path.dirname(os.path.abspath(index_path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.disposable-', suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            output.write(_HEADER.pack(_MAGIC, _VERSION, _LITTLE, len(hashes), slots, source_mtime))
+            table.tofile(output)
+        os.replace(temp_path, index_path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+    return len(hashes)
+
+
+class _MappedIndex:
+    """One memory-mapped index file. Pages live in the OS page cache, so
+    every worker process mapping the same file shares one copy."""
+
+    def __init__(self, index_path):
+        with open(index_path, 'rb') as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, little, count, slots, source_mtime = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _VERSION or little != _LITTLE:
+            raise ValueError(f"Incompatible disposable domain index {index_path}")
+        self.count = count
+        self.slots = slots
+        self.source_mtime = source_mtime
+        self.size_bytes = len(self._map)
+        self._table = memoryview(self._map)[_HEADER.size:].cast('Q')
+        self._mask = slots - 1
+
+    def __contains__(self, value):
+        table, mask = self._table, self._mask
+        position = value & mask
+        while True:
+            slot = table[position]
+            if slot == value:
+                return True
+            if not slot:
+                return False
+            position = (position + 1) & mask
+
+
+class DisposableDomainIndex:
+    """Suffix lookup of email domains against a large blocklist file.
+
+    ``contains('mx.mail.yopmail.com')`` checks the hashes of
+    'mx.mail.yopmail.com', 'mail.yopmail.com' and 'yopmail.com', so the
+    cost is one O(1) table probe per label regardless of list size. The
+    compiled index is rebuilt and remapped when the source file changes.
+    """
+
+    def __init__(self, source_path, index_path=None, reload_seconds=60):
+        self.source_path = source_path
+        self.index_path = index_path or source_path + '.idx'
+        self.reload_seconds = reload_seconds
+        self._index = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Map the compiled index, rebuilding it first if the source is newer"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                source_mtime = os.stat(self.source_path).st_mtime
+            except OSError:
+                logger.warning(f"Disposable domain list {self.source_path} not found")
+                return
+            current = self._index
+            if current is not None and current.source_mtime == source_mtime:
+                return
+            try:
+                index = _MappedIndex(self.index_path)
+                if index.source_mtime != source_mtime:
+                    index = None
+            except (OSError, ValueError):
+                index = None
+            if index is None:
+                started = time.perf_counter()
+                try:
+                    count = build_index(self.source_path, self.index_path)
+                except PermissionError:
+                    # Read-only deployment directory, keep the compiled index in the temp dir
+                    self.index_path = os.path.join(tempfile.gettempdir(), 'expense-tracker-disposable-domains.idx')
+                    count = build_index(self.source_path, self.index_path)
+                index = _MappedIndex(self.index_path)
+                logger.info(f"Built disposable domain index with {count} domains "
+                            f"in {time.perf_counter() - started:.2f}s")
+            # Swap by reference, lookups in flight keep the old mapping alive
+            self._index = index
+
+    def _maybe_reload(self):
+        if time.monotonic() - self._checked_at >= self.reload_seconds:
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Error reloading disposable domain list: {str(e)}")
+
+    def contains(self, domain):
+        """True if the domain or any parent domain is on the blocklist"""
+        self._maybe_reload()
+        index = self._index
+        if index is None or not domain:
+            return False
+        labels = domain.lower().rstrip('.').split('.')
+        # Stop before the bare TLD, 'com' on its own is never a listed domain
+        for start in range(len(labels) - 1):
+            if domain_hash('.'.join(labels[start:])) in index:
+                return True
+        return False
+
+    def stats(self):
+        index = self._index
+        return {
+            'domains': index.count if index else 0,
+            'slots': index.slots if index else 0,
+            'mapped_bytes': index.size_bytes if index else 0
+        }
+
+
+_domain_index = None
+_domain_index_lock = threading.Lock()
+
+
+def get_disposable_domain_index():
+    """Process-wide index of Config.DISPOSABLE_DOMAINS_FILE, loaded on first use"""
+    global _domain_index
+    if _domain_index is None:
+        with _domain_index_lock:
+            if _domain_index is None:
+                _domain_index = DisposableDomainIndex(
+                    Config.DISPOSABLE_DOMAINS_FILE,
+                    index_path=Config.DISPOSABLE_DOMAINS_INDEX_FILE,
+                    reload_seconds=Config.DISPOSABLE_DOMAINS_RELOAD_SECONDS
+                )
+    return _domain_index
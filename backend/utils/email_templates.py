@@ -0,0 +1,89 @@
+from collections import namedtuple
+from datetime import datetime
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+
+RenderedEmail = namedtuple('RenderedEmail', ['subject', 'html', 'body'])
+
+
+class EmailRenderer:
+    """Renders transactional emails from Jinja2 templates.
+
+    Every email type has an HTML and a plain-text template under
+    templates/email/. All of them are compiled when the renderer is built
+    and kept for the life of the process, so rendering is just running the
+    compiled template code.
+    """
+
+    # Email type -> subject line. A new notification type only needs an
+    # entry here plus templates/email/<type>.html and <type>.txt
+    SUBJECTS = {
+        'verification': 'Verify Your Email - {app_name}',
+        'password_reset': 'Reset Your Password - {app_name}',
+    }
+
+    def __init__(self, template_dir=TEMPLATE_DIR, app_name='ExpenseTracker'):
+        self.app_name = app_name
+        self.env = Environment(
+            loader=FileSystemLoader(template_dir),
+            autoescape=select_autoescape(enabled_extensions=('html',), default_for_string=False),
+            undefined=StrictUndefined,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            auto_reload=False,
+            cache_size=-1
+        )
+        self._templates = {
+            name: (
+                self.env.get_template(f"email/{name}.html"),
+                self.env.get_template(f"email/{name}.txt")
+            )
+            for name in self.SUBJECTS
+        }
+        logger.info(f"Compiled {len(self._templates)} email templates")
+
+    def _base_context(self):
+        return {'app_name': self.app_name, 'year': datetime.utcnow().year}
+
+    def render(self, template_name, **context):
+        """Render one email, returns RenderedEmail(subject, html, body)"""
+        html_template, text_template = self._templates[template_name]
+        values = self._base_context()
+        values.update(context)
+        return RenderedEmail(
+            self.SUBJECTS[template_name].format(app_name=self.app_name),
+            html_template.render(values),
+            text_template.render(values)
+        )
+
+    def render_batch(self, template_name, contexts):
+        """Render the same email type for many recipients"""
+        html_template, text_template = self._templates[template_name]
+        subject = self.SUBJECTS[template_name].format(app_name=self.app_name)
+        base = self._base_context()
+        rendered = []
+        for context in contexts:
+            values = dict(base)
+            values.update(context)
+            rendered.append(RenderedEmail(subject, html_template.render(values), text_template.render(values)))
+        return rendered
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_email_renderer():
+    """Process-wide renderer, templates are compiled on first call"""
+    global _renderer
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                _renderer = EmailRenderer()
+    return _renderer
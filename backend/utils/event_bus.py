@@ -0,0 +1,289 @@
+from models import db, StreamEvent
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from utils.sqlite_engine import mark_reader
+import json
+import logging
+import queue
+import threading
+import uuid
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class StreamLimitExceeded(Exception):
+    """No room for another event stream, per user or for this process"""
+
+
+class Subscription:
+    """One open event stream. Events wait in a bounded queue until the stream writes them."""
+
+    def __init__(self, user_id, queue_size):
+        self.user_id = user_id
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=queue_size)
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            # A client this far behind reloads through delta sync instead
+            self.overflowed = True
+            return False
+
+    def get(self, timeout):
+        """Next event, or None when nothing arrived within timeout"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LocalBroadcaster:
+    """Single-process deployments: every subscriber lives in this process"""
+
+    def start(self, bus):
+        pass
+
+    def send(self, user_id, event):
+        pass
+
+    def stop(self):
+        pass
+
+    def stats(self):
+        return {'kind': 'local'}
+
+
+class DatabaseBroadcaster:
+    """Fans events out across worker processes through the stream_events table.
+
+    One thread per process inserts the events published here in a single
+    short transaction, then reads the rows added since the last poll (by
+    primary key, like the token revocation list) and hands other processes'
+    events to local subscribers. Ids can commit out of order, so rows
+    younger than settle_seconds are read again on the next polls and
+    delivered once, by id. Events reach other workers within poll_seconds;
+    rows are cleaned up after SSE_EVENT_RETENTION_MINUTES.
+    """
+
+    def __init__(self, app, poll_seconds=1.0, batch_size=500, settle_seconds=5):
+        self.app = app
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.settle_seconds = settle_seconds
+        self.origin = uuid.uuid4().hex
+        self._outgoing = queue.Queue()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._last_id = None  # every row up to here is settled and was handled
+        self._seen = set()  # ids above _last_id handled already
+        self.sent = 0
+        self.received = 0
+
+    def start(self, bus):
+        if self._thread:
+            return
+        with self._start_lock:
+            if self._thread:
+                return
+            self._bus = bus
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='event-broadcaster', daemon=True)
+            self._thread.start()
+        logger.info(f"Started database event broadcaster (poll every {self.poll_seconds}s)")
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def send(self, user_id, event):
+        self._outgoing.put((user_id, event))
+
+    def _run(self):
+        while not self._stopping.is_set():
+            with self.app.app_context():
+                # Polls only read, and _flush's transactions start with their INSERT
+                mark_reader(db.session)
+                try:
+                    self._flush()
+                    self._poll()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Event broadcaster error: {str(e)}")
+            self._stopping.wait(self.poll_seconds)
+
+    def _flush(self):
+        rows = []
+        while len(rows) < self.batch_size:
+            try:
+                user_id, event = self._outgoing.get_nowait()
+            except queue.Empty:
+                break
+            rows.append(StreamEvent(
+                user_id=user_id, origin=self.origin, event=event['event'], payload=json.dumps(event['data'])
+            ))
+        if rows:
+            db.session.add_all(rows)
+            db.session.commit()
+            self.sent += len(rows)
+
+    def _poll(self):
+        if self._last_id is None:
+            # Only events published after this process joined
+            self._last_id = db.session.query(func.max(StreamEvent.id)).scalar() or 0
+            db.session.commit()
+            return
+        settled = datetime.utcnow() - timedelta(seconds=self.settle_seconds)
+        rows = StreamEvent.query.filter(
+            StreamEvent.id > self._last_id
+        ).order_by(StreamEvent.id).limit(self.batch_size + len(self._seen)).all()
+        db.session.commit()
+        settling = False
+        for row in rows:
+            if row.id not in self._seen:
+                self._seen.add(row.id)
+                if row.origin != self.origin:
+                    self._bus.deliver(row.user_id, {'event': row.event, 'data': json.loads(row.payload)}, remote=True)
+                    self.received += 1
+            settling = settling or row.created_at >= settled
+            if not settling:
+                self._last_id = row.id
+        self._seen = {event_id for event_id in self._seen if event_id > self._last_id}
+
+    def stats(self):
+        return {
+            'kind': 'database',
+            'running': self._thread is not None,
+            'sent': self.sent,
+            'received': self.received,
+            'outgoing': self._outgoing.qsize()
+        }
+
+
+class EventBus:
+    """In-process pub/sub from the expense write handlers to open event streams.
+
+    publish() hands an event to this process's subscribers of that user and
+    to the broadcaster, which carries it to the other worker processes.
+    Publish only after the change is committed.
+    """
+
+    def __init__(self, broadcaster=None, max_connections=500, max_per_user=5, queue_size=100):
+        self.broadcaster = broadcaster or LocalBroadcaster()
+        self.max_connections = max_connections
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._connections = 0
+        self._lock = threading.Lock()
+        self._remote_listeners = []
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, user_id):
+        with self._lock:
+            if self._connections >= self.max_connections:
+                raise StreamLimitExceeded('Too many open event streams, try again later')
+            subscribers = self._subscribers.setdefault(user_id, set())
+            if len(subscribers) >= self.max_per_user:
+                raise StreamLimitExceeded(f'At most {self.max_per_user} event streams per user')
+            subscription = Subscription(user_id, self.queue_size)
+            subscribers.add(subscription)
+            self._connections += 1
+        self.broadcaster.start(self)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._connections -= 1
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, event, data):
+        event = {'event': event, 'data': data}
+        self.published += 1
+        self.deliver(user_id, event)
+        self.broadcaster.start(self)
+        self.broadcaster.send(user_id, event)
+
+    def add_remote_listener(self, listener):
+        """Call listener(user_id, event) for every event relayed from another process"""
+        self._remote_listeners.append(listener)
+
+    def deliver(self, user_id, event, remote=False):
+        if remote:
+            for listener in self._remote_listeners:
+                try:
+                    listener(user_id, event)
+                except Exception as e:
+                    logger.error(f"Event listener error: {str(e)}")
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            if subscription.put(event):
+                self.delivered += 1
+            else:
+                self.dropped += 1
+
+    def stats(self):
+        with self._lock:
+            connections = self._connections
+            users = len(self._subscribers)
+        return {
+            'connections': connections,
+            'users': users,
+            'published': self.published,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'broadcaster': self.broadcaster.stats()
+        }
+
+
+def format_event(event, data):
+    """One Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+_event_bus = None
+_event_bus_lock = threading.Lock()
+
+
+def get_event_bus(app=None):
+    """Process-wide event bus built from Config on first use, app is needed for the database broadcaster"""
+    global _event_bus
+    if _event_bus is None:
+        with _event_bus_lock:
+            if _event_bus is None:
+                if Config.SSE_BROADCASTER == 'database':
+                    if app is None:
+                        raise RuntimeError('The database event broadcaster needs the app')
+                    broadcaster = DatabaseBroadcaster(
+                        app, poll_seconds=Config.SSE_BROADCAST_POLL_SECONDS, settle_seconds=Config.SSE_EVENT_SETTLE_SECONDS
+                    )
+                else:
+                    broadcaster = LocalBroadcaster()
+                _event_bus = EventBus(
+                    broadcaster,
+                    max_connections=Config.SSE_MAX_CONNECTIONS,
+                    max_per_user=Config.SSE_MAX_CONNECTIONS_PER_USER,
+                    queue_size=Config.SSE_QUEUE_SIZE
+                )
+    return _event_bus
+
+
+def publish_expense_event(user_id, event, data):
+    """Tell the user's open streams about a committed expense change, never fails the request"""
+    try:
+        get_event_bus().publish(int(user_id), event, data)
+    except Exception as e:
+        logger.error(f"Error publishing {event} event: {str(e)}")
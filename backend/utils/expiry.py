@@ -0,0 +1,122 @@
+from models import db, EmailVerification, PendingUser, PasswordResetToken
+from collections import defaultdict
+from datetime import datetime, timedelta
+import heapq
+import logging
+import threading
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _expiring_tables():
+    """(name, model, deadline column, lifetime added to the column, dependents) per expiring table"""
+    return [
+        ('verification_codes', EmailVerification, EmailVerification.expires_at, timedelta(0), ()),
+        ('pending_users', PendingUser, PendingUser.created_at,
+         timedelta(hours=Config.PENDING_USER_EXPIRY_HOURS),
+         [(EmailVerification, EmailVerification.pending_user_id)]),
+        ('reset_tokens', PasswordResetToken, PasswordResetToken.expires_at, timedelta(0), ())
+    ]
+
+
+class ExpiryScheduler:
+    """Deletes OTPs, pending users and reset tokens close to their deadline.
+
+    Upcoming deadlines are read ahead with one indexed range query per
+    table, half a load window at a time, and kept in a min-heap. Each tick
+    pops whatever is due and deletes it by primary key in small batches, so
+    database work follows the deadlines instead of arriving as periodic
+    table scans. The load window must stay shorter than the shortest
+    lifetime (10 minute OTPs): a row created after a load then always has
+    its deadline in a window that has not been read yet. Rows that expired
+    while no process was leader are left to CleanupService.
+    """
+
+    def __init__(self, load_window_seconds=300, batch_size=100, max_per_tick=1000):
+        self.load_window = timedelta(seconds=load_window_seconds)
+        self.batch_size = batch_size
+        self.max_per_tick = max_per_tick
+        self._heap = []
+        self._loaded_until = None
+        self._lock = threading.Lock()
+        self.deleted = 0
+
+    def _load(self, now):
+        start = self._loaded_until
+        if start is None or start < now - self.load_window:
+            start = now - self.load_window
+        end = now + self.load_window
+        loaded = 0
+        for name, model, column, lifetime, _ in _expiring_tables():
+            rows = db.session.query(model.id, column).filter(
+                column >= start - lifetime,
+                column < end - lifetime
+            ).all()
+            for row_id, value in rows:
+                heapq.heappush(self._heap, (value + lifetime, name, row_id))
+            loaded += len(rows)
+        db.session.commit()
+        self._loaded_until = end
+        if loaded:
+            logger.debug(f"Loaded {loaded} expiry deadlines up to {end.isoformat()}")
+
+    def run_due(self):
+        """Delete rows whose deadline has passed, return the number deleted"""
+        with self._lock:
+            now = datetime.utcnow()
+            if self._loaded_until is None or self._loaded_until - now < self.load_window / 2:
+                self._load(now)
+
+            due = defaultdict(list)
+            popped = 0
+            while self._heap and self._heap[0][0] <= now and popped < self.max_per_tick:
+                _, name, row_id = heapq.heappop(self._heap)
+                due[name].append(row_id)
+                popped += 1
+            if not due:
+                return 0
+
+            deleted = 0
+            for name, model, column, lifetime, dependents in _expiring_tables():
+                ids = due.get(name)
+                for offset in range(0, len(ids or ()), self.batch_size):
+                    batch = ids[offset:offset + self.batch_size]
+                    # Re-check the deadline, the row may have been replaced or extended since it was loaded.
+                    # Dependents go only with parents that are still past it.
+                    expired = (model.id.in_(batch), column <= now - lifetime)
+                    for dependent, foreign_key in dependents:
+                        dependent.query.filter(
+                            foreign_key.in_(db.session.query(model.id).filter(*expired))
+                        ).delete(synchronize_session=False)
+                    deleted += model.query.filter(*expired).delete(synchronize_session=False)
+                    db.session.commit()
+            self.deleted += deleted
+            if deleted:
+                logger.info(f"Expired {deleted} rows ({', '.join(f'{name}: {len(ids)}' for name, ids in due.items())})")
+            return deleted
+
+    def stats(self):
+        return {
+            'tracked': len(self._heap),
+            'loaded_until': self._loaded_until.isoformat() if self._loaded_until else None,
+            'deleted': self.deleted
+        }
+
+
+_expiry_scheduler = None
+_expiry_scheduler_lock = threading.Lock()
+
+
+def get_expiry_scheduler():
+    """Process-wide expiry scheduler built from Config on first use"""
+    global _expiry_scheduler
+    if _expiry_scheduler is None:
+        with _expiry_scheduler_lock:
+            if _expiry_scheduler is None:
+                _expiry_scheduler = ExpiryScheduler(
+                    load_window_seconds=Config.EXPIRY_LOAD_WINDOW_SECONDS,
+                    batch_size=Config.EXPIRY_BATCH_SIZE,
+                    max_per_tick=Config.EXPIRY_MAX_PER_TICK
+                )
+    return _expiry_scheduler
@@ -0,0 +1,126 @@
+from google.auth import jwt as google_jwt
+from google.auth.exceptions import TransportError
+from requests.adapters import HTTPAdapter
+import base64
+import json
+import logging
+import re
+import threading
+import time
+import requests
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+_MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+class GoogleTokenVerifier:
+    """Verifies Google ID tokens locally against cached signing certificates.
+
+    Certificates are fetched over one shared, pooled HTTP session and kept
+    for as long as Google's Cache-Control max-age allows, so a login
+    normally verifies the token signature without any outbound request.
+    An unknown key id triggers one early refresh (key rotation), and if a
+    refresh fails the previous certificates keep being used.
+    """
+
+    def __init__(self, client_id, certs_url=None, session=None, default_max_age=3600,
+                 min_refresh_interval=60, clock_skew=10, timeout=5):
+        self.client_id = client_id
+        self.certs_url = certs_url or Config.GOOGLE_CERTS_URL
+        self.default_max_age = default_max_age
+        self.min_refresh_interval = min_refresh_interval
+        self.clock_skew = clock_skew
+        self.timeout = timeout
+        self._session = session or self._build_session()
+        self._certs = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _build_session():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=2)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _max_age(self, response):
+        match = _MAX_AGE_RE.search(response.headers.get('Cache-Control', ''))
+        if not match:
+            return self.default_max_age
+        age = int(response.headers.get('Age', 0) or 0)
+        return max(int(match.group(1)) - age, 0)
+
+    def _refresh(self):
+        try:
+            response = self._session.get(self.certs_url, timeout=self.timeout)
+            response.raise_for_status()
+            certs = response.json()
+        except (requests.RequestException, ValueError) as e:
+            if self._certs:
+                # Keep serving the old keys and back off instead of retrying on every login
+                logger.warning(f"Google certificate refresh failed, using cached keys: {str(e)}")
+                self._fetched_at = time.monotonic()
+                self._expires_at = self._fetched_at + self.min_refresh_interval
+                return
+            raise TransportError(f"Could not fetch Google certificates: {str(e)}")
+
+        now = time.monotonic()
+        self._certs = certs
+        self._fetched_at = now
+        self._expires_at = now + self._max_age(response)
+        logger.info(f"Fetched {len(certs)} Google signing certificates")
+
+    def get_certs(self, kid=None):
+        """Cached certificates, refreshed when expired or when kid is unknown"""
+        now = time.monotonic()
+        stale = now >= self._expires_at
+        rotated = kid is not None and kid not in self._certs and now - self._fetched_at >= self.min_refresh_interval
+        if stale or rotated:
+            with self._lock:
+                now = time.monotonic()
+                stale = now >= self._expires_at
+                rotated = kid is not None and kid not in self._certs and now - self._fetched_at >= self.min_refresh_interval
+                if stale or rotated:
+                    self._refresh()
+        return self._certs
+
+    def verify(self, token):
+        """Return the token claims, raises ValueError/GoogleAuthError if invalid"""
+        certs = self.get_certs(_token_kid(token))
+        idinfo = google_jwt.decode(
+            token, certs=certs, audience=self.client_id, clock_skew_in_seconds=self.clock_skew
+        )
+        if idinfo.get('iss') not in GOOGLE_ISSUERS:
+            raise ValueError('Wrong issuer.')
+        return idinfo
+
+
+def _token_kid(token):
+    """Key id from the JWT header, without verifying anything"""
+    try:
+        header = token.split('.')[0]
+        header += '=' * (-len(header) % 4)
+        return json.loads(base64.urlsafe_b64decode(header)).get('kid')
+    except (ValueError, AttributeError):
+        raise ValueError('Malformed ID token')
+
+
+_verifiers = {}
+_verifiers_lock = threading.Lock()
+
+
+def get_google_verifier(client_id):
+    """Process-wide verifier per client id, sharing its session and cert cache"""
+    verifier = _verifiers.get(client_id)
+    if verifier is None:
+        with _verifiers_lock:
+            verifier = _verifiers.get(client_id)
+            if verifier is None:
+                verifier = _verifiers[client_id] = GoogleTokenVerifier(client_id)
+    return verifier
@@ -0,0 +1,204 @@
+from models import db, Expense, RateLimitLog
+from sqlalchemy import insert, text
+from collections import namedtuple
+from concurrent.futures import Future
+from utils.idempotency import apply_fence
+from utils.sharding import use_shard
+from utils.user_stats import UserStatsService
+from utils.spending_sketches import SpendingSketchService
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_PendingInsert = namedtuple('_PendingInsert', ['shard', 'values', 'attempt', 'fence', 'future'])
+
+
+class GroupCommitTimeout(Exception):
+    """The writer did not confirm the insert in time, it may still be committed"""
+
+
+class GroupCommitter:
+    """Coalesces concurrent expense inserts into shared transactions.
+
+    Request threads hand their new row to insert_expense() and block until
+    it is committed. One writer thread takes everything queued, waits up to
+    max_wait_ms for more, inserts the batch with one flush and commits
+    once, so concurrent requests share a single commit (and fsync) instead
+    of queueing for one each. At low load a batch is a single row and the
+    wait is the only extra latency. SQLite (RETURNING) gets one multi-row
+    INSERT. MySQL has no RETURNING, so it gets one multi-row INSERT whose
+    ids are read from LAST_INSERT_ID() when innodb_autoinc_lock_mode
+    (0 or 1) makes them consecutive, and one INSERT per row otherwise.
+    Rate limit logs are always a single executemany, which MySQL drivers
+    send as one multi-row INSERT. Each caller gets its own row back only
+    after the commit. If a batch fails, its rows are retried one at a time so a bad
+    row only fails its own request.
+    """
+
+    def __init__(self, app, max_batch=100, max_wait_ms=2, timeout=10):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+        self._id_steps = {}  # engine -> auto-increment step when multi-row ids are consecutive, else None
+
+    def start(self):
+        with self._start_lock:
+            if self._thread:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._writer, name='group-commit', daemon=True)
+            self._thread.start()
+        logger.info(f"Started group commit writer (batches up to {self.max_batch}, wait {self.max_wait * 1000:.1f} ms)")
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def insert_expense(self, shard, values, attempt=None, fence=None):
+        """Insert an expense through the next group commit and return its to_dict().
+
+        attempt is an optional rate limit log (see claim_attempt) written in
+        the same transaction, fence an optional idempotency fence (see
+        claim_fence) applied in it. The caller's session must not hold locks
+        or pending changes, the writer uses its own session.
+        """
+        if self._thread is None:
+            self.start()
+        future = Future()
+        self._queue.put(_PendingInsert(shard, values, attempt, fence, future))
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            raise GroupCommitTimeout(f"Insert not confirmed within {self.timeout}s")
+
+    def _writer(self):
+        while not self._stopping.is_set():
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    pass
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                with self.app.app_context():
+                    self._write(batch)
+            except Exception as e:
+                logger.error(f"Group commit writer error: {str(e)}")
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+
+    def _write(self, batch):
+        by_shard = {}
+        for item in batch:
+            by_shard.setdefault(item.shard, []).append(item)
+
+        for shard, items in by_shard.items():
+            with use_shard(shard):
+                try:
+                    results = self._insert(items)
+                except Exception as e:
+                    db.session.rollback()
+                    if len(items) == 1:
+                        items[0].future.set_exception(e)
+                        continue
+                    logger.warning(f"Group commit of {len(items)} rows failed, retrying one by one: {str(e)}")
+                    for item in items:
+                        try:
+                            item.future.set_result(self._insert([item])[0])
+                        except Exception as e:
+                            db.session.rollback()
+                            item.future.set_exception(e)
+                    continue
+                for item, result in zip(items, results):
+                    item.future.set_result(result)
+
+    def _insert(self, items):
+        expenses = self._insert_expenses([item.values for item in items])
+        attempts = [item.attempt for item in items if item.attempt]
+        if attempts:
+            db.session.execute(insert(RateLimitLog), attempts)
+        for expense in expenses:
+            UserStatsService.expense_added(expense)
+            SpendingSketchService.expense_added(expense)
+        rows = [expense.to_dict() for expense in expenses]
+        for item in items:
+            if item.fence:
+                apply_fence(item.fence)
+        db.session.commit()
+
+        self.batches += 1
+        self.rows += len(items)
+        self.largest_batch = max(self.largest_batch, len(items))
+        return rows
+
+    def _insert_expenses(self, values):
+        """Insert the rows and return them as Expenses in the same order"""
+        bind = db.session.get_bind(mapper=Expense)
+        step = None
+        if len(values) > 1 and not bind.dialect.insert_executemany_returning:
+            step = self._id_step(bind)
+        if step is None:
+            expenses = [Expense(**value) for value in values]
+            db.session.add_all(expenses)
+            db.session.flush()
+            return expenses
+
+        # One multi-row INSERT, MySQL reports the first id and the rest follow it
+        result = db.session.execute(insert(Expense.__table__).values(values))
+        ids = [result.lastrowid + index * step for index in range(len(values))]
+        expenses = Expense.query.filter(Expense.id.in_(ids)).order_by(Expense.id).all()
+        if [expense.id for expense in expenses] != ids:
+            raise RuntimeError(f"Multi-row insert ids are not consecutive from {result.lastrowid}")
+        return expenses
+
+    def _id_step(self, bind):
+        if bind not in self._id_steps:
+            step = None
+            if bind.dialect.name == 'mysql':
+                with bind.connect() as connection:
+                    lock_mode, increment = connection.execute(
+                        text("SELECT @@innodb_autoinc_lock_mode, @@auto_increment_increment")
+                    ).one()
+                if int(lock_mode) in (0, 1):
+                    step = int(increment)
+                else:
+                    logger.info("innodb_autoinc_lock_mode is 2, group commit inserts expenses one row at a time")
+            self._id_steps[bind] = step
+        return self._id_steps[bind]
+
+    def stats(self):
+        return {
+            'running': self._thread is not None,
+            'batches': self.batches,
+            'rows': self.rows,
+            'average_batch': round(self.rows / self.batches, 2) if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'queued': self._queue.qsize()
+        }
@@ -0,0 +1,290 @@
+from models import db, IdempotencyRecord
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from cachetools import TTLCache
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+import hashlib
+import logging
+import threading
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Outcomes that say "try again later", a retry must run the view again rather than replay them
+RETRYABLE_STATUS_CODES = frozenset([409, 429])
+
+# Final response of a keyed request, as replayed to retries
+StoredResponse = namedtuple('StoredResponse', ['request_hash', 'status_code', 'body'])
+
+
+class IdempotencyKeyLost(Exception):
+    """Another request took the key over, this one must not commit its writes"""
+
+
+class IdempotencyCache:
+    """Per-process LRU + TTL cache of (user_id, key) -> StoredResponse.
+
+    Only finished responses are cached, they never change, so a retry that
+    reaches the same worker is answered without touching the database.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, key):
+        with self._lock:
+            stored = self._cache.get((user_id, key))
+            if stored is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return stored
+
+    def put(self, user_id, key, stored):
+        with self._lock:
+            self._cache[(user_id, key)] = stored
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache)}
+
+
+_idempotency_cache = None
+_idempotency_cache_lock = threading.Lock()
+
+
+def get_idempotency_cache():
+    """Process-wide idempotency cache built from Config on first use"""
+    global _idempotency_cache
+    if _idempotency_cache is None:
+        with _idempotency_cache_lock:
+            if _idempotency_cache is None:
+                _idempotency_cache = IdempotencyCache(
+                    maxsize=Config.IDEMPOTENCY_CACHE_SIZE,
+                    ttl=Config.IDEMPOTENCY_CACHE_TTL_SECONDS
+                )
+    return _idempotency_cache
+
+
+def _fingerprint():
+    digest = hashlib.sha256()
+    digest.update(request.method.encode('utf-8'))
+    digest.update(request.path.encode('utf-8'))
+    digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def _now():
+    # Whole seconds, the claim time doubles as the owner's token and MySQL DATETIME drops fractions
+    return datetime.utcnow().replace(microsecond=0)
+
+
+def _claim(user_id, key, request_hash):
+    """Register the key for this request.
+
+    Returns ('run', fence) when this request must run the view, ('done',
+    StoredResponse) when an earlier one finished, ('busy', request_hash of
+    the running one) while an earlier one runs, or ('lost', request_hash)
+    when an earlier one committed its writes but died before storing its
+    response. The unique (user_id, key) constraint lets exactly one request
+    run; fence is (record id, claim time) and identifies it as the owner.
+    """
+    claimed_at = _now()
+    record = IdempotencyRecord(
+        user_id=user_id, key=key, method=request.method, path=request.path[:255],
+        request_hash=request_hash, created_at=claimed_at
+    )
+    db.session.add(record)
+    try:
+        db.session.commit()
+        return 'run', (record.id, claimed_at)
+    except IntegrityError:
+        db.session.rollback()
+
+    existing = IdempotencyRecord.query.filter_by(user_id=user_id, key=key).first()
+    if existing is None:
+        # Expired and cleaned up in between, the retry will claim it
+        db.session.commit()
+        return 'busy', request_hash
+    if existing.status_code is not None:
+        stored = StoredResponse(existing.request_hash, existing.status_code, existing.response_body)
+        db.session.commit()
+        return 'done', stored
+
+    stale = datetime.utcnow() - timedelta(seconds=Config.IDEMPOTENCY_LOCK_SECONDS)
+    running_hash = existing.request_hash
+    if existing.completed_at is not None:
+        # Writes committed (see _fence), the response is only moments away unless the request died
+        db.session.commit()
+        return ('lost' if existing.completed_at < stale else 'busy'), running_hash
+    if running_hash == request_hash and existing.created_at < stale:
+        # The first request died before committing anything, take the key over.
+        # Its claim time changes, so should it still be alive its commit fails the fence.
+        claimed_at = _now()
+        taken = IdempotencyRecord.query.filter(
+            IdempotencyRecord.id == existing.id,
+            IdempotencyRecord.status_code.is_(None),
+            IdempotencyRecord.completed_at.is_(None),
+            IdempotencyRecord.created_at == existing.created_at
+        ).update({'created_at': claimed_at}, synchronize_session=False)
+        db.session.commit()
+        if taken:
+            logger.warning(f"Took over idempotency key of user {user_id} left unfinished since {existing.created_at.isoformat()}")
+            return 'run', (existing.id, claimed_at)
+        return 'busy', request_hash
+    db.session.commit()
+    return 'busy', running_hash
+
+
+def _owned(fence):
+    record_id, claimed_at = fence
+    return IdempotencyRecord.query.filter(
+        IdempotencyRecord.id == record_id,
+        IdempotencyRecord.created_at == claimed_at
+    )
+
+
+def apply_fence(fence):
+    """Mark the key's writes as committing, in the transaction that commits them.
+
+    Raises IdempotencyKeyLost when the key was taken over meanwhile, which
+    aborts the commit. Once marked, the key can no longer be taken over.
+    """
+    marked = _owned(fence).filter(
+        IdempotencyRecord.status_code.is_(None)
+    ).update({'completed_at': datetime.utcnow()}, synchronize_session=False)
+    if not marked:
+        logger.warning(f"Idempotency key {fence[0]} was taken over, discarding this request's writes")
+        raise IdempotencyKeyLost(f"Idempotency key {fence[0]} was taken over by a retry")
+
+
+def claim_fence():
+    """Take the fence away from the request's session, return it or None.
+
+    For views that write through another transaction (group commit), which
+    then applies it along with its own rows.
+    """
+    return db.session.info.pop('idempotency_fence', None)
+
+
+def _complete(user_id, key, fence, request_hash, response):
+    try:
+        if response.status_code >= 500 or response.status_code in RETRYABLE_STATUS_CODES:
+            # Nothing was kept (views roll back on errors), let a retry run again
+            _owned(fence).delete(synchronize_session=False)
+            db.session.commit()
+        else:
+            body = response.get_data(as_text=True)
+            stored = _owned(fence).update({
+                'status_code': response.status_code,
+                'response_body': body,
+                'completed_at': datetime.utcnow()
+            }, synchronize_session=False)
+            db.session.commit()
+            if stored:
+                get_idempotency_cache().put(user_id, key, StoredResponse(request_hash, response.status_code, body))
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Error storing idempotent response: {str(e)}")
+
+
+def _release(fence):
+    try:
+        _owned(fence).delete(synchronize_session=False)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+
+
+def _replay(stored):
+    response = current_app.response_class(stored.body, status=stored.status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(f):
+    """Honour an Idempotency-Key header: retries get the first response instead of running the view again.
+
+    Goes below @jwt_required(), keys are scoped per user. Reusing a key for
+    a different request and a retry that arrives while the first request
+    is still running both get 409, told apart by the error message. 409
+    and 429 outcomes are not stored, the next retry runs the view.
+    Requests without the header run as usual.
+
+    Every commit the view makes checks that this request still owns the
+    key (see apply_fence), so a retry that took over a key it thought
+    abandoned and the original request never both commit their writes.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return f(*args, **kwargs)
+        key = key.strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}), 400
+
+        user_id = int(get_jwt_identity())
+        request_hash = _fingerprint()
+        stored = get_idempotency_cache().get(user_id, key)
+        if stored is None:
+            try:
+                state, value = _claim(user_id, key, request_hash)
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                logger.error(f"Database error claiming idempotency key: {str(e)}")
+                return jsonify({'error': 'Database error occurred'}), 500
+            if state in ('busy', 'lost'):
+                if value != request_hash:
+                    return jsonify({'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'}), 409
+                if state == 'lost':
+                    return jsonify({
+                        'error': f'The request with this {IDEMPOTENCY_HEADER} was applied but its response was lost, '
+                                 'check your data before retrying with a new key'
+                    }), 409
+                response = jsonify({'error': 'A request with this Idempotency-Key is still in progress'})
+                response.headers['Retry-After'] = '1'
+                return response, 409
+            if state == 'done':
+                stored = value
+                get_idempotency_cache().put(user_id, key, stored)
+
+        if stored is not None:
+            if stored.request_hash != request_hash:
+                return jsonify({'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'}), 409
+            return _replay(stored)
+
+        db.session.info['idempotency_fence'] = value
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            db.session.info.pop('idempotency_fence', None)
+            db.session.rollback()
+            _release(value)
+            raise
+        db.session.info.pop('idempotency_fence', None)
+        _complete(user_id, key, value, request_hash, response)
+        return response
+    return decorated_function
+
+
+@event.listens_for(Session, 'before_commit')
+def _fence_before_commit(session):
+    fence = session.info.get('idempotency_fence')
+    if fence is not None:
+        try:
+            apply_fence(fence)
+        except IdempotencyKeyLost:
+            # The view's writes are refused, the request's bookkeeping (rate limit log) is not
+            session.info.pop('idempotency_fence', None)
+            raise
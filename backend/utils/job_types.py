@@ -0,0 +1,113 @@
+"""Job types run by the background job workers (utils/jobs.py).
+
+Handlers take (job, payload), commit their own work and return a
+JSON-serializable result. User jobs find the user's shard themselves,
+there is no request to route them.
+"""
+from models import db, Expense, Category
+from sqlalchemy import func
+from utils.cleanup import CleanupService
+from utils.jobs import job_type, PROCESS
+from utils.shard_router import get_shard_router
+from utils.sharding import use_shard
+from utils.spending_sketches import SpendingSketchService
+from utils.user_stats import UserStatsService
+import csv
+import os
+from config import Config
+
+EXPORT_COLUMNS = ['id', 'date', 'type', 'amount', 'category', 'payment_mode', 'description']
+
+
+def export_path(job_id):
+    return os.path.join(Config.JOBS_EXPORT_DIR, f"expenses-{job_id}.csv")
+
+
+def _user_shard(user_id):
+    shard, status = get_shard_router().lookup(user_id)
+    if status == 'moving':
+        # Failing the attempt retries it after the backoff, by then the move is done
+        raise RuntimeError(f"User {user_id} is being moved to another shard")
+    return shard
+
+# ---------------------- SYSTEM JOBS ----------------------
+
+@job_type('cleanup')
+def cleanup(job, payload):
+    return CleanupService.run_all_cleanup_tasks()
+
+
+@job_type('verify_orphans')
+def verify_orphans(job, payload):
+    return CleanupService.verify_orphans()
+
+
+@job_type('reconcile_user_stats')
+def reconcile_user_stats(job, payload):
+    batch_size = payload.get('batch_size', Config.USER_STATS_RECONCILE_BATCH_SIZE)
+    return {'corrected': UserStatsService.reconcile(batch_size, progress=job.progress)}
+
+
+@job_type('detect_anomalies', priority=-10)
+def detect_anomalies(job, payload):
+    # A thread job, the analysis runs in TransactionFlagService's own process pool.
+    # Imported here so workers load numpy only when they run it
+    from utils.transaction_flags import TransactionFlagService
+    return TransactionFlagService.run_all(payload.get('workers'), payload.get('batch_size'), progress=job.progress)
+
+# ---------------------- USER JOBS ----------------------
+
+@job_type('rebuild_aggregates', executor=PROCESS, priority=10)
+def rebuild_aggregates(job, payload):
+    """Recompute the user's stats row and spending sketches from their expenses"""
+    with use_shard(_user_shard(job.user_id)):
+        corrected = UserStatsService.recompute(job.user_id)
+        job.progress(0.5, message='Stats recomputed')
+        sketches = SpendingSketchService.rebuild_user(job.user_id)
+        db.session.commit()
+    return {'stats_corrected': corrected, 'spending_sketches': sketches}
+
+
+@job_type('export_expenses', priority=10, read_only=True)
+def export_expenses(job, payload):
+    """All of the user's transactions as CSV in JOBS_EXPORT_DIR, served by GET /api/jobs/<id>/download.
+
+    Read in id order, one short transaction per batch, with progress
+    recorded between them (JobContext.progress must not run inside a read).
+    """
+    user_id = job.user_id
+    batch_size = Config.JOBS_EXPORT_BATCH_SIZE
+    os.makedirs(Config.JOBS_EXPORT_DIR, exist_ok=True)
+    path = export_path(job.id)
+    partial = f"{path}.partial"
+    rows = 0
+    with use_shard(_user_shard(user_id)):
+        categories = dict(db.session.query(Category.id, Category.name).filter(
+            (Category.user_id == user_id) | (Category.is_default == True)
+        ).all())
+        total = db.session.query(func.count(Expense.id)).filter(Expense.user_id == user_id).scalar()
+        db.session.commit()
+
+        with open(partial, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(EXPORT_COLUMNS)
+            last_id = 0
+            while True:
+                batch = db.session.query(
+                    Expense.id, Expense.date, Expense.type, Expense.amount, Expense.category_id,
+                    Expense.payment_mode, Expense.description
+                ).filter(Expense.user_id == user_id, Expense.id > last_id).order_by(Expense.id).limit(batch_size).all()
+                db.session.commit()
+                if not batch:
+                    break
+                for expense_id, date, expense_type, amount, category_id, payment_mode, description in batch:
+                    writer.writerow([
+                        expense_id, date.isoformat() if date else '', expense_type or 'expense', amount,
+                        categories.get(category_id, ''), payment_mode or '', description or ''
+                    ])
+                rows += len(batch)
+                last_id = batch[-1].id
+                job.progress(rows, max(total, rows), message=f"{rows} of {max(total, rows)} rows written")
+    # Complete files only, a retry after a crash starts over
+    os.replace(partial, path)
+    return {'rows': rows, 'bytes': os.path.getsize(path)}
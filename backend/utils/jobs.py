@@ -0,0 +1,438 @@
+from models import db, BackgroundJob
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from utils.sqlite_engine import configure_sqlite_engine, mark_reader
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import socket
+import threading
+import time
+import uuid
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+THREAD = 'thread'
+PROCESS = 'process'
+
+
+class JobType:
+    def __init__(self, name, func, executor, max_attempts, priority, read_only):
+        self.name = name
+        self.func = func
+        self.executor = executor
+        self.max_attempts = max_attempts
+        self.priority = priority
+        self.read_only = read_only
+
+
+_job_types = {}
+
+
+def job_type(name, executor=THREAD, max_attempts=None, priority=0, read_only=False):
+    """Register func(job, payload) as a job type.
+
+    executor='process' runs it in the worker's process pool, for CPU-bound
+    work, 'thread' in its thread pool. The handler commits its own work and
+    returns a JSON-serializable result, an exception fails the attempt.
+    read_only=True keeps its transactions from taking the SQLite write lock
+    (see utils/sqlite_engine.py), for handlers that write nothing.
+    """
+    if executor not in (THREAD, PROCESS):
+        raise ValueError(f"Unknown executor {executor}")
+
+    def register(func):
+        _job_types[name] = JobType(
+            name, func, executor, max_attempts or Config.JOBS_MAX_ATTEMPTS, priority, read_only
+        )
+        return func
+    return register
+
+
+def job_types():
+    # Handlers live in utils.job_types, imported on first use (also in pool processes)
+    import utils.job_types  # noqa: F401
+    return _job_types
+
+
+def get_job_type(name):
+    definition = job_types().get(name)
+    if definition is None:
+        raise ValueError(f"Unknown job type {name}")
+    return definition
+
+
+class JobQueue:
+    @staticmethod
+    def enqueue(job_type, payload=None, user_id=None, priority=None, delay_seconds=0, unique=False):
+        """Add a job in the current transaction, workers pick it up once the caller commits.
+
+        unique=True returns the job of the same type, user and payload that is
+        still queued or running instead of adding another one.
+        """
+        definition = get_job_type(job_type)
+        encoded = json.dumps(payload, sort_keys=True) if payload is not None else None
+        if unique:
+            existing = BackgroundJob.query.filter(
+                BackgroundJob.type == job_type,
+                BackgroundJob.user_id == user_id,
+                BackgroundJob.payload == encoded,
+                BackgroundJob.status.in_(('queued', 'running'))
+            ).order_by(BackgroundJob.id).first()
+            if existing is not None:
+                return existing
+        job = BackgroundJob(
+            type=job_type,
+            user_id=user_id,
+            payload=encoded,
+            priority=definition.priority if priority is None else priority,
+            max_attempts=definition.max_attempts,
+            next_attempt_at=datetime.utcnow() + timedelta(seconds=delay_seconds)
+        )
+        db.session.add(job)
+        db.session.info['job_enqueued'] = True
+        return job
+
+    @staticmethod
+    def submit(job_type, payload=None, user_id=None):
+        """Queue a job unless the same one is already waiting and commit, for callers outside
+        a request such as the scheduler. Returns the job id."""
+        job = JobQueue.enqueue(job_type, payload, user_id, unique=True)
+        db.session.commit()
+        return job.id
+
+
+class JobContext:
+    """What a handler gets besides its payload: the job's id, user and attempt, and progress reporting"""
+
+    def __init__(self, job_id, user_id, attempt):
+        self.id = job_id
+        self.user_id = user_id
+        self.attempt = attempt
+        self._reported_at = 0.0
+
+    def progress(self, done, total=None, message=None):
+        """Record progress as done of total (or a 0-1 fraction), written at most every
+        JOBS_PROGRESS_INTERVAL_SECONDS. Uses its own connection, so call it after committing
+        rather than while holding row locks (SQLite would wait on its own writer)."""
+        fraction = min(max(done / total if total else done, 0.0), 1.0)
+        now = time.monotonic()
+        if fraction < 1.0 and now - self._reported_at < Config.JOBS_PROGRESS_INTERVAL_SECONDS:
+            return
+        self._reported_at = now
+        table = BackgroundJob.__table__
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(table.update().where(
+                    table.c.id == self.id, table.c.status == 'running'
+                ).values(progress=fraction, progress_message=message[:255] if message else None))
+        except SQLAlchemyError as e:
+            logger.warning(f"Could not record progress of job {self.id}: {str(e)}")
+
+
+def execute_job(name, job_id, user_id, attempt, payload):
+    """Run one attempt of a job, inside an app context"""
+    definition = get_job_type(name)
+    if definition.read_only:
+        mark_reader(db.session)
+    try:
+        return definition.func(JobContext(job_id, user_id, attempt), payload)
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+# App of a pool process, without the server's scheduler, mail and job workers
+_process_app = None
+
+
+def _init_process_worker():
+    global _process_app
+    from flask import Flask
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                configure_sqlite_engine(engine, app.config)
+    _process_app = app
+
+
+def _run_in_process(name, job_id, user_id, attempt, payload):
+    with _process_app.app_context():
+        return execute_job(name, job_id, user_id, attempt, payload)
+
+
+class JobWorker:
+    """Runs queued background jobs.
+
+    One loop thread claims due jobs, highest priority first, as long as the
+    thread pool (I/O-bound types) or process pool (CPU-bound types) has room.
+    Claimed jobs hold a lease that the loop renews while they run, so workers
+    in several processes can share the queue, and the jobs of a worker that
+    died become queued again once their lease lapses. Failed attempts are
+    retried with exponential backoff up to the job's max_attempts.
+    """
+
+    def __init__(self, app, threads=None, processes=None):
+        self.app = app
+        self.config = app.config
+        self.threads = self.config['JOBS_THREAD_WORKERS'] if threads is None else threads
+        self.processes = self.config['JOBS_PROCESS_WORKERS'] if processes is None else processes
+        self.owner = f"{socket.gethostname()[:32]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._thread_pool = None
+        self._process_pool = None
+        self._running = {}  # job id -> (executor, future), only touched by the loop thread
+        self._finished = queue.SimpleQueue()
+        self._leases_checked = 0.0
+        self.counts = {'succeeded': 0, 'failed': 0, 'retried': 0}
+
+    def start(self):
+        if self._thread:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name='job-worker', daemon=True)
+        self._thread.start()
+        _register_worker(self)
+        logger.info(f"Started job worker {self.owner} with {self.threads} threads and {self.processes} processes")
+
+    def stop(self, timeout=5):
+        """Stop claiming, running jobs are abandoned and run again after their lease lapses"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+        for pool in (self._thread_pool, self._process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._thread_pool = self._process_pool = None
+        _unregister_worker(self)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _loop(self):
+        poll_seconds = self.config['JOBS_POLL_SECONDS']
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    claimed = self.run_once()
+            except Exception as e:
+                logger.error(f"Job worker error: {str(e)}")
+                db.session.remove()
+                claimed = 0
+            if claimed:
+                continue  # more jobs may be waiting, skip the poll delay
+            self._wakeup.wait(poll_seconds)
+            self._wakeup.clear()
+
+    def run_once(self):
+        """Record finished jobs, look after leases and claim what fits. Returns the number claimed."""
+        while True:
+            try:
+                job_id = self._finished.get_nowait()
+            except queue.Empty:
+                break
+            executor, future = self._running.pop(job_id)
+            self._record(job_id, future)
+
+        if time.monotonic() - self._leases_checked >= self.config['JOBS_LEASE_SECONDS'] / 3:
+            self._renew_leases()
+            self._release_expired()
+            self._leases_checked = time.monotonic()
+
+        claimed = 0
+        for executor, capacity in ((THREAD, self.threads), (PROCESS, self.processes)):
+            free = capacity - sum(1 for running, _ in self._running.values() if running == executor)
+            for job in self._claim(executor, free):
+                self._submit(job)
+                claimed += 1
+        return claimed
+
+    def _claim(self, executor, limit):
+        names = [definition.name for definition in job_types().values() if definition.executor == executor]
+        if limit <= 0 or not names:
+            return []
+        now = datetime.utcnow()
+        candidate_ids = [row.id for row in db.session.query(BackgroundJob.id).filter(
+            BackgroundJob.status == 'queued',
+            BackgroundJob.next_attempt_at <= now,
+            BackgroundJob.type.in_(names)
+        ).order_by(BackgroundJob.priority.desc(), BackgroundJob.next_attempt_at, BackgroundJob.id).limit(limit)]
+        if not candidate_ids:
+            db.session.commit()
+            return []
+
+        # Only rows still queued are taken, so concurrent workers never share a job
+        BackgroundJob.query.filter(
+            BackgroundJob.id.in_(candidate_ids),
+            BackgroundJob.status == 'queued'
+        ).update({
+            'status': 'running',
+            'locked_by': self.owner,
+            'lease_expires_at': now + timedelta(seconds=self.config['JOBS_LEASE_SECONDS']),
+            'attempts': BackgroundJob.attempts + 1,
+            'started_at': now
+        }, synchronize_session=False)
+        db.session.commit()
+
+        jobs = BackgroundJob.query.filter(
+            BackgroundJob.id.in_(candidate_ids),
+            BackgroundJob.locked_by == self.owner,
+            BackgroundJob.status == 'running'
+        ).order_by(BackgroundJob.priority.desc(), BackgroundJob.id).all()
+        claimed = [(job.type, job.id, job.user_id, job.attempts, json.loads(job.payload) if job.payload else {})
+                   for job in jobs]
+        db.session.commit()
+        return claimed
+
+    def _submit(self, job):
+        name, job_id = job[0], job[1]
+        if job_types()[name].executor == PROCESS:
+            if self._process_pool is None:
+                # Spawned, not forked: this process runs server threads that may hold locks
+                self._process_pool = ProcessPoolExecutor(
+                    self.processes, mp_context=multiprocessing.get_context('spawn'), initializer=_init_process_worker
+                )
+            future = self._process_pool.submit(_run_in_process, *job)
+            executor = PROCESS
+        else:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(self.threads, thread_name_prefix='job')
+            future = self._thread_pool.submit(self._run_in_thread, *job)
+            executor = THREAD
+        self._running[job_id] = (executor, future)
+        future.add_done_callback(lambda _, job_id=job_id: self._on_done(job_id))
+        logger.info(f"Job {job_id} ({name}) started, attempt {job[3]}")
+
+    def _run_in_thread(self, *job):
+        with self.app.app_context():
+            return execute_job(*job)
+
+    def _on_done(self, job_id):
+        self._finished.put(job_id)
+        self._wakeup.set()
+
+    def _record(self, job_id, future):
+        job = BackgroundJob.query.filter_by(id=job_id, locked_by=self.owner, status='running').first()
+        if job is None:
+            db.session.commit()
+            logger.warning(f"Job {job_id} finished after its lease lapsed, outcome dropped")
+            return
+
+        now = datetime.utcnow()
+        job.locked_by = None
+        job.lease_expires_at = None
+        error = future.exception()
+        if error is None:
+            try:
+                result = future.result()
+                job.result = json.dumps(result, default=str) if result is not None else None
+            except (TypeError, ValueError) as e:
+                error = e
+        if isinstance(error, BrokenProcessPool) and self._process_pool is not None:
+            # A pool process died, every job it had fails this attempt and the pool is replaced
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+
+        if error is None:
+            job.status = 'succeeded'
+            job.progress = 1.0
+            job.error = None
+            job.finished_at = now
+            self.counts['succeeded'] += 1
+            logger.info(f"Job {job_id} ({job.type}) succeeded in {(now - job.started_at).total_seconds():.2f}s")
+        else:
+            job.error = f"{type(error).__name__}: {error}"[:2000]
+            if job.attempts >= job.max_attempts:
+                job.status = 'failed'
+                job.finished_at = now
+                self.counts['failed'] += 1
+                logger.error(f"Job {job_id} ({job.type}) failed after {job.attempts} attempts: {job.error}")
+            else:
+                job.status = 'queued'
+                job.next_attempt_at = now + timedelta(seconds=self._backoff(job.attempts))
+                self.counts['retried'] += 1
+                logger.warning(f"Job {job_id} ({job.type}) attempt {job.attempts} failed, will retry: {job.error}")
+        db.session.commit()
+
+    def _backoff(self, attempts):
+        delay = self.config['JOBS_RETRY_BASE_SECONDS'] * (2 ** (attempts - 1))
+        delay = min(delay, self.config['JOBS_RETRY_MAX_SECONDS'])
+        return delay * random.uniform(0.8, 1.2)
+
+    def _renew_leases(self):
+        if not self._running:
+            return
+        BackgroundJob.query.filter(
+            BackgroundJob.id.in_(list(self._running)),
+            BackgroundJob.locked_by == self.owner,
+            BackgroundJob.status == 'running'
+        ).update({
+            'lease_expires_at': datetime.utcnow() + timedelta(seconds=self.config['JOBS_LEASE_SECONDS'])
+        }, synchronize_session=False)
+        db.session.commit()
+
+    def _release_expired(self):
+        """Requeue jobs of workers that stopped renewing their lease, or fail them when out of attempts"""
+        now = datetime.utcnow()
+        expired = (BackgroundJob.status == 'running', BackgroundJob.lease_expires_at < now)
+        released = {'locked_by': None, 'lease_expires_at': None, 'error': 'Worker stopped while running the job'}
+        failed = BackgroundJob.query.filter(
+            *expired, BackgroundJob.attempts >= BackgroundJob.max_attempts
+        ).update(dict(released, status='failed', finished_at=now), synchronize_session=False)
+        requeued = BackgroundJob.query.filter(*expired).update(
+            dict(released, status='queued', next_attempt_at=now), synchronize_session=False
+        )
+        db.session.commit()
+        if failed or requeued:
+            logger.warning(f"Jobs with lapsed leases: {requeued} queued again, {failed} failed")
+
+    def stats(self):
+        running = [executor for executor, _ in list(self._running.values())]
+        return {
+            'owner': self.owner,
+            'running': {THREAD: running.count(THREAD), PROCESS: running.count(PROCESS)},
+            'capacity': {THREAD: self.threads, PROCESS: self.processes},
+            **self.counts
+        }
+
+
+# Workers running in this process, woken whenever a session that
+# queued a job commits so it starts without waiting for a poll
+_workers = []
+
+
+def _register_worker(worker):
+    _workers.append(worker)
+
+
+def _unregister_worker(worker):
+    if worker in _workers:
+        _workers.remove(worker)
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_workers(session):
+    if session.info.pop('job_enqueued', False):
+        for worker in _workers:
+            worker.wake()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_enqueued(session):
+    session.info.pop('job_enqueued', None)
@@ -0,0 +1,286 @@
+from models import db, OutboxEmail
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# smtplib and email are imported where messages are built and sent, so
+# processes that never send mail do not load the mail stack at startup
+
+
+def is_permanent_smtp_error(error):
+    """Errors after which retrying the same message cannot succeed"""
+    import smtplib
+    return isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused))
+
+
+class MailQueue:
+    @staticmethod
+    def enqueue(subject, recipients, html=None, body=None, sender=None):
+        """Add an email to the outbox in the current transaction.
+
+        The message is sent by MailDispatcher once the caller commits, so a
+        rolled back request never sends mail and a committed one always does.
+        """
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        email = OutboxEmail(
+            sender=sender or Config.MAIL_DEFAULT_SENDER,
+            recipients=','.join(recipients),
+            subject=subject,
+            html=html,
+            body=body
+        )
+        db.session.add(email)
+        db.session.info['mail_enqueued'] = True
+        return email
+
+
+def build_message(email):
+    """Turn an outbox row into a MIME message with text and/or HTML parts"""
+    from email.message import EmailMessage
+    message = EmailMessage()
+    message['Subject'] = email.subject
+    message['From'] = email.sender or Config.MAIL_DEFAULT_SENDER
+    message['To'] = ', '.join(email.recipient_list())
+    if email.body:
+        message.set_content(email.body)
+        if email.html:
+            message.add_alternative(email.html, subtype='html')
+    else:
+        message.set_content(email.html or '', subtype='html')
+    return message
+
+
+class SMTPConnection:
+    """A reusable SMTP session, reconnected lazily when dropped or idle"""
+
+    def __init__(self, config):
+        self.config = config
+        self._smtp = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        import smtplib
+        config = self.config
+        smtp = smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=config['MAIL_SMTP_TIMEOUT'])
+        if config.get('MAIL_USE_TLS'):
+            smtp.starttls()
+        if config.get('MAIL_USERNAME') and config.get('MAIL_PASSWORD'):
+            smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        logger.info(f"Opened SMTP connection to {config['MAIL_SERVER']}:{config['MAIL_PORT']}")
+        return smtp
+
+    def send(self, sender, recipients, message):
+        import smtplib
+        if self._smtp is not None and time.monotonic() - self._last_used > self.config['MAIL_SMTP_IDLE_SECONDS']:
+            self.close()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        try:
+            self._smtp.send_message(message, from_addr=sender, to_addrs=recipients)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # Server dropped the session between batches, retry once on a fresh one
+            self.close()
+            self._smtp = self._connect()
+            self._smtp.send_message(message, from_addr=sender, to_addrs=recipients)
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.config['MAIL_SMTP_IDLE_SECONDS']:
+            self.close()
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+
+class MailDispatcher:
+    """Background workers that drain the outbox.
+
+    Each worker owns one SMTP connection that is kept open across batches.
+    Messages are claimed with a lease so several workers (or processes) can
+    share the outbox, failed sends are retried with exponential backoff and
+    messages whose worker died mid-send become pending again after the lease
+    expires.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.config = app.config
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._hostname = socket.gethostname()
+
+    def start(self):
+        if self._threads:
+            return
+        for index in range(self.config['MAIL_QUEUE_WORKERS']):
+            thread = threading.Thread(target=self._worker, name=f"mail-dispatcher-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        _register_dispatcher(self)
+        logger.info(f"Started {len(self._threads)} mail dispatcher workers")
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        _unregister_dispatcher(self)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _worker(self):
+        connection = SMTPConnection(self.config)
+        poll_seconds = self.config['MAIL_QUEUE_POLL_SECONDS']
+        try:
+            while not self._stopping.is_set():
+                try:
+                    with self.app.app_context():
+                        sent = self.run_once(connection)
+                except Exception as e:
+                    logger.error(f"Mail dispatcher error: {str(e)}")
+                    sent = 0
+                if sent:
+                    continue  # more mail may be waiting, skip the poll delay
+                connection.close_if_idle()
+                self._wakeup.wait(poll_seconds)
+                self._wakeup.clear()
+        finally:
+            connection.close()
+
+    def run_once(self, connection):
+        """Claim one batch and send it, recording each outcome as soon as it is sent.
+        Returns the number processed."""
+        token, emails = self._claim_batch()
+        for email in emails:
+            error = self._send(connection, email)
+            self._record(token, email, error)
+        return len(emails)
+
+    def _claim_batch(self):
+        """Lease a batch to a new token, return (token, detached emails) with no transaction left open"""
+        now = datetime.utcnow()
+        lease_cutoff = now - timedelta(seconds=self.config['MAIL_QUEUE_LEASE_SECONDS'])
+
+        # Release messages held by workers that died mid-send
+        OutboxEmail.query.filter(
+            OutboxEmail.status == 'sending',
+            OutboxEmail.locked_at < lease_cutoff
+        ).update({'status': 'pending', 'locked_by': None, 'locked_at': None}, synchronize_session=False)
+
+        candidate_ids = [row.id for row in db.session.query(OutboxEmail.id).filter(
+            OutboxEmail.status == 'pending',
+            OutboxEmail.next_attempt_at <= now
+        ).order_by(OutboxEmail.next_attempt_at, OutboxEmail.id).limit(self.config['MAIL_QUEUE_BATCH_SIZE'])]
+
+        if not candidate_ids:
+            db.session.commit()
+            return None, []
+
+        # Only rows still pending are taken, so concurrent claimers never share a message
+        token = f"{self._hostname[:32]}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+        OutboxEmail.query.filter(
+            OutboxEmail.id.in_(candidate_ids),
+            OutboxEmail.status == 'pending'
+        ).update({'status': 'sending', 'locked_by': token, 'locked_at': now}, synchronize_session=False)
+        db.session.commit()
+
+        # Sent from detached copies, so no transaction (or SQLite write lock) is held during SMTP
+        emails = OutboxEmail.query.filter_by(locked_by=token, status='sending').order_by(OutboxEmail.id).all()
+        for email in emails:
+            db.session.expunge(email)
+        db.session.commit()
+        return token, emails
+
+    def _send(self, connection, email):
+        """Send one message, return the error or None"""
+        try:
+            connection.send(email.sender, email.recipient_list(), build_message(email))
+        except Exception as e:
+            connection.close()
+            return e
+        return None
+
+    def _record(self, token, email, error):
+        """Store the outcome of one send and renew the lease on the rest of the batch"""
+        now = datetime.utcnow()
+        row = OutboxEmail.query.filter_by(id=email.id, locked_by=token, status='sending').first()
+        if row is None:
+            db.session.commit()
+            logger.warning(f"Email {email.id} was sent after its lease lapsed, outcome dropped")
+            return
+
+        row.attempts += 1
+        row.locked_by = None
+        row.locked_at = None
+        if error is None:
+            row.status = 'sent'
+            row.sent_at = now
+            row.last_error = None
+        else:
+            row.last_error = str(error)[:1000]
+            if is_permanent_smtp_error(error) or row.attempts >= self.config['MAIL_QUEUE_MAX_ATTEMPTS']:
+                row.status = 'failed'
+                logger.error(f"Giving up on email {row.id} after {row.attempts} attempts: {str(error)}")
+            else:
+                row.status = 'pending'
+                row.next_attempt_at = now + timedelta(seconds=self._backoff(row.attempts))
+                logger.warning(f"Email {row.id} attempt {row.attempts} failed, will retry: {str(error)}")
+
+        # A slow batch must not outlive MAIL_QUEUE_LEASE_SECONDS and be claimed (and sent) again
+        OutboxEmail.query.filter(
+            OutboxEmail.locked_by == token,
+            OutboxEmail.status == 'sending',
+            OutboxEmail.id != row.id
+        ).update({'locked_at': now}, synchronize_session=False)
+        db.session.commit()
+
+    def _backoff(self, attempts):
+        delay = self.config['MAIL_QUEUE_RETRY_BASE_SECONDS'] * (2 ** (attempts - 1))
+        delay = min(delay, self.config['MAIL_QUEUE_RETRY_MAX_SECONDS'])
+        return delay * random.uniform(0.8, 1.2)
+
+
+# Dispatchers running in this process, woken whenever a session that
+# enqueued mail commits so messages go out without waiting for a poll
+_dispatchers = []
+
+
+def _register_dispatcher(dispatcher):
+    _dispatchers.append(dispatcher)
+
+
+def _unregister_dispatcher(dispatcher):
+    if dispatcher in _dispatchers:
+        _dispatchers.remove(dispatcher)
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_dispatchers(session):
+    if session.info.pop('mail_enqueued', False):
+        for dispatcher in _dispatchers:
+            dispatcher.wake()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_enqueued(session):
+    session.info.pop('mail_enqueued', None)
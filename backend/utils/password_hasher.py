@@ -0,0 +1,88 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import threading
+import logging
+import bcrypt
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasherBusyError(Exception):
+    """Raised when too many hash/verify operations are already queued"""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded worker pool.
+
+    bcrypt releases the GIL while hashing, so a small thread pool gives real
+    parallelism while capping how many CPU-heavy hashes run at once. Calls
+    beyond ``max_pending`` (running + queued) fail fast with
+    PasswordHasherBusyError instead of piling up behind each other.
+    """
+
+    def __init__(self, rounds=12, max_workers=4, max_pending=32, timeout=10):
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            logger.warning("Password hashing pool saturated, rejecting request")
+            raise PasswordHasherBusyError("Password hashing queue is full")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordHasherBusyError("Password hashing timed out")
+
+    def hash(self, password):
+        """Hash a password with the configured work factor"""
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return self._submit(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, password, password_hash):
+        """Check a password against a stored bcrypt hash"""
+        if not password_hash:
+            return False
+        return self._submit(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with a different work factor than configured"""
+        return password_hash is not None and get_hash_rounds(password_hash) != self.rounds
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def get_hash_rounds(password_hash):
+    """Read the cost factor out of a '$2b$12$...' hash, None if unparseable"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher():
+    """Process-wide hasher built from Config on first use"""
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher(
+                    rounds=Config.BCRYPT_LOG_ROUNDS,
+                    max_workers=Config.PASSWORD_HASH_WORKERS,
+                    max_pending=Config.PASSWORD_HASH_MAX_PENDING,
+                    timeout=Config.PASSWORD_HASH_TIMEOUT
+                )
+    return _hasher
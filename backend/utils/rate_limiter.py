@@ -1,43 +1,108 @@
 from functools import wraps
 from flask import request, jsonify
 from models import db, RateLimitLog
+from utils.sqlite_engine import READ_ONLY_METHODS
 from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+import logging
+
+logger = logging.getLogger(__name__)
 
 def rate_limit(limit, period, endpoint_name=None):
-    """Rate limiting decorator"""
+    """Rate limiting decorator.
+
+    The attempt is logged in the view's own transaction, so a view that
+    commits writes it for free. It is only committed separately when the
+    view ends without committing or rolls it back, and for read-only
+    requests, whose transaction is kept free of writes (on SQLite a read
+    that turns into a write holds the write lock for the rest of the view).
+    """
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             ip_address = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
             if ip_address:
                 ip_address = ip_address.split(',')[0].strip()
-            
+
             endpoint = endpoint_name or request.endpoint
-            
+
             # Convert period (seconds) to hours for timedelta
             window_hours = period / 3600.0
             cutoff_time = datetime.utcnow() - timedelta(hours=window_hours)
-            
+
             # Count attempts in the time window
             recent_attempts = RateLimitLog.query.filter(
                 RateLimitLog.ip_address == ip_address,
                 RateLimitLog.endpoint == endpoint,
                 RateLimitLog.attempt_time > cutoff_time
             ).count()
-            
+
             if recent_attempts >= limit:
                 return jsonify({
                     'error': f'Rate limit exceeded. Maximum {limit} attempts per {period//3600} hour(s). Please try again later.'
                 }), 429
-            
-            # Log this attempt
+
+            # Log this attempt, committed together with the view's changes
             log_entry = RateLimitLog(
                 ip_address=ip_address,
-                endpoint=endpoint
+                endpoint=endpoint,
+                attempt_time=datetime.utcnow()
             )
-            db.session.add(log_entry)
-            db.session.commit()
-            
-            return f(*args, **kwargs)
+            if request.method not in READ_ONLY_METHODS:
+                db.session.add(log_entry)
+            db.session.info['rate_limit_attempt'] = log_entry
+
+            try:
+                return f(*args, **kwargs)
+            finally:
+                _persist_attempt()
         return decorated_function
-    return decorator
\ No newline at end of file
+    return decorator
+
+
+def claim_attempt():
+    """Take the uncommitted attempt log away from the request's session, return its column values or None.
+
+    For views that write through another transaction (group commit), which
+    then inserts the log along with its own rows.
+    """
+    log_entry = db.session.info.pop('rate_limit_attempt', None)
+    if log_entry is None:
+        return None
+    if log_entry in db.session:
+        db.session.expunge(log_entry)
+    return {
+        'ip_address': log_entry.ip_address,
+        'endpoint': log_entry.endpoint,
+        'attempt_time': log_entry.attempt_time
+    }
+
+
+def _persist_attempt():
+    log_entry = db.session.info.pop('rate_limit_attempt', None)
+    if log_entry is None:
+        return  # committed with the view, or claimed
+    try:
+        if log_entry not in db.session:
+            # The view rolled back, which discarded the attempt too, or only read.
+            # The log goes in a transaction of its own that starts with the INSERT.
+            db.session.commit()
+            db.session.add(RateLimitLog(
+                ip_address=log_entry.ip_address,
+                endpoint=log_entry.endpoint,
+                attempt_time=log_entry.attempt_time
+            ))
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Error logging rate limit attempt: {str(e)}")
+
+
+@event.listens_for(Session, 'after_commit')
+def _attempt_committed(session):
+    # Only when the commit wrote it, read-only requests never add it to the session
+    log_entry = session.info.get('rate_limit_attempt')
+    if log_entry is not None and log_entry in session:
+        session.info.pop('rate_limit_attempt', None)
@@ -0,0 +1,159 @@
+from collections import namedtuple
+from functools import wraps
+from flask import current_app, request
+from flask_jwt_extended import get_jwt_identity
+from cachetools import TLRUCache
+import itertools
+import logging
+import threading
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Serialized 200 response kept for one (view, user, tag generations, query)
+CachedResponse = namedtuple('CachedResponse', ['body', 'mimetype', 'ttl'])
+
+
+class ResponseCache:
+    """Per-process LRU + TTL cache of serialized GET responses, capped in bytes.
+
+    Keys carry the user's current generation of every tag the view depends
+    on. invalidate(user_id, tag) moves that tag to a fresh generation, so
+    the user's older entries are never read again and age out of the LRU.
+    Generations come from one process-wide counter, a forgotten generation
+    is replaced by a fresh one, never by an old value.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entry_bytes=1024 * 1024, max_users=100000):
+        self._cache = TLRUCache(
+            maxsize=max_bytes,
+            ttu=lambda key, value, now: now + value.ttl,
+            getsizeof=lambda value: len(value.body) + 200
+        )
+        self._generations = TLRUCache(maxsize=max_users, ttu=lambda key, value, now: now + 86400)
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self.max_entry_bytes = max_entry_bytes
+        self.hits = 0
+        self.misses = 0
+        self.too_large = 0
+        self.invalidations = 0
+        self._endpoints = {}
+
+    def _generation(self, user_id, tag):
+        key = (user_id, tag)
+        generation = self._generations.get(key)
+        if generation is None:
+            generation = self._generations[key] = next(self._counter)
+        return generation
+
+    def key(self, endpoint, user_id, tags, query):
+        with self._lock:
+            return (endpoint, user_id, tuple(self._generation(user_id, tag) for tag in tags), query)
+
+    def get(self, key):
+        with self._lock:
+            cached = self._cache.get(key)
+            counts = self._endpoints.setdefault(key[0], [0, 0])
+            if cached is None:
+                self.misses += 1
+                counts[1] += 1
+            else:
+                self.hits += 1
+                counts[0] += 1
+            return cached
+
+    def put(self, key, cached):
+        if len(cached.body) > self.max_entry_bytes:
+            with self._lock:
+                self.too_large += 1
+            return
+        with self._lock:
+            self._cache[key] = cached
+
+    def invalidate(self, user_id, *tags):
+        user_id = int(user_id)
+        with self._lock:
+            for tag in tags:
+                self._generations[(user_id, tag)] = next(self._counter)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._cache),
+                'bytes': self._cache.currsize,
+                'max_bytes': self._cache.maxsize,
+                'too_large': self.too_large,
+                'invalidations': self.invalidations,
+                'endpoints': {
+                    endpoint: {'hits': hits, 'misses': misses}
+                    for endpoint, (hits, misses) in self._endpoints.items()
+                }
+            }
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide response cache built from Config on first use"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(
+                    max_bytes=Config.RESPONSE_CACHE_MAX_BYTES,
+                    max_entry_bytes=Config.RESPONSE_CACHE_MAX_ENTRY_BYTES
+                )
+    return _response_cache
+
+
+def invalidate_responses(user_id, *tags):
+    """Drop the user's cached responses that depend on any of tags, call after the write commits"""
+    get_response_cache().invalidate(user_id, *tags)
+
+
+def cached_response(*tags, ttl=None):
+    """Serve repeated GETs of the same user and query string from memory.
+
+    Goes below @jwt_required() and @route_to_user_shard, above
+    @rate_limit so a hit costs neither a query nor JSON encoding. Only 200
+    responses are stored. tags name what the payload depends on; write
+    handlers call invalidate_responses(user_id, tag) after committing.
+    Writes made by another worker show up after ttl (RESPONSE_CACHE_SECONDS
+    by default), or when the database event broadcaster relays them.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not current_app.config['RESPONSE_CACHE_ENABLED']:
+                return f(*args, **kwargs)
+
+            cache = get_response_cache()
+            query = tuple(sorted(request.args.items(multi=True)))
+            key = cache.key(request.endpoint, int(get_jwt_identity()), tags, (tuple(sorted(kwargs.items())), query))
+            cached = cache.get(key)
+            if cached is not None:
+                response = current_app.response_class(cached.body, status=200, mimetype=cached.mimetype)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                cache.put(key, CachedResponse(
+                    response.get_data(), response.mimetype, ttl or current_app.config['RESPONSE_CACHE_SECONDS']
+                ))
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,305 @@
+from models import db, JobRun
+from datetime import datetime, timedelta
+from sqlalchemy import func, text
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+import os
+import random
+import socket
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class MySQLLeaderLock:
+    """Named MySQL advisory lock (GET_LOCK) held on a dedicated connection.
+
+    The lock belongs to that connection's session, so the server releases
+    it as soon as the holder exits or its connection drops, on any host.
+    """
+
+    def __init__(self, engine, name):
+        self.engine = engine
+        self.name = name
+        self._connection = None
+
+    def acquire(self):
+        if self._connection is not None:
+            return self.is_held()
+        connection = self.engine.connect()
+        try:
+            acquired = connection.execute(text("SELECT GET_LOCK(:name, 0)"), {'name': self.name}).scalar() == 1
+            connection.commit()
+        except SQLAlchemyError:
+            connection.invalidate()
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        self._connection = connection
+        return True
+
+    def is_held(self):
+        if self._connection is None:
+            return False
+        try:
+            held = self._connection.execute(
+                text("SELECT IS_USED_LOCK(:name) = CONNECTION_ID()"), {'name': self.name}
+            ).scalar() == 1
+            self._connection.commit()
+        except SQLAlchemyError as e:
+            logger.warning(f"Scheduler lock connection failed: {str(e)}")
+            held = False
+        if not held:
+            self._discard()
+        return held
+
+    def release(self):
+        if self._connection is None:
+            return
+        try:
+            self._connection.execute(text("SELECT RELEASE_LOCK(:name)"), {'name': self.name})
+            self._connection.commit()
+        except SQLAlchemyError:
+            pass
+        self._discard()
+
+    def _discard(self):
+        # Never hand a connection that may still hold the lock back to the pool
+        try:
+            self._connection.invalidate()
+            self._connection.close()
+        except SQLAlchemyError:
+            pass
+        self._connection = None
+
+
+class FileLeaderLock:
+    """Exclusive lock on a local file, for deployments where all workers share one host"""
+
+    def __init__(self, path, owner=''):
+        self.path = path
+        self.owner = owner
+        self._handle = None
+
+    def acquire(self):
+        if self._handle is not None:
+            return True
+        handle = open(self.path, 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            handle.close()
+            return False
+        handle.seek(0)
+        handle.truncate()
+        handle.write(self.owner)
+        handle.flush()
+        self._handle = handle
+        return True
+
+    def is_held(self):
+        return self._handle is not None
+
+    def release(self):
+        if self._handle is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._handle.fileno(), fcntl.LOCK_UN)
+            else:
+                self._handle.seek(0)
+                msvcrt.locking(self._handle.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError:
+            pass
+        self._handle.close()
+        self._handle = None
+
+
+def build_leader_lock(config, owner='', suffix=None):
+    """Leader lock from SCHEDULER_LOCK: 'mysql', 'file', or 'auto' (mysql on MySQL, file otherwise).
+    suffix names a separate lock of the same kind, e.g. 'bootstrap'."""
+    mode = config['SCHEDULER_LOCK']
+    if mode == 'auto':
+        mode = 'mysql' if db.engine.dialect.name == 'mysql' else 'file'
+    if mode == 'mysql':
+        name = config['SCHEDULER_LOCK_NAME']
+        return MySQLLeaderLock(db.engine, f"{name}_{suffix}" if suffix else name)
+    path = config['SCHEDULER_LOCK_FILE']
+    return FileLeaderLock(f"{path}.{suffix}" if suffix else path, owner)
+
+
+class ScheduledJob:
+    def __init__(self, name, func, interval_seconds, jitter_seconds=0, record_history=True):
+        self.name = name
+        self.func = func
+        self.interval_seconds = interval_seconds
+        self.jitter_seconds = jitter_seconds
+        self.record_history = record_history
+        self.next_run = None
+        self.last_status = None
+
+    def delay(self):
+        return timedelta(seconds=self.interval_seconds + random.uniform(0, self.jitter_seconds))
+
+
+class Scheduler:
+    """Runs periodic jobs in exactly one process.
+
+    Every process that starts a scheduler competes for a leader lock. The
+    winner runs due jobs one at a time on its scheduler thread, the others
+    retry the lock every SCHEDULER_LEADER_RETRY_SECONDS and take over when
+    the leader exits. Each run is recorded in scheduler_job_runs, and a new
+    leader schedules jobs from that history, so a failover or redeploy does
+    not rerun every job at once. Random jitter keeps jobs with the same
+    interval from firing together.
+    """
+
+    def __init__(self, app, lock=None):
+        self.app = app
+        self.config = app.config
+        self.jobs = {}
+        self.lock = lock
+        self.owner = f"{socket.gethostname()[:32]}:{os.getpid()}"
+        self.is_leader = False
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def add_job(self, name, func, interval_seconds, jitter_seconds=0, record_history=True):
+        """Register a job, record_history=False skips scheduler_job_runs for high-frequency jobs"""
+        self.jobs[name] = ScheduledJob(name, func, interval_seconds, jitter_seconds, record_history)
+
+    def start(self):
+        if self._thread:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name='scheduler', daemon=True)
+        self._thread.start()
+        logger.info(f"Started scheduler with {len(self.jobs)} jobs")
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _loop(self):
+        retry_seconds = self.config['SCHEDULER_LEADER_RETRY_SECONDS']
+        try:
+            while not self._stopping.is_set():
+                try:
+                    with self.app.app_context():
+                        wait = self._tick()
+                except Exception as e:
+                    logger.error(f"Scheduler error: {str(e)}")
+                    wait = retry_seconds
+                self._stopping.wait(wait)
+        finally:
+            self._resign()
+
+    def _tick(self):
+        """Run due jobs if leader, return seconds until the next check"""
+        retry_seconds = self.config['SCHEDULER_LEADER_RETRY_SECONDS']
+        if self.lock is None:
+            self.lock = build_leader_lock(self.config, self.owner)
+
+        if not self.is_leader:
+            if not self.lock.acquire():
+                return retry_seconds
+            self.is_leader = True
+            logger.info(f"Scheduler leadership acquired by {self.owner}")
+            self._plan_from_history()
+        elif not self.lock.is_held():
+            self.is_leader = False
+            logger.warning(f"Scheduler leadership lost by {self.owner}")
+            return retry_seconds
+
+        for job in sorted(self.jobs.values(), key=lambda job: job.next_run):
+            if self._stopping.is_set():
+                break
+            if job.next_run <= datetime.utcnow():
+                self._run(job)
+
+        until_next = min(job.next_run for job in self.jobs.values()) - datetime.utcnow()
+        # Wake up at least every retry interval to confirm the lock is still held
+        return min(max(until_next.total_seconds(), 0.1), retry_seconds)
+
+    def _plan_from_history(self):
+        last_started = dict(db.session.query(JobRun.job, func.max(JobRun.started_at)).filter(
+            JobRun.job.in_([job.name for job in self.jobs.values() if job.record_history])
+        ).group_by(JobRun.job).all())
+        db.session.commit()
+
+        now = datetime.utcnow()
+        for job in self.jobs.values():
+            started = last_started.get(job.name)
+            job.next_run = started + job.delay() if started else now
+            if job.next_run <= now:
+                job.next_run = now + timedelta(seconds=random.uniform(0, job.jitter_seconds))
+
+    def _run(self, job):
+        run = None
+        if job.record_history:
+            run = JobRun(job=job.name, owner=self.owner, status='running', started_at=datetime.utcnow())
+            db.session.add(run)
+            db.session.commit()
+
+        started = time.perf_counter()
+        status, result, error = 'success', None, None
+        try:
+            result = job.func()
+        except Exception as e:
+            db.session.rollback()
+            status, error = 'failed', str(e)
+            logger.error(f"Scheduled job {job.name} failed: {error}")
+        elapsed = time.perf_counter() - started
+
+        if run is not None:
+            run.status = status
+            run.result = str(result)[:2000] if result is not None else None
+            run.error = error[:2000] if error else None
+            run.finished_at = datetime.utcnow()
+            run.duration_ms = int(elapsed * 1000)
+            try:
+                db.session.commit()
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                logger.error(f"Error recording run of {job.name}: {str(e)}")
+
+        job.last_status = status
+        job.next_run = datetime.utcnow() + job.delay()
+        if job.record_history:
+            logger.info(f"Scheduled job {job.name} {status} in {elapsed:.2f}s, next run at {job.next_run.isoformat()}")
+
+    def _resign(self):
+        if self.lock is not None:
+            self.lock.release()
+        if self.is_leader:
+            logger.info(f"Scheduler leadership released by {self.owner}")
+        self.is_leader = False
+
+    def status(self):
+        return {
+            'leader': self.is_leader,
+            'owner': self.owner,
+            'jobs': {
+                job.name: {
+                    'interval_seconds': job.interval_seconds,
+                    'next_run': job.next_run.isoformat() if self.is_leader and job.next_run else None,
+                    'last_status': job.last_status
+                }
+                for job in self.jobs.values()
+            }
+        }
@@ -0,0 +1,292 @@
+from models import db, User, UserShard, Category, Expense, ExpenseTombstone, SpendingSketch, TransactionFlag, UserStats, seed_default_categories
+from functools import wraps
+from flask import jsonify
+from flask_jwt_extended import get_jwt_identity
+from cachetools import TTLCache
+from sqlalchemy import func, inspect, or_, select
+from sqlalchemy.schema import CreateIndex, CreateTable
+from utils.sharding import HOME_SHARD, SHARDED_TABLES, bind_key, shard_names, use_shard
+import logging
+import threading
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def shard_engine(shard):
+    return db.engines[bind_key(shard)]
+
+
+def create_missing_indexes(engine, table_names):
+    """Add indexes declared on the models to tables created before them, return their names"""
+    created = []
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        existing_tables = set(inspector.get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in table_names or table.name not in existing_tables:
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name and index.name not in existing:
+                    connection.execute(CreateIndex(index))
+                    created.append(index.name)
+    return created
+
+
+def create_shard_tables(engine):
+    """Create the sharded tables on a shard database, return the names created.
+
+    Foreign keys to global tables (users) are left out, those rows live on
+    the home shard. Deleted users are cleaned up through their tombstones.
+    """
+    existing = set(inspect(engine).get_table_names())
+    created = []
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in SHARDED_TABLES or table.name in existing:
+                continue
+            local_keys = [
+                constraint for constraint in table.foreign_key_constraints
+                if constraint.referred_table.name in SHARDED_TABLES
+            ]
+            connection.execute(CreateTable(table, include_foreign_key_constraints=local_keys))
+            for index in table.indexes:
+                connection.execute(CreateIndex(index))
+            created.append(table.name)
+    create_missing_indexes(engine, SHARDED_TABLES - set(created))
+    return created
+
+
+def prepare_shards():
+    """Create tables and default categories on every shard besides home"""
+    for shard in shard_names()[1:]:
+        created = create_shard_tables(shard_engine(shard))
+        with use_shard(shard):
+            seed_default_categories()
+        if created:
+            logger.info(f"Created {', '.join(created)} on shard {shard}")
+
+
+class ShardRouter:
+    """Maps users to shards through the user_shards directory on the home shard.
+
+    Lookups are cached per process for SHARD_MAP_CACHE_SECONDS. Moving a
+    user first marks the entry 'moving' and waits out that TTL, so every
+    worker has stopped writing to the old shard before rows are copied,
+    and requests get a 503 until the move finishes. With no extra shards
+    configured every lookup answers home without touching the database.
+    """
+
+    def __init__(self, shards, cache_seconds=30, maxsize=100000, move_batch_size=1000):
+        self.shards = list(shards)
+        self.cache_seconds = cache_seconds
+        self.move_batch_size = move_batch_size
+        self._cache = TTLCache(maxsize=maxsize, ttl=cache_seconds)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return len(self.shards) > 1
+
+    def lookup(self, user_id):
+        """(shard, status) of a user"""
+        if not self.enabled:
+            return HOME_SHARD, 'active'
+        key = int(user_id)
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is not None:
+            return entry
+
+        row = db.session.query(UserShard.shard, UserShard.status).filter_by(user_id=key).first()
+        entry = (row.shard, row.status) if row else (HOME_SHARD, 'active')
+        if entry[0] not in self.shards:
+            raise LookupError(f"User {key} is assigned to unknown shard {entry[0]}")
+        with self._lock:
+            self._cache[key] = entry
+        return entry
+
+    def group_by_shard(self, user_ids):
+        """{shard: [user_id, ...]} for a batch of users, one directory query"""
+        user_ids = [int(user_id) for user_id in user_ids]
+        if not self.enabled:
+            return {HOME_SHARD: user_ids} if user_ids else {}
+        assigned = dict(db.session.query(UserShard.user_id, UserShard.shard).filter(
+            UserShard.user_id.in_(user_ids)
+        ).all())
+        groups = {}
+        for user_id in user_ids:
+            groups.setdefault(assigned.get(user_id, HOME_SHARD), []).append(user_id)
+        return groups
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(int(user_id), None)
+
+    def loads(self):
+        """{shard: {user_id: expense rows}} for the users each shard currently owns"""
+        loads = {shard: {} for shard in self.shards}
+        for shard in self.shards:
+            with shard_engine(shard).connect() as connection:
+                counts = dict(connection.execute(
+                    select(Expense.user_id, func.count(Expense.id)).group_by(Expense.user_id)
+                ).all())
+            owners = self.group_by_shard(counts.keys())
+            # Rows left behind on a shard by an interrupted move do not count
+            for user_id in owners.get(shard, []):
+                loads[shard][user_id] = counts[user_id]
+        db.session.commit()
+        return loads
+
+    def move_user(self, user_id, target, wait=True):
+        """Move a user's expenses, categories and stats to target, return the number of expenses moved.
+
+        Expense and custom category ids change, default categories are
+        matched by type and name on the target shard. Delta sync tokens
+        name their shard, so clients are told to reload after a move.
+        """
+        user_id = int(user_id)
+        if target not in self.shards:
+            raise ValueError(f"Unknown shard {target}, configured shards: {', '.join(self.shards)}")
+        if db.session.get(User, user_id) is None:
+            raise ValueError(f"User {user_id} does not exist")
+
+        entry = db.session.get(UserShard, user_id)
+        source = entry.shard if entry else HOME_SHARD
+        if source == target:
+            return 0
+        if entry is None:
+            entry = UserShard(user_id=user_id, shard=source)
+            db.session.add(entry)
+        entry.status = 'moving'
+        db.session.commit()
+        self.invalidate(user_id)
+        if wait:
+            # Every worker's cached entry has expired and they now answer 503 for this user
+            time.sleep(self.cache_seconds + 1)
+
+        started = time.perf_counter()
+        try:
+            moved = self._copy_rows(user_id, source, target)
+        except Exception:
+            db.session.rollback()
+            entry.status = 'active'
+            db.session.commit()
+            raise
+
+        entry.shard = target
+        entry.status = 'active'
+        db.session.commit()
+        self.invalidate(user_id)
+
+        try:
+            with shard_engine(source).begin() as connection:
+                self._delete_rows(connection, user_id)
+        except Exception as e:
+            logger.error(f"User {user_id} moved to {target} but rows are left on {source}: {str(e)}")
+        logger.info(f"Moved user {user_id} from {source} to {target}: {moved} expenses in {time.perf_counter() - started:.2f}s")
+        return moved
+
+    @staticmethod
+    def _delete_rows(connection, user_id):
+        # Tombstones refer to the old expense ids, clients resync after a move anyway.
+        # Sketches are keyed by the old category ids, they are rebuilt on the target when first read.
+        # Flags name old expense ids too, the next anomaly detection run recreates them
+        for table in (Expense.__table__, ExpenseTombstone.__table__, SpendingSketch.__table__,
+                      TransactionFlag.__table__, UserStats.__table__, Category.__table__):
+            connection.execute(table.delete().where(table.c.user_id == user_id))
+
+    def _copy_rows(self, user_id, source, target):
+        categories = Category.__table__
+        expenses = Expense.__table__
+        stats = UserStats.__table__
+        with shard_engine(source).connect() as src, shard_engine(target).begin() as dst:
+            def read(statement):
+                # The user is frozen while moving, short read transactions keep other writers on the source going
+                rows = src.execute(statement).all()
+                src.rollback()
+                return rows
+
+            # Leftovers of an earlier interrupted move
+            self._delete_rows(dst, user_id)
+
+            target_defaults = {
+                (row.type, row.name): row.id
+                for row in dst.execute(select(categories.c.id, categories.c.type, categories.c.name).where(
+                    categories.c.is_default == True, categories.c.user_id.is_(None)
+                ))
+            }
+            category_ids = {}
+            for row in read(select(categories).where(or_(
+                categories.c.user_id == user_id,
+                (categories.c.is_default == True) & categories.c.user_id.is_(None)
+            ))):
+                if row.user_id is None:
+                    category_ids[row.id] = target_defaults.get((row.type, row.name))
+                    continue
+                values = dict(row._mapping)
+                del values['id']
+                category_ids[row.id] = dst.execute(categories.insert().values(**values)).inserted_primary_key[0]
+
+            moved = 0
+            last_id = 0
+            while True:
+                rows = read(select(expenses).where(
+                    expenses.c.user_id == user_id, expenses.c.id > last_id
+                ).order_by(expenses.c.id).limit(self.move_batch_size))
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                batch = []
+                for row in rows:
+                    values = dict(row._mapping)
+                    del values['id']
+                    values['category_id'] = category_ids.get(values['category_id'])
+                    batch.append(values)
+                dst.execute(expenses.insert(), batch)
+                moved += len(batch)
+
+            for row in read(select(stats).where(stats.c.user_id == user_id)):
+                dst.execute(stats.insert().values(**row._mapping))
+        return moved
+
+
+def route_to_user_shard(f):
+    """Run the view with the JWT user's shard selected, goes below @jwt_required()"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        try:
+            shard, status = get_shard_router().lookup(get_jwt_identity())
+        except LookupError as e:
+            logger.error(str(e))
+            return jsonify({'error': 'Database error occurred'}), 500
+        if status == 'moving':
+            response = jsonify({'error': 'Your data is being moved, please try again shortly'})
+            response.headers['Retry-After'] = str(Config.SHARD_MAP_CACHE_SECONDS)
+            return response, 503
+        with use_shard(shard):
+            return f(*args, **kwargs)
+    return decorated_function
+
+
+_shard_router = None
+_shard_router_lock = threading.Lock()
+
+
+def get_shard_router():
+    """Process-wide shard router built from Config on first use"""
+    global _shard_router
+    if _shard_router is None:
+        with _shard_router_lock:
+            if _shard_router is None:
+                _shard_router = ShardRouter(
+                    shard_names(),
+                    cache_seconds=Config.SHARD_MAP_CACHE_SECONDS,
+                    move_batch_size=Config.SHARD_MOVE_BATCH_SIZE
+                )
+    return _shard_router
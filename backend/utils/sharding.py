@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect
+from sqlalchemy.sql.util import find_tables
+from config import Config
+
+# The main database. It keeps users, the shard directory and every global
+# table, and holds the user-owned rows of users without a directory entry.
+HOME_SHARD = 'home'
+
+# Tables whose rows belong to one user and live on that user's shard
+SHARDED_TABLES = frozenset([
+    'categories', 'expenses', 'expense_tombstones', 'spending_sketches', 'transaction_flags', 'user_stats'
+])
+
+_current_shard = ContextVar('current_shard', default=None)
+
+
+def shard_names(binds=None):
+    """Every shard, home first, from SQLALCHEMY_BINDS keys named shard_<n>"""
+    binds = Config.SQLALCHEMY_BINDS if binds is None else binds
+    return [HOME_SHARD] + sorted((key for key in binds if key.startswith('shard_')), key=lambda key: int(key[6:]))
+
+
+def bind_key(shard):
+    """Flask-SQLAlchemy bind key of a shard, None is the default engine"""
+    return None if shard == HOME_SHARD else shard
+
+
+def shard_for_new_user(user_id):
+    """Placement of a new user from SHARD_PLACEMENT: 'hash' (user_id modulo shards) or 'home'"""
+    shards = shard_names()
+    if Config.SHARD_PLACEMENT != 'hash' or len(shards) == 1:
+        return HOME_SHARD
+    return shards[user_id % len(shards)]
+
+
+def current_shard():
+    return _current_shard.get() or HOME_SHARD
+
+
+@contextmanager
+def use_shard(shard):
+    """Route queries on SHARDED_TABLES to shard for the duration of the block"""
+    token = _current_shard.set(shard)
+    try:
+        yield shard
+    finally:
+        _current_shard.reset(token)
+
+
+def _touches_sharded_table(mapper, clause):
+    if mapper is not None:
+        return inspect(mapper).local_table.name in SHARDED_TABLES
+    if clause is not None:
+        return any(getattr(table, 'name', None) in SHARDED_TABLES for table in find_tables(clause, include_crud=True))
+    return False
+
+
+class ShardedSession(Session):
+    """Session that sends statements on SHARDED_TABLES to the shard selected with use_shard.
+
+    Everything else, and sharded tables outside a use_shard block, goes to
+    the default engine as usual. A statement is routed as a whole, so a
+    query joining a sharded table with a global one (users) only works on
+    the home shard.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shard = _current_shard.get()
+        if bind is None and shard not in (None, HOME_SHARD) and _touches_sharded_table(mapper, clause):
+            return self._db.engines[shard]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
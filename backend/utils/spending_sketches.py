@@ -0,0 +1,199 @@
+from models import db, Expense, SpendingSketch
+from datetime import datetime
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from utils.sqlite_engine import begin_writes
+from utils.tdigest import TDigest
+from utils.user_stats import UserStatsService
+import logging
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+UNDATED_MONTH = '0000-00'
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def month_key(date):
+    return date.strftime('%Y-%m') if date else UNDATED_MONTH
+
+
+def _month_range(month):
+    """Expense.date bounds of a YYYY-MM key"""
+    year, month_number = int(month[:4]), int(month[5:])
+    start = datetime(year, month_number, 1)
+    end = datetime(year + month_number // 12, month_number % 12 + 1, 1)
+    return Expense.date >= start, Expense.date < end
+
+
+def _counts_as_spending(expense_type):
+    # Same split as user_stats.expense_count: everything that is not income
+    return expense_type != 'income'
+
+
+class SpendingSketchService:
+    """Per user, category and month t-digests of expense amounts.
+
+    New expenses are added to their sketch in the write's own transaction.
+    A t-digest cannot forget a value, so updates and deletes mark the
+    affected sketch stale instead, and it is rebuilt from that month's
+    rows the next time it is read. If the sketched counts do not add up to
+    user_stats.expense_count (sketches predating this table, a shard move,
+    a missed write) all of the user's sketches are rebuilt.
+    """
+
+    @staticmethod
+    def expense_added(expense):
+        if not _counts_as_spending(expense.type):
+            return
+        user_id = int(expense.user_id)
+        category_id = expense.category_id or 0
+        month = month_key(expense.date)
+        sketch = SpendingSketch.query.filter_by(
+            user_id=user_id, category_id=category_id, month=month
+        ).with_for_update().first()
+        if sketch is None:
+            digest = TDigest(Config.SKETCH_COMPRESSION)
+            digest.add(expense.amount)
+            try:
+                with db.session.begin_nested():
+                    db.session.add(SpendingSketch(
+                        user_id=user_id, category_id=category_id, month=month, count=1, digest=digest.to_bytes()
+                    ))
+            except IntegrityError:
+                # Created concurrently, let the next read rebuild it with both rows
+                SpendingSketchService._mark_stale(user_id, category_id, month)
+            return
+        if sketch.stale:
+            return
+        digest = TDigest.from_bytes(sketch.digest)
+        digest.add(expense.amount)
+        sketch.digest = digest.to_bytes()
+        sketch.count += 1
+
+    @staticmethod
+    def expense_changed(before, expense):
+        old_key = (before.category_id or 0, month_key(before.date))
+        new_key = (expense.category_id or 0, month_key(expense.date))
+        if before.type == expense.type and before.amount == expense.amount and old_key == new_key:
+            return
+        if _counts_as_spending(before.type):
+            SpendingSketchService._mark_stale(int(expense.user_id), *old_key)
+        if old_key != new_key or not _counts_as_spending(before.type):
+            SpendingSketchService.expense_added(expense)
+
+    @staticmethod
+    def expense_removed(expense):
+        if _counts_as_spending(expense.type):
+            SpendingSketchService._mark_stale(int(expense.user_id), expense.category_id or 0, month_key(expense.date))
+
+    @staticmethod
+    def _mark_stale(user_id, category_id, month):
+        SpendingSketch.query.filter_by(
+            user_id=user_id, category_id=category_id, month=month
+        ).update({'stale': True}, synchronize_session=False)
+
+    @staticmethod
+    def _rebuild(sketch):
+        """Recompute a stale sketch from its month's rows, False when they are all gone (row deleted)"""
+        query = db.session.query(Expense.amount).filter(
+            Expense.user_id == sketch.user_id,
+            or_(Expense.type.is_(None), Expense.type != 'income')
+        )
+        if sketch.category_id:
+            query = query.filter(Expense.category_id == sketch.category_id)
+        else:
+            query = query.filter(Expense.category_id.is_(None))
+        if sketch.month == UNDATED_MONTH:
+            query = query.filter(Expense.date.is_(None))
+        else:
+            query = query.filter(*_month_range(sketch.month))
+
+        digest = TDigest(Config.SKETCH_COMPRESSION)
+        for (amount,) in query:
+            digest.add(amount)
+        if not digest.count:
+            db.session.delete(sketch)
+            return False
+        sketch.digest = digest.to_bytes()
+        sketch.count = digest.count
+        sketch.stale = False
+        return True
+
+    @staticmethod
+    def rebuild_user(user_id):
+        """Replace all of the user's sketches with ones built from their expenses, return how many"""
+        SpendingSketch.query.filter_by(user_id=user_id).delete()
+        digests = {}
+        rows = db.session.query(Expense.category_id, Expense.date, Expense.amount).filter(
+            Expense.user_id == user_id,
+            or_(Expense.type.is_(None), Expense.type != 'income')
+        )
+        for category_id, date, amount in rows:
+            key = (category_id or 0, month_key(date))
+            digest = digests.get(key)
+            if digest is None:
+                digest = digests[key] = TDigest(Config.SKETCH_COMPRESSION)
+            digest.add(amount)
+        db.session.add_all([
+            SpendingSketch(user_id=user_id, category_id=category_id, month=month,
+                           count=digest.count, digest=digest.to_bytes())
+            for (category_id, month), digest in digests.items()
+        ])
+        db.session.flush()
+        logger.info(f"Rebuilt {len(digests)} spending sketches for user {user_id}")
+        return len(digests)
+
+    @staticmethod
+    def load(user_id):
+        """All of the user's sketches, repaired first where needed. Commits when it repaired anything."""
+        user_id = int(user_id)
+        stats = UserStatsService.get(user_id)
+        if stats is None:
+            return []
+        expected = stats.expense_count
+        sketches = SpendingSketch.query.filter_by(user_id=user_id).all()
+        repaired = False
+        stale = [sketch for sketch in sketches if sketch.stale]
+        if stale or sum(sketch.count for sketch in sketches) != expected:
+            begin_writes(db.session)
+        if stale:
+            # Lock them first so writers in flight finish before the rows are read
+            SpendingSketch.query.filter(SpendingSketch.id.in_([sketch.id for sketch in stale])).with_for_update().all()
+            sketches = [sketch for sketch in sketches if not sketch.stale or SpendingSketchService._rebuild(sketch)]
+            repaired = True
+        if sum(sketch.count for sketch in sketches) != expected:
+            SpendingSketchService.rebuild_user(user_id)
+            repaired = True
+
+        if repaired:
+            db.session.commit()
+            sketches = SpendingSketch.query.filter_by(user_id=user_id).all()
+        return sketches
+
+    @staticmethod
+    def quantiles(user_id, since_month):
+        """[{category_id, count, min, max, p50, p90, p99}] over the months from since_month, biggest p50 first"""
+        merged = {}
+        for sketch in SpendingSketchService.load(user_id):
+            if sketch.month < since_month:
+                continue
+            digest = TDigest.from_bytes(sketch.digest)
+            if sketch.category_id in merged:
+                merged[sketch.category_id].merge(digest)
+            else:
+                merged[sketch.category_id] = digest
+
+        results = []
+        for category_id, digest in merged.items():
+            entry = {
+                'category_id': category_id or None,
+                'count': digest.count,
+                'min': round(digest.min, 2),
+                'max': round(digest.max, 2)
+            }
+            for q in QUANTILES:
+                entry[f"p{int(q * 100)}"] = round(digest.quantile(q), 2)
+            results.append(entry)
+        results.sort(key=lambda entry: -entry['p50'])
+        return results
@@ -0,0 +1,117 @@
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+BEGIN_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+# Requests with these methods only read, their transactions start DEFERRED
+READ_ONLY_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+_READ_STATEMENT = re.compile(r'\s*(SELECT|WITH|PRAGMA|EXPLAIN)\b', re.IGNORECASE)
+
+
+def sqlite_pragmas(config):
+    """Per-connection pragmas for the SQLite engine mode, in the order they are applied"""
+    return [
+        ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        ('mmap_size', int(config['SQLITE_MMAP_SIZE'])),
+        ('busy_timeout', int(config['SQLITE_BUSY_TIMEOUT_MS'])),
+        # SQLite ignores foreign keys unless asked, the ON DELETE rules in models.py rely on them
+        ('foreign_keys', 'ON')
+    ]
+
+
+def mark_reader(session):
+    """Start the session's transactions DEFERRED, for background code that only reads.
+
+    Read-only requests get this without asking. Everything else starts
+    its transactions with the write lock, see configure_sqlite_engine().
+    """
+    session.info['sqlite_reads_only'] = True
+
+
+def begin_writes(session):
+    """Let a read-only session write, for the rare read that repairs data on the way.
+
+    Ends its DEFERRED transaction, so the next one takes the write lock
+    instead of upgrading a snapshot another writer may have moved past.
+    Does nothing for sessions that write anyway.
+    """
+    if _reads_only(session):
+        session.commit()
+        session.info['sqlite_reads_only'] = False
+
+
+def _reads_only(session):
+    reads_only = session.info.get('sqlite_reads_only')
+    if reads_only is not None:
+        return reads_only
+    return has_request_context() and request.method in READ_ONLY_METHODS
+
+
+def configure_sqlite_engine(engine, config):
+    """Tune a SQLite engine on connect and serialize its writers.
+
+    pysqlite normally opens a deferred transaction right before the first
+    INSERT/UPDATE/DELETE. A transaction that read first and then writes can
+    then fail with "database is locked" straight away, without waiting for
+    busy_timeout, because another writer committed since its snapshot.
+    pysqlite's own transaction handling is turned off here, and each
+    transaction is begun right before its first statement:
+
+    - BEGIN DEFERRED for sessions of read-only requests (GET, HEAD,
+      OPTIONS) or marked with mark_reader() (SSE polls, exports), and for
+      plain connections whose first statement reads. They take no lock,
+      keep their WAL snapshot and never hold up writers.
+    - BEGIN with SQLITE_BEGIN_MODE (IMMEDIATE) for everything else. The
+      write lock is taken up front and writers queue on busy_timeout one
+      after another.
+    """
+    pragmas = sqlite_pragmas(config)
+    begin = f"BEGIN {config['SQLITE_BEGIN_MODE'].upper()}"
+    if begin.split()[1] not in BEGIN_MODES:
+        raise ValueError(f"SQLITE_BEGIN_MODE must be one of {', '.join(BEGIN_MODES)}")
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        # Autocommit at the driver level, transactions are started by _on_execute
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def _on_begin(connection):
+        # Sent with the first statement, for plain connections that statement picks the mode
+        connection.info['sqlite_begin'] = True
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _on_execute(connection, cursor, statement, parameters, context, executemany):
+        if connection.info.pop('sqlite_begin', False):
+            reads = connection.info.pop('sqlite_reads', None)
+            if reads is None:
+                # Not a session's, decide by the statement itself
+                reads = bool(_READ_STATEMENT.match(statement))
+            cursor.execute('BEGIN DEFERRED' if reads else begin)
+
+    @event.listens_for(engine, 'commit')
+    @event.listens_for(engine, 'rollback')
+    def _on_end(connection):
+        # connection.info outlives the checkout, a transaction that never ran a statement must not leak its flags
+        connection.info.pop('sqlite_begin', None)
+        connection.info.pop('sqlite_reads', None)
+
+    logger.info(f"SQLite engine mode: {', '.join(f'{name}={value}' for name, value in pragmas)}, "
+                f"{begin} for writes, BEGIN DEFERRED for reads")
+
+
+@event.listens_for(Session, 'after_begin')
+def _choose_begin(session, transaction, connection):
+    if connection.dialect.name == 'sqlite':
+        connection.info['sqlite_reads'] = _reads_only(session)
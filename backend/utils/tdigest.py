@@ -0,0 +1,133 @@
+import math
+import struct
+
+# Serialized form: version, compression, count, min, max, then (mean, weight) per centroid
+_HEADER = struct.Struct('<BHQdd')
+_CENTROID = struct.Struct('<fI')
+_VERSION = 1
+
+
+class TDigest:
+    """Merging t-digest (Dunning & Ertl) for streaming quantiles of positive weights.
+
+    Values are buffered and folded into at most ~compression centroids,
+    which are small in the middle of the distribution and shrink towards
+    singletons at the tails (k1 scale function), so p99 stays accurate.
+    Digests of disjoint data merge into a digest of their union. Memory
+    and quantile time depend on compression, not on how many values were
+    added: about 0.6 * compression centroids of 8 bytes each (float32
+    mean, uint32 weight). tests/test_tdigest.py holds the error bounds.
+    """
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._centroids = []  # [(mean, weight)] sorted by mean
+        self._buffer = []
+        self._buffer_limit = compression * 5
+
+    def add(self, value, weight=1):
+        value = float(value)
+        self._buffer.append((value, weight))
+        self.count += weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if len(self._buffer) >= self._buffer_limit:
+            self._compress()
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        self._buffer.extend(other._centroids)
+        self._buffer.extend(other._buffer)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inverse(self, k):
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(self._centroids + self._buffer)
+        self._buffer = []
+        total = self.count
+        merged = []
+        mean, weight = points[0]
+        weight_before = 0
+        q_limit = self._k_inverse(self._k(0) + 1)
+        for point_mean, point_weight in points[1:]:
+            if (weight_before + weight + point_weight) / total <= q_limit:
+                weight += point_weight
+                mean += (point_mean - mean) * point_weight / weight
+            else:
+                merged.append((mean, weight))
+                weight_before += weight
+                q_limit = self._k_inverse(self._k(weight_before / total) + 1)
+                mean, weight = point_mean, point_weight
+        merged.append((mean, weight))
+        self._centroids = merged
+
+    def quantile(self, q):
+        """Estimated value at quantile q in [0, 1], None while empty"""
+        if not self.count:
+            return None
+        self._compress()
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        centroids = self._centroids
+        if len(centroids) == 1:
+            return min(max(centroids[0][0], self.min), self.max)
+
+        # Each centroid sits at the middle of its weight, min and max anchor the ends.
+        # Ranks are placed like linear interpolation between order statistics
+        # (numpy's default), so a digest of singletons answers exactly that.
+        target = q * (self.count - 1) + 0.5
+        previous_mean, previous_middle = self.min, 0.0
+        cumulative = 0
+        for mean, weight in centroids:
+            middle = cumulative + weight / 2
+            if target < middle:
+                return previous_mean + (mean - previous_mean) * (target - previous_middle) / (middle - previous_middle)
+            previous_mean, previous_middle = mean, middle
+            cumulative += weight
+        if self.count == previous_middle:
+            return self.max
+        return previous_mean + (self.max - previous_mean) * (target - previous_middle) / (self.count - previous_middle)
+
+    @property
+    def centroid_count(self):
+        self._compress()
+        return len(self._centroids)
+
+    def to_bytes(self):
+        self._compress()
+        parts = [_HEADER.pack(_VERSION, self.compression, self.count,
+                              self.min if self.count else 0.0, self.max if self.count else 0.0)]
+        parts.extend(_CENTROID.pack(mean, weight) for mean, weight in self._centroids)
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        version, compression, count, minimum, maximum = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"Unknown t-digest version {version}")
+        digest = cls(compression)
+        if count:
+            digest.count = count
+            digest.min = minimum
+            digest.max = maximum
+            digest._centroids = list(_CENTROID.iter_unpack(data[_HEADER.size:]))
+        return digest
@@ -0,0 +1,233 @@
+from models import db, RevokedToken
+from datetime import datetime, timedelta
+from hashlib import blake2b
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import logging
+import math
+import threading
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings.
+
+    Bit positions come from one 128-bit blake2b digest split into two
+    64-bit hashes (double hashing), so a lookup is one hash call plus k
+    bit tests.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        size = self.size
+        return [(first + index * second) % size for index in range(self.hash_count)]
+
+    def add(self, item):
+        bits = self._bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self._bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def memory_bytes(self):
+        return len(self._bits)
+
+
+class TokenRevocationList:
+    """Per-process mirror of the revoked_tokens table.
+
+    Revoked JTIs are held in a Bloom filter plus an exact set. A token that
+    misses the filter is not revoked, which is the common case and costs a
+    few hash operations. A filter hit is answered from the exact set, or
+    confirmed in the database when the exact set does not have it (false
+    positive). New revocations are pulled incrementally by primary key
+    every few seconds. Auto-increment ids can commit out of order, so the
+    watermark only moves past revocations older than settle_seconds and
+    the newer ones are read again on each refresh. The filter is rebuilt
+    periodically, which drops expired tokens and grows it when it fills up.
+    Additions and the swap to a rebuilt filter share one lock: a bit set
+    concurrently by two threads is never lost, and revocations applied
+    while a rebuild reads the table are carried into the new filter.
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001, refresh_seconds=5, rebuild_seconds=3600, settle_seconds=60):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.settle_seconds = settle_seconds
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._exact = set()
+        self._last_id = 0
+        self._last_refresh = 0.0
+        self._last_rebuild = 0.0
+        self._loaded = False
+        self._refresh_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._added_during_rebuild = None
+        self.db_confirms = 0
+
+    def is_revoked(self, jti):
+        self._maybe_refresh()
+        if jti not in self._bloom:
+            return False
+        if jti in self._exact:
+            return True
+        self.db_confirms += 1
+        revoked = db.session.query(RevokedToken.id).filter_by(jti=jti).first() is not None
+        if revoked:
+            self._exact.add(jti)
+        return revoked
+
+    def revoke(self, jti, token_type, expires_at, user_id=None):
+        """Record a revocation in the current transaction, mirrored locally once it commits"""
+        db.session.add(RevokedToken(
+            jti=jti,
+            token_type=token_type,
+            user_id=user_id,
+            expires_at=expires_at
+        ))
+        db.session.info.setdefault('revoked_jtis', []).append(jti)
+
+    def _add(self, jti):
+        with self._write_lock:
+            if self._added_during_rebuild is not None:
+                self._added_during_rebuild.append(jti)
+            if jti not in self._exact:
+                self._exact.add(jti)
+                self._bloom.add(jti)
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if self._loaded and now - self._last_refresh < self.refresh_seconds:
+            return
+        # One thread refreshes, the others keep using the current snapshot
+        if not self._refresh_lock.acquire(blocking=not self._loaded):
+            return
+        try:
+            now = time.monotonic()
+            if not self._loaded or now - self._last_rebuild >= self.rebuild_seconds or len(self._exact) > self.capacity:
+                self.rebuild()
+            elif now - self._last_refresh >= self.refresh_seconds:
+                self.refresh()
+        except Exception as e:
+            logger.error(f"Error refreshing token revocation list: {str(e)}")
+            self._last_refresh = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def _settled_before(self):
+        return datetime.utcnow() - timedelta(seconds=self.settle_seconds)
+
+    def refresh(self):
+        """Pull revocations added since the last refresh, and again those still settling"""
+        settled = self._settled_before()
+        rows = db.session.query(RevokedToken.id, RevokedToken.jti, RevokedToken.revoked_at).filter(
+            RevokedToken.id > self._last_id
+        ).order_by(RevokedToken.id).all()
+        added = len(self._exact)
+        settling = False
+        for row in rows:
+            self._add(row.jti)
+            settling = settling or row.revoked_at is None or row.revoked_at >= settled
+            if not settling:
+                self._last_id = row.id
+        self._last_refresh = time.monotonic()
+        if len(self._exact) > added:
+            logger.debug(f"Loaded {len(self._exact) - added} new token revocations")
+
+    def rebuild(self):
+        """Reload every unexpired revocation into a fresh filter"""
+        with self._write_lock:
+            self._added_during_rebuild = []
+        try:
+            # Only settled revocations move the watermark, refresh() reads the rest again
+            last_id = db.session.query(db.func.max(RevokedToken.id)).filter(
+                RevokedToken.revoked_at < self._settled_before()
+            ).scalar() or 0
+            rows = db.session.query(RevokedToken.jti).filter(
+                RevokedToken.expires_at > datetime.utcnow()
+            ).all()
+            while len(rows) > self.capacity:
+                self.capacity *= 2
+            bloom = BloomFilter(self.capacity, self.error_rate)
+            exact = set()
+            for row in rows:
+                bloom.add(row.jti)
+                exact.add(row.jti)
+
+            with self._write_lock:
+                # Applied meanwhile, these may have committed after the read above
+                for jti in self._added_during_rebuild:
+                    if jti not in exact:
+                        bloom.add(jti)
+                        exact.add(jti)
+                self._bloom, self._exact, self._last_id = bloom, exact, last_id
+        finally:
+            with self._write_lock:
+                self._added_during_rebuild = None
+        self._last_refresh = self._last_rebuild = time.monotonic()
+        self._loaded = True
+        logger.info(f"Rebuilt token revocation filter with {len(exact)} entries ({bloom.memory_bytes} bytes)")
+
+    def stats(self):
+        return {
+            'entries': len(self._exact),
+            'capacity': self.capacity,
+            'filter_bytes': self._bloom.memory_bytes,
+            'hash_count': self._bloom.hash_count,
+            'db_confirms': self.db_confirms
+        }
+
+
+_revocation_list = None
+_revocation_list_lock = threading.Lock()
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_revocations(session):
+    jtis = session.info.pop('revoked_jtis', None)
+    if jtis and _revocation_list is not None:
+        for jti in jtis:
+            _revocation_list._add(jti)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_revocations(session):
+    session.info.pop('revoked_jtis', None)
+
+
+def get_revocation_list():
+    """Process-wide revocation list built from Config on first use"""
+    global _revocation_list
+    if _revocation_list is None:
+        with _revocation_list_lock:
+            if _revocation_list is None:
+                _revocation_list = TokenRevocationList(
+                    capacity=Config.TOKEN_REVOCATION_CAPACITY,
+                    error_rate=Config.TOKEN_REVOCATION_ERROR_RATE,
+                    refresh_seconds=Config.TOKEN_REVOCATION_REFRESH_SECONDS,
+                    rebuild_seconds=Config.TOKEN_REVOCATION_REBUILD_SECONDS,
+                    settle_seconds=Config.TOKEN_REVOCATION_SETTLE_SECONDS
+                )
+    return _revocation_list
@@ -0,0 +1,162 @@
+from models import db, User, Expense, TransactionFlag
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from utils.shard_router import get_shard_router
+from utils.sharding import use_shard
+import multiprocessing
+import logging
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class TransactionFlagService:
+    """Finds likely duplicate entries and unusually large amounts for every user and keeps them
+    in transaction_flags, replacing each user's flags per run.
+
+    Expenses are read a batch of users at a time into column arrays and analyzed by
+    utils.anomaly_detection, in a process pool when there are several workers. The main
+    process keeps loading batches and writing results while the pool computes.
+    """
+
+    @staticmethod
+    def detection_params():
+        return {
+            'duplicate_window_seconds': Config.DUPLICATE_WINDOW_HOURS * 3600,
+            'duplicate_min_similarity': Config.DUPLICATE_MIN_SIMILARITY,
+            'duplicate_max_lag': Config.DUPLICATE_MAX_LAG,
+            'outlier_threshold': Config.OUTLIER_Z_THRESHOLD,
+            'outlier_min_samples': Config.OUTLIER_MIN_SAMPLES
+        }
+
+    @staticmethod
+    def _user_batches(batch_size):
+        """(shard, user_ids) for every user, at most batch_size users each"""
+        last_id = 0
+        while True:
+            user_ids = [row[0] for row in db.session.query(User.id).filter(
+                User.id > last_id
+            ).order_by(User.id).limit(batch_size).all()]
+            if not user_ids:
+                db.session.commit()
+                return
+            last_id = user_ids[-1]
+            groups = get_shard_router().group_by_shard(user_ids)
+            db.session.commit()
+            yield from groups.items()
+
+    @staticmethod
+    def _load(shard, user_ids):
+        with use_shard(shard):
+            rows = db.session.query(
+                Expense.id, Expense.user_id, Expense.type, Expense.category_id,
+                Expense.amount, Expense.date, Expense.description
+            ).filter(Expense.user_id.in_(user_ids)).all()
+            db.session.commit()
+        from utils.anomaly_detection import build_batch
+        return build_batch(rows)
+
+    @staticmethod
+    def _store(shard, user_ids, batch, result):
+        """Replace the batch users' flags with result, return (duplicates, outliers)"""
+        flagged = [row[0] for row in result['duplicates']] + [row[0] for row in result['outliers']]
+        positions = {}
+        if flagged:
+            import numpy as np
+            sorter = np.argsort(batch['ids'])
+            found = sorter[np.searchsorted(batch['ids'], flagged, sorter=sorter)]
+            positions = dict(zip(flagged, found.tolist()))
+        now = datetime.utcnow()
+
+        def flag(expense_id, **values):
+            position = positions[expense_id]
+            return TransactionFlag(
+                user_id=int(batch['user_ids'][position]), expense_id=expense_id,
+                amount=float(batch['amounts'][position]), created_at=now, **values
+            )
+
+        flags = [
+            flag(expense_id, kind='duplicate', related_expense_id=earlier_id, score=similarity,
+                 detail=f"Same amount {seconds_apart / 3600:.1f}h after expense {earlier_id}")
+            for expense_id, earlier_id, similarity, seconds_apart in result['duplicates']
+        ] + [
+            flag(expense_id, kind='outlier', score=z,
+                 detail=f"{batch['amounts'][positions[expense_id]] / median:.1f}x the category median of {median:.2f}")
+            for expense_id, z, median in result['outliers']
+        ]
+        with use_shard(shard):
+            TransactionFlag.query.filter(TransactionFlag.user_id.in_(user_ids)).delete(synchronize_session=False)
+            db.session.add_all(flags)
+            db.session.commit()
+        return len(result['duplicates']), len(result['outliers'])
+
+    @staticmethod
+    def run_all(workers=None, batch_size=None, progress=None):
+        """Analyze every user's expenses and replace their flags, return counts and timings.
+        progress(users_done, total_users) is called as batches are stored."""
+        workers = Config.ANOMALY_DETECTION_WORKERS if workers is None else workers
+        batch_size = batch_size or Config.ANOMALY_DETECTION_BATCH_USERS
+        # Imported here, numpy (with this module) stays out of processes that never run detection
+        from utils.anomaly_detection import analyze_batch
+        params = TransactionFlagService.detection_params()
+        totals = {'users': 0, 'expenses': 0, 'duplicates': 0, 'outliers': 0}
+        total_users = db.session.query(func.count(User.id)).scalar() if progress else 0
+        started = time.perf_counter()
+
+        def finish(shard, user_ids, batch, result):
+            duplicates, outliers = TransactionFlagService._store(shard, user_ids, batch, result)
+            totals['users'] += len(user_ids)
+            totals['expenses'] += len(batch['ids'])
+            totals['duplicates'] += duplicates
+            totals['outliers'] += outliers
+            if progress:
+                progress(totals['users'], total_users)
+
+        try:
+            if workers <= 1:
+                for shard, user_ids in TransactionFlagService._user_batches(batch_size):
+                    batch = TransactionFlagService._load(shard, user_ids)
+                    finish(shard, user_ids, batch, analyze_batch(batch, params))
+            else:
+                # Spawned, not forked: the caller may be a server process with threads holding locks
+                with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                    in_flight = deque()
+                    for shard, user_ids in TransactionFlagService._user_batches(batch_size):
+                        batch = TransactionFlagService._load(shard, user_ids)
+                        in_flight.append((shard, user_ids, batch, pool.submit(analyze_batch, batch, params)))
+                        # Two batches per worker keep the pool busy while bounding memory
+                        if len(in_flight) >= workers * 2:
+                            shard, user_ids, batch, future = in_flight.popleft()
+                            finish(shard, user_ids, batch, future.result())
+                    while in_flight:
+                        shard, user_ids, batch, future = in_flight.popleft()
+                        finish(shard, user_ids, batch, future.result())
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Error storing transaction flags: {str(e)}")
+            raise
+
+        totals['seconds'] = round(time.perf_counter() - started, 2)
+        logger.info(f"Anomaly detection over {totals['expenses']} expenses of {totals['users']} users: "
+                    f"{totals['duplicates']} duplicates, {totals['outliers']} outliers in {totals['seconds']}s")
+        return totals
+
+    @staticmethod
+    def for_user(user_id, kind=None, limit=None):
+        """The user's flags with their expenses, newest expense first. Flags of expenses deleted
+        or given another amount since the last run are left out."""
+        query = db.session.query(TransactionFlag, Expense).join(
+            Expense, Expense.id == TransactionFlag.expense_id
+        ).filter(
+            TransactionFlag.user_id == user_id,
+            Expense.user_id == user_id,
+            Expense.amount == TransactionFlag.amount
+        )
+        if kind:
+            query = query.filter(TransactionFlag.kind == kind)
+        rows = query.order_by(Expense.date.desc(), TransactionFlag.id).limit(limit or Config.ANALYTICS_MAX_FLAGS).all()
+        return [dict(flag.to_dict(), expense=expense.to_dict()) for flag, expense in rows]
@@ -0,0 +1,100 @@
+from models import db, User
+from collections import namedtuple
+from cachetools import TTLCache
+import logging
+import threading
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class UserSnapshot(namedtuple('UserSnapshot', ['id', 'name', 'email', 'is_verified', 'oauth_provider', 'created_at'])):
+    """Immutable copy of the user fields routes need, detached from any session"""
+    __slots__ = ()
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(
+            user.id,
+            user.name,
+            user.email,
+            user.is_verified,
+            user.oauth_provider,
+            user.created_at.isoformat() if user.created_at else None
+        )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'email': self.email,
+            'is_verified': self.is_verified,
+            'oauth_provider': self.oauth_provider,
+            'created_at': self.created_at
+        }
+
+
+class UserCache:
+    """Per-process LRU + TTL cache of JWT identity -> UserSnapshot.
+
+    Entries are dropped explicitly when this process changes the user and
+    expire after the TTL otherwise, which bounds how long another worker's
+    change can go unseen.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        """Snapshot for the identity, loaded from the database on a miss. None if no such user."""
+        key = int(user_id)
+        with self._lock:
+            snapshot = self._cache.get(key)
+            if snapshot is not None:
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+
+        user = db.session.get(User, key)
+        if user is None:
+            return None
+        snapshot = UserSnapshot.from_user(user)
+        with self._lock:
+            self._cache[key] = snapshot
+        return snapshot
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._cache.pop(int(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._cache),
+                'max_size': self._cache.maxsize
+            }
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    """Process-wide user cache built from Config on first use"""
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                _user_cache = UserCache(maxsize=Config.USER_CACHE_MAX_SIZE, ttl=Config.USER_CACHE_TTL_SECONDS)
+    return _user_cache
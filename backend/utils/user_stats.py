@@ -0,0 +1,259 @@
+from models import db, User, Expense, Category, UserStats
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import case, or_, select, func
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from utils.shard_router import get_shard_router
+from utils.sharding import use_shard
+from utils.sqlite_engine import begin_writes
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Fields of an expense that contribute to the counters, captured before an update
+ExpenseSnapshot = namedtuple('ExpenseSnapshot', ['type', 'amount', 'date', 'category_id'])
+
+_AMOUNT_TOLERANCE = 0.005
+
+
+def _empty_stats():
+    return {
+        'expense_count': 0,
+        'income_count': 0,
+        'category_count': 0,
+        'total_expense': 0.0,
+        'total_income': 0.0,
+        'first_transaction_at': None,
+        'last_transaction_at': None
+    }
+
+
+def _deltas(expense_type, amount, sign):
+    if expense_type == 'income':
+        return {'income_count': sign, 'total_income': sign * amount}
+    return {'expense_count': sign, 'total_expense': sign * amount}
+
+
+class UserStatsService:
+    """Keeps the user_stats row of each user in step with their expenses and categories.
+
+    Write paths call in here inside their own transaction, after adding,
+    changing or deleting the row, so the counters commit or roll back with
+    the change itself. Counters are updated with atomic column increments,
+    and the first/last transaction dates are only recomputed (one indexed
+    MIN/MAX) when the boundary row itself moves or goes away. reconcile()
+    recomputes everything from the source tables to repair any drift, e.g.
+    after bulk loads that bypass the application.
+    """
+
+    @staticmethod
+    def snapshot(expense):
+        return ExpenseSnapshot(expense.type, expense.amount, expense.date, expense.category_id)
+
+    @staticmethod
+    def expense_added(expense):
+        db.session.flush()
+        UserStatsService._apply(int(expense.user_id), _deltas(expense.type, expense.amount, 1), expense.date)
+
+    @staticmethod
+    def expense_changed(before, expense):
+        db.session.flush()
+        user_id = int(expense.user_id)
+        deltas = _deltas(before.type, before.amount, -1)
+        for column, value in _deltas(expense.type, expense.amount, 1).items():
+            deltas[column] = deltas.get(column, 0) + value
+        UserStatsService._apply(user_id, deltas, expense.date)
+        if before.date != expense.date:
+            UserStatsService._refresh_dates(user_id, before.date)
+
+    @staticmethod
+    def expense_removed(expense):
+        db.session.flush()
+        user_id = int(expense.user_id)
+        UserStatsService._apply(user_id, _deltas(expense.type, expense.amount, -1))
+        UserStatsService._refresh_dates(user_id, expense.date)
+
+    @staticmethod
+    def category_added(user_id):
+        db.session.flush()
+        UserStatsService._apply(int(user_id), {'category_count': 1})
+
+    @staticmethod
+    def get(user_id):
+        """The user's stats row, created from the source tables on first use. None if the user is gone."""
+        user_id = int(user_id)
+        stats = db.session.get(UserStats, user_id)
+        if stats is None:
+            begin_writes(db.session)
+            stats = UserStatsService._create(user_id)
+            db.session.commit()
+            if stats is None:
+                # Created concurrently by a write path, or the user no longer exists
+                stats = db.session.get(UserStats, user_id)
+        return stats
+
+    @staticmethod
+    def _apply(user_id, deltas, date=None):
+        table = UserStats.__table__
+        values = {column: table.c[column] + value for column, value in deltas.items() if value}
+        if date is not None:
+            first, last = table.c.first_transaction_at, table.c.last_transaction_at
+            values['first_transaction_at'] = case((or_(first.is_(None), first > date), date), else_=first)
+            values['last_transaction_at'] = case((or_(last.is_(None), last < date), date), else_=last)
+        values['updated_at'] = datetime.utcnow()
+        statement = table.update().where(table.c.user_id == user_id).values(**values)
+
+        if db.session.execute(statement).rowcount:
+            return
+        # No row yet: build it from the source tables, which already include this change
+        if UserStatsService._create(user_id) is None:
+            db.session.execute(statement)
+
+    @staticmethod
+    def _create(user_id):
+        values = UserStatsService._compute([user_id]).get(user_id, _empty_stats())
+        stats = UserStats(user_id=user_id, **values)
+        try:
+            with db.session.begin_nested():
+                db.session.add(stats)
+            return stats
+        except IntegrityError:
+            return None
+
+    @staticmethod
+    def _refresh_dates(user_id, old_date):
+        """Recompute first/last transaction dates if old_date was one of them"""
+        if old_date is None:
+            return
+        table = UserStats.__table__
+        db.session.execute(table.update().where(
+            table.c.user_id == user_id,
+            or_(table.c.first_transaction_at == old_date, table.c.last_transaction_at == old_date)
+        ).values(
+            first_transaction_at=select(func.min(Expense.date)).where(Expense.user_id == user_id).scalar_subquery(),
+            last_transaction_at=select(func.max(Expense.date)).where(Expense.user_id == user_id).scalar_subquery()
+        ))
+
+    @staticmethod
+    def _compute(user_ids):
+        """Stats recomputed from the expenses and categories tables, {user_id: values}"""
+        results = {}
+        rows = db.session.query(
+            Expense.user_id,
+            Expense.type,
+            func.count(Expense.id),
+            func.coalesce(func.sum(Expense.amount), 0.0),
+            func.min(Expense.date),
+            func.max(Expense.date)
+        ).filter(Expense.user_id.in_(user_ids)).group_by(Expense.user_id, Expense.type).all()
+        for user_id, expense_type, count, total, first, last in rows:
+            values = results.setdefault(user_id, _empty_stats())
+            if expense_type == 'income':
+                values['income_count'] += count
+                values['total_income'] += round(total, 2)
+            else:
+                values['expense_count'] += count
+                values['total_expense'] += round(total, 2)
+            if first is not None and (values['first_transaction_at'] is None or first < values['first_transaction_at']):
+                values['first_transaction_at'] = first
+            if last is not None and (values['last_transaction_at'] is None or last > values['last_transaction_at']):
+                values['last_transaction_at'] = last
+
+        rows = db.session.query(Category.user_id, func.count(Category.id)).filter(
+            Category.user_id.in_(user_ids)
+        ).group_by(Category.user_id).all()
+        for user_id, count in rows:
+            results.setdefault(user_id, _empty_stats())['category_count'] = count
+        return results
+
+    @staticmethod
+    def _differs(stats, values):
+        for column, value in values.items():
+            current = getattr(stats, column)
+            if column.startswith('total_'):
+                if abs((current or 0.0) - value) > _AMOUNT_TOLERANCE:
+                    return True
+            elif current != value:
+                return True
+        return False
+
+    @staticmethod
+    def recompute(user_id):
+        """Recompute one user's stats from the source tables and commit, True if the row was corrected"""
+        user_id = int(user_id)
+        # Lock the row before reading the source tables, like reconcile
+        db.session.commit()
+        stats = UserStats.query.filter_by(user_id=user_id).with_for_update().first()
+        values = UserStatsService._compute([user_id]).get(user_id, _empty_stats())
+        corrected = stats is None or UserStatsService._differs(stats, values)
+        if stats is None:
+            db.session.add(UserStats(user_id=user_id, **values))
+        else:
+            for column, value in values.items():
+                setattr(stats, column, value)
+        db.session.commit()
+        return corrected
+
+    @staticmethod
+    def reconcile(batch_size=500, progress=None):
+        """Recompute every user's stats from the source tables, return the number of rows corrected.
+        progress(checked, total) is called after each batch."""
+        checked = corrected = 0
+        last_id = 0
+        total = db.session.query(func.count(User.id)).scalar() if progress else 0
+        while True:
+            start_id = last_id
+            try:
+                user_ids = [row[0] for row in db.session.query(User.id).filter(
+                    User.id > last_id
+                ).order_by(User.id).limit(batch_size).all()]
+                if not user_ids:
+                    break
+                last_id = user_ids[-1]
+                db.session.commit()
+                for shard, shard_user_ids in get_shard_router().group_by_shard(user_ids).items():
+                    with use_shard(shard):
+                        # Fresh transaction, then lock the stats rows before reading the source
+                        # tables, so writers in flight finish first and later ones wait for us
+                        db.session.commit()
+                        existing = {stats.user_id: stats for stats in UserStats.query.filter(
+                            UserStats.user_id.in_(shard_user_ids)
+                        ).with_for_update().all()}
+                        computed = UserStatsService._compute(shard_user_ids)
+
+                        for user_id in shard_user_ids:
+                            values = computed.get(user_id, _empty_stats())
+                            stats = existing.get(user_id)
+                            if stats is None:
+                                db.session.add(UserStats(user_id=user_id, **values))
+                                corrected += 1
+                            elif UserStatsService._differs(stats, values):
+                                for column, value in values.items():
+                                    setattr(stats, column, value)
+                                corrected += 1
+                        db.session.commit()
+                checked += len(user_ids)
+                if progress:
+                    progress(checked, total)
+            except IntegrityError:
+                # A write path created one of the rows meanwhile, the next run covers this batch
+                db.session.rollback()
+                logger.warning(f"User stats batch after user {start_id} changed during reconcile, skipped")
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                logger.error(f"Error reconciling user stats: {str(e)}")
+                return corrected
+
+        # Home shard only, other shards drop stats of deleted users through the tombstones
+        try:
+            removed = UserStats.query.filter(
+                ~UserStats.user_id.in_(db.session.query(User.id))
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Error removing orphaned user stats: {str(e)}")
+            removed = 0
+
+        logger.info(f"Reconciled user stats: {corrected} of {checked} rows corrected, {removed} orphaned rows removed")
+        return corrected
@@ -58,6 +58,13 @@ class AuthService {
     });
   }
 
+  async logout() {
+    return request('/auth/logout', {
+      method: 'POST',
+      body: JSON.stringify({ refresh_token: getRefreshToken() }),
+    });
+  }
+
   async getProfile() {
     return request('/auth/profile');
   }
@@ -54,6 +54,11 @@ class ExpenseService {
     });
   }
 
+  // Recent transactions, categories, month totals and stats in one request
+  async getDashboard(recent = 5) {
+    return request(`/dashboard?recent=${recent}`);
+  }
+
   async getCategories() {
     return request('/expenses/categories');
   }
@@ -163,6 +163,10 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    // Revoke the tokens server-side, local logout does not wait for it
+    if (ApiService.getToken()) {
+      ApiService.logout().catch((error) => console.error("Logout error:", error.message));
+    }
     ApiService.removeToken();
     setUser(null);
     setIsAuthenticated(false);
@@ -5,24 +5,24 @@ import ExpenseService from '../api/expenseApi';
 const DashboardOverview = () => {
   const [expenses, setExpenses] = useState([]);
   const [totalExpenses, setTotalExpenses] = useState(0);
+  const [expenseCount, setExpenseCount] = useState(0);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
 
   useEffect(() => {
-    const fetchExpenses = async () => {
+    const fetchOverview = async () => {
       try {
-        const response = await ExpenseService.getExpenses();
-        const expensesData = response.expenses || [];
-        setExpenses(expensesData);
-        const total = expensesData.reduce((sum, exp) => sum + exp.amount, 0);
-        setTotalExpenses(total);
+        const response = await ExpenseService.getDashboard();
+        setExpenses(response.recent_transactions || []);
+        setTotalExpenses(response.stats?.total_expense || 0);
+        setExpenseCount(response.stats?.expense_count || 0);
       } catch (err) {
         setError(err.message || 'Failed to load overview');
       } finally {
         setLoading(false);
       }
     };
-    fetchExpenses();
+    fetchOverview();
   }, []);
 
   if (loading) return <div className="text-white">Loading overview...</div>;
@@ -42,14 +42,14 @@ const DashboardOverview = () => {
         
         <div className="bg-white/10 backdrop-blur-sm rounded-xl p-6 border border-white/10">
           <h2 className="text-xl font-semibold text-white mb-4">Number of Expenses</h2>
-          <p className="text-3xl font-bold text-white">{expenses.length}</p>
+          <p className="text-3xl font-bold text-white">{expenseCount}</p>
         </div>
         
         <div className="bg-white/10 backdrop-blur-sm rounded-xl p-6 border border-white/10">
           <h2 className="text-xl font-semibold text-white mb-4">Average Expense</h2>
           <p className="text-3xl font-bold text-white">
-            {expenses.length > 0 
-              ? `₹${(totalExpenses / expenses.length).toLocaleString('en-IN', { maximumFractionDigits: 2 })}`
+            {expenseCount > 0 
+              ? `₹${(totalExpenses / expenseCount).toLocaleString('en-IN', { maximumFractionDigits: 2 })}`
               : '₹0.00'
             }
           </p>
@@ -63,7 +63,7 @@ const DashboardOverview = () => {
           <p className="text-gray-400">No expenses yet. Add your first expense to get started.</p>
         ) : (
           <div className="space-y-3">
-            {expenses.slice(0, 5).map((expense) => (
+            {expenses.map((expense) => (
               <div key={expense.id} className="flex justify-between items-center p-3 bg-white/5 rounded-lg">
                 <div>
                   <p className="text-white font-medium">{expense.description || 'No description'}</p>
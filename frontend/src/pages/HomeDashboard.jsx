@@ -1,8 +1,25 @@
-import React from 'react';
+import React, { useState, useEffect } from 'react';
 import { useAuth } from '../context/AuthContext';
+import ExpenseService from '../api/expenseApi';
 
 const HomeDashboard = () => {
   const { user } = useAuth();
+  const [dashboard, setDashboard] = useState(null);
+  const [error, setError] = useState('');
+
+  useEffect(() => {
+    const fetchDashboard = async () => {
+      try {
+        setDashboard(await ExpenseService.getDashboard());
+      } catch (err) {
+        setError(err.message || 'Failed to load dashboard');
+      }
+    };
+    fetchDashboard();
+  }, []);
+
+  const totalExpenses = dashboard?.stats?.total_expense || 0;
+  const recentTransactions = dashboard?.recent_transactions || [];
 
   return (
     <div>
@@ -12,6 +29,7 @@ const HomeDashboard = () => {
           Welcome back, {user.name}! 👋
         </h1>
         <p className="text-gray-300">Here's your expense tracking dashboard</p>
+        {error && <p className="text-red-400 mt-2">{error}</p>}
       </div>
 
       {/* Quick Stats */}
@@ -20,7 +38,9 @@ const HomeDashboard = () => {
           <div className="flex items-center justify-between">
             <div>
               <p className="text-gray-400 text-sm">Total Expenses</p>
-              <p className="text-2xl font-bold text-white">$0.00</p>
+              <p className="text-2xl font-bold text-white">
+                ₹{totalExpenses.toLocaleString('en-IN', { maximumFractionDigits: 2 })}
+              </p>
             </div>
             <div className="w-12 h-12 bg-red-500/20 rounded-lg flex items-center justify-center">
               <svg className="w-6 h-6 text-red-400" fill="none" stroke="currentColor" viewBox="0 0 24 24">
@@ -86,24 +106,42 @@ const HomeDashboard = () => {
         </div>
       </div>
 
-      {/* Recent Activity Placeholder */}
+      {/* Recent Activity */}
       <div className="bg-white/10 backdrop-blur-sm rounded-xl p-6 border border-white/10">
         <h2 className="text-xl font-semibold text-white mb-4">Recent Activity</h2>
-        <div className="text-center py-12">
-          <svg className="mx-auto h-12 w-12 text-gray-400 mb-4" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-            <path
-              strokeLinecap="round"
-              strokeLinejoin="round"
-              strokeWidth={2}
-              d="M9 5H7a2 2 0 00-2 2v10a2 2 0 002 2h8a2 2 0 002-2V7a2 2 0 00-2-2h-2M9 5a2 2 0 002 2h2a2 2 0 002-2M9 5a2 2 0 012-2h2a2 2 0 012 2"
-            />
-          </svg>
-          <h3 className="text-lg font-medium text-white mb-2">No expenses yet</h3>
-          <p className="text-gray-400 mb-4">Start tracking your expenses to see them here</p>
-          <button className="bg-gradient-to-r from-purple-500 to-pink-500 text-white px-6 py-2 rounded-lg font-medium hover:from-purple-600 hover:to-pink-600 transition-all">
-            Add Your First Expense
-          </button>
-        </div>
+        {recentTransactions.length > 0 ? (
+          <div className="space-y-3">
+            {recentTransactions.map((expense) => (
+              <div key={expense.id} className="flex justify-between items-center p-3 bg-white/5 rounded-lg">
+                <div>
+                  <p className="text-white font-medium">{expense.description || 'No description'}</p>
+                  <p className="text-gray-400 text-sm">
+                    {new Date(expense.date).toLocaleDateString()}
+                  </p>
+                </div>
+                <p className={`font-semibold ${expense.type === 'income' ? 'text-green-400' : 'text-white'}`}>
+                  ₹{expense.amount.toLocaleString('en-IN', { maximumFractionDigits: 2 })}
+                </p>
+              </div>
+            ))}
+          </div>
+        ) : (
+          <div className="text-center py-12">
+            <svg className="mx-auto h-12 w-12 text-gray-400 mb-4" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+              <path
+                strokeLinecap="round"
+                strokeLinejoin="round"
+                strokeWidth={2}
+                d="M9 5H7a2 2 0 00-2 2v10a2 2 0 002 2h8a2 2 0 002-2V7a2 2 0 00-2-2h-2M9 5a2 2 0 002 2h2a2 2 0 002-2M9 5a2 2 0 012-2h2a2 2 0 012 2"
+              />
+            </svg>
+            <h3 className="text-lg font-medium text-white mb-2">No expenses yet</h3>
+            <p className="text-gray-400 mb-4">Start tracking your expenses to see them here</p>
+            <button className="bg-gradient-to-r from-purple-500 to-pink-500 text-white px-6 py-2 rounded-lg font-medium hover:from-purple-600 hover:to-pink-600 transition-all">
+              Add Your First Expense
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );